@@ -1,8 +1,14 @@
-
 from django.contrib import admin
 from django.contrib.auth.models import User
+from django.db.models import Value
+from django.db.models.functions import Concat
+
+from .admin_tools import OptimizedAdmin, exists_filter, related_count
+from .models import Member,Instructor,Category,Course,Enrollment,Preference,Task
 
-from .models import Member,Instructor,Category,Course,Enrollment,Preference
+# Changelists join what their columns read and count big tables from
+# estimates, see admin_tools.py. Foreign keys to members and courses use
+# autocomplete widgets rather than a <select> of every row.
 
 
 class MemberInline(admin.StackedInline):
@@ -14,38 +20,97 @@ class MemberInline(admin.StackedInline):
 class UserAdmin(admin.ModelAdmin):
     inlines = [MemberInline]
     list_display=['first_name', 'last_name','email']
+    search_fields = ['^username', '=email']
+
 
+class MemberAdmin(OptimizedAdmin):
+    list_display = ["get_username", "get_email", "is_instructor"]
+    search_fields = ["^user__username", "=user__email"]
+    autocomplete_fields = ["user"]
 
-class MemberAdmin(admin.ModelAdmin):
-    list_display = ["get_username", "get_email"]
+    @admin.display(description="Username", ordering="user__username")
     def get_username(self, obj):
         return obj.user.username
+
+    @admin.display(description="Email", ordering="user__email")
     def get_email(self,obj):
         return obj.user.email
-    get_email.short_description = "Email"
-    
-class InstructorAdmin(admin.ModelAdmin):
+
+
+class InstructorAdmin(OptimizedAdmin):
     list_display=["get_teacher_name","rate_per_hour"]
+    search_fields = ["^member__user__username", "^member__user__first_name", "^member__user__last_name"]
+    autocomplete_fields = ["member"]
+    # __str__, shown in each row's checkbox label
+    list_select_related = ["member__user"]
+    annotations = {
+        "teacher_name": Concat("member__user__first_name", Value(" "), "member__user__last_name"),
+    }
     fieldsets=[
         ("Instructor Details", {"fields": ["member", "bio", "experience", "rate_per_hour"]}),
         ("Instructor Skills", {"classes":["collapse"], "fields": ["skills"]})
     ]
+
+    @admin.display(description="Teacher Name", ordering="teacher_name")
     def get_teacher_name(self,obj):
-        return obj.member.user.first_name + " " + obj.member.user.last_name
+        return obj.teacher_name
+
+    @admin.display(description="Skills")
     def get_skills(self, obj):
         return list(obj.skills.values())
-    
-    get_teacher_name.short_description = "Teacher Name"
-    get_skills.short_description = "Skills"
-    
-class PreferenceAdmin(admin.ModelAdmin):
-    list_filter = ["category"]   
+
+
+class CategoryAdmin(OptimizedAdmin):
+    list_display = ["name", "course_count"]
+    search_fields = ["^name"]
+
+
+class CourseAdmin(OptimizedAdmin):
+    list_display = ["name", "price", "duration", "enrollment_count", "capacity", "created_at"]
+    search_fields = ["^name"]
+    autocomplete_fields = ["category", "instructors"]
+
+
+class EnrollmentAdmin(OptimizedAdmin):
+    list_display = ["get_member", "course", "enrollment_date"]
+    autocomplete_fields = ["member", "course"]
+
+    @admin.display(description="Member", ordering="member__user__username")
+    def get_member(self, obj):
+        return obj.member.user.username
+
+
+class PreferenceAdmin(OptimizedAdmin):
+    list_display = ["get_member", "get_categories", "category_total"]
+    list_filter = [exists_filter(Preference, "category")]
+    list_prefetch_related = ["category"]
+    autocomplete_fields = ["member", "category"]
+    annotations = {"category_total": related_count(Preference, "category")}
+
+    @admin.display(description="Member", ordering="member__user__username")
+    def get_member(self, obj):
+        return obj.member.user.username
+
+    @admin.display(description="Categories")
+    def get_categories(self, obj):
+        return ", ".join(category.name for category in obj.category.all())
+
+    @admin.display(description="Category count", ordering="category_total")
+    def category_total(self, obj):
+        return obj.category_total
+
+
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ["name", "status", "attempts", "run_at", "created_at"]
+    list_filter = ["status", "name"]
+    readonly_fields = ["last_error", "locked_by", "locked_at"]
 
 admin.site.register(Member,MemberAdmin)
 admin.site.register(Instructor,InstructorAdmin)
-admin.site.register(Category)
-admin.site.register(Course)
-admin.site.register(Enrollment)
+admin.site.register(Category, CategoryAdmin)
+admin.site.register(Course, CourseAdmin)
+admin.site.register(Enrollment, EnrollmentAdmin)
 admin.site.register(Preference, PreferenceAdmin)
+admin.site.register(Task, TaskAdmin)
 admin.site.unregister(User)
-admin.site.register(User, UserAdmin)
\ No newline at end of file
+admin.site.register(User, UserAdmin)
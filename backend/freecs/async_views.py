@@ -0,0 +1,163 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+
+from . import replicas
+from .authentication import ClaimsJWTAuthentication, member_claims
+from .compiled import serialize
+from .facets import COURSE_SORT_KEYS, ORDERING_ALIASES, CourseFilter
+from .models import Category, Course
+from .pagination import KeysetPagination, RankedPagination
+from .query_plan import optimize_queryset
+from .recommendations import arecommended_course_ids
+from .rendering import FastJSONRenderer
+from .search import asearch_course_ids
+from .serializers import CategorySerializer, CourseSerializer, PreferenceCreateSerializer, UserProfileSerializer
+from .snapshot import get_snapshot
+
+# Async-native versions of the catalogue, search, profile and preference
+# endpoints for ASGI deployments, mounted under /async/. DRF's APIView only
+# runs sync handlers, so these are plain Django views that use the async ORM
+# (aget, async iteration) and render with FastJSONRenderer. Querysets are
+# planned with optimize_queryset, so the compiled serializers touch no
+# database and run on the event loop. The course list is served from the
+# catalogue snapshot like CourseView, filters and facets included; only
+# fetching the snapshot, which may rebuild it, runs in a thread. Writes still
+# go through the sync serializer and signal handlers in a thread.
+
+
+class AsyncAPIView(View):
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # token-authenticated API, same as the DRF views
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            return self.json({'detail': exc.detail}, status=exc.status_code)
+
+    def drf_request(self, request):
+        return Request(request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES])
+
+    def json(self, data, status=status.HTTP_200_OK):
+        body = FastJSONRenderer().render(data, renderer_context={'request': self.request})
+        return HttpResponse(body, status=status, content_type='application/json')
+
+    def paginated(self, paginator, data):
+        return self.json(paginator.get_paginated_response(data).data)
+
+    async def authenticate(self, request):
+        # principal for a valid, unrevoked access token, or None
+        auth = ClaimsJWTAuthentication()
+        header = auth.get_header(request)
+        raw_token = auth.get_raw_token(header) if header else None
+        if raw_token is None:
+            return None
+        try:
+            token = auth.get_validated_token(raw_token)
+            # the version check reads the cache, and the database on a miss
+            return await sync_to_async(auth.get_user)(token)
+        except (InvalidToken, TokenError, AuthenticationFailed):
+            return None
+
+    def unauthorized(self):
+        return self.json({'detail': 'Authentication credentials were not provided or are invalid.'},
+                         status=status.HTTP_401_UNAUTHORIZED)
+
+
+async def aranked_courses(course_ids):
+    queryset = optimize_queryset(Course.objects.filter(id__in=course_ids), CourseSerializer)
+    by_id = {course.id: course async for course in queryset}
+    return [by_id[course_id] for course_id in course_ids if course_id in by_id]
+
+
+class AsyncCategoryView(AsyncAPIView):
+    async def get(self, request, *args, **kwargs):
+        paginator = KeysetPagination(sort_keys=['name', 'course_count'])
+        page = await paginator.apaginate_queryset(Category.objects.all(), self.drf_request(request))
+        return self.paginated(paginator, serialize(CategorySerializer, page))
+
+
+class AsyncCourseView(AsyncAPIView):
+    async def get(self, request, *args, **kwargs):
+        # same query parameters as CourseView
+        drf_request = self.drf_request(request)
+        course_filter = CourseFilter.from_request(drf_request)
+        snapshot = await sync_to_async(get_snapshot)(fresh=replicas.wrote_recently(request))
+        masks = course_filter.masks(snapshot.courses)
+        paginator = KeysetPagination(sort_keys=COURSE_SORT_KEYS, aliases=ORDERING_ALIASES)
+        page = paginator.paginate_sorted(course_filter.select(snapshot.courses, masks), drf_request)
+        data = paginator.get_paginated_response(snapshot.course_payloads(page)).data
+        data['facets'] = course_filter.facets(snapshot, masks)
+        return self.json(data)
+
+
+class AsyncPreferredCoursesView(AsyncAPIView):
+    async def get(self, request, member_id):
+        paginator = RankedPagination()
+
+        async def fetch(offset, limit):
+            return await arecommended_course_ids(member_id, offset=offset, limit=limit)
+
+        course_ids = await paginator.apaginate_ranked(fetch, self.drf_request(request))
+        courses = await aranked_courses(course_ids)
+        return self.paginated(paginator, serialize(CourseSerializer, courses))
+
+
+class AsyncSearchView(AsyncAPIView):
+    async def get(self, request):
+        search_text = request.GET.get('q', '').strip()
+        if not search_text:
+            return self.json({"error": "Query parameter 'q' is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = RankedPagination()
+
+        async def fetch(offset, limit):
+            return await asearch_course_ids(search_text, offset=offset, limit=limit)
+
+        course_ids = await paginator.apaginate_ranked(fetch, self.drf_request(request))
+        courses = await aranked_courses(course_ids)
+        return self.paginated(paginator, serialize(CourseSerializer, courses))
+
+
+class AsyncUserProfileView(AsyncAPIView):
+    async def get(self, request):
+        user = await self.authenticate(request)
+        if user is None:
+            return self.unauthorized()
+        # the profile fields aren't claims, so this loads the user row
+        return self.json(await sync_to_async(lambda: UserProfileSerializer(user).data)())
+
+
+class AsyncPreferenceCreateView(AsyncAPIView):
+    async def post(self, request):
+        user = await self.authenticate(request)
+        if user is None:
+            return self.unauthorized()
+        member_id, _, _ = member_claims(user)
+        if member_id is None:
+            return self.json({"error": "User must be a member to create preferences."},
+                             status=status.HTTP_400_BAD_REQUEST)
+
+        data = self.drf_request(request).data.copy()
+        data['member'] = member_id
+        created, payload = await sync_to_async(self.create)(data)
+        if created:
+            return self.json(payload, status=status.HTTP_201_CREATED)
+        return self.json(payload, status=status.HTTP_400_BAD_REQUEST)
+
+    def create(self, data):
+        # validation looks categories up and saving fires the sync signal handlers
+        serializer = PreferenceCreateSerializer(data=data)
+        if serializer.is_valid():
+            serializer.save()
+            return True, serializer.data
+        return False, serializer.errors
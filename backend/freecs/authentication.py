@@ -0,0 +1,102 @@
+import time
+
+from django.contrib.auth.models import User
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+from .models import Member
+from .token_versions import VERSION_CLAIM, current_token_version, token_version
+
+# JWT authentication that trusts the token for who the caller is.
+#
+# Tokens from get_tokens_for_user carry the member id, instructor id and
+# is_instructor flag, plus a token version derived from the password hash.
+# ClaimsJWTAuthentication checks that version against a cached copy and
+# returns a TokenPrincipal built from the claims, so a view that only needs
+# the member or instructor id runs without loading User, Member or
+# Instructor. Touching any other user attribute loads the row once.
+#
+# Changing the password (or deactivating the user) changes the version, and
+# the User post_save handler in signals.py updates the cached copy, so every
+# token issued before is rejected. The version cache lives in
+# token_versions.py, which signals.py can import without loading SimpleJWT.
+#
+# Access tokens issued before token versions were deployed carry no version.
+# They are checked against the User row the way SimpleJWT does, active users
+# only, and run out with ACCESS_TOKEN_LIFETIME, so nobody is logged out by
+# the deploy. An unversioned token issued after this process started is
+# rejected.
+
+_versions_since = time.time()
+
+
+def token_claims(user):
+    member = Member.objects.filter(user_id=user.pk).values_list('id', 'instructor__id', 'is_instructor').first()
+    member_id, instructor_id, is_instructor = member or (None, None, False)
+    return {
+        'member_id': member_id,
+        'instructor_id': instructor_id,
+        'is_instructor': bool(is_instructor),
+        VERSION_CLAIM: token_version(user.password),
+    }
+
+
+class TokenPrincipal:
+    # request.user for token-authenticated requests; unknown attributes come from the User row
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True  # checked through the token version
+
+    def __init__(self, token):
+        self.token = token
+        self.id = self.pk = token[jwt_settings.USER_ID_CLAIM]
+        self.member_id = token.get('member_id')
+        self.instructor_id = token.get('instructor_id')
+        self.is_instructor = token.get('is_instructor', False)
+
+    @cached_property
+    def user(self):
+        return User.objects.get(pk=self.pk)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.user, name)
+
+    def __eq__(self, other):
+        return isinstance(other, (TokenPrincipal, User)) and self.pk == other.pk
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def __str__(self):
+        return f'TokenPrincipal {self.pk}'
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[jwt_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+        version = validated_token.get(VERSION_CLAIM)
+        if not version and self._issued_at(validated_token) < _versions_since:
+            return super().get_user(validated_token)
+        if not version or version != current_token_version(user_id):
+            raise AuthenticationFailed('Token has been revoked.', code='token_revoked')
+        return TokenPrincipal(validated_token)
+
+    def _issued_at(self, token):
+        if 'iat' in token:
+            return token['iat']
+        return token['exp'] - jwt_settings.ACCESS_TOKEN_LIFETIME.total_seconds()
+
+
+def member_claims(user):
+    # (member_id, instructor_id, is_instructor) without a query for token principals
+    if isinstance(user, TokenPrincipal):
+        return user.member_id, user.instructor_id, user.is_instructor
+    member = Member.objects.filter(user_id=user.pk).values_list('id', 'instructor__id', 'is_instructor').first()
+    return member or (None, None, False)
@@ -0,0 +1,48 @@
+import time
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+from ... import instrumentation
+from ...pooling import pool_settings, psycopg_pool_options, register_native_pool
+
+try:
+    from psycopg_pool import PoolTimeout
+except ImportError:
+    PoolTimeout = None
+
+# PostgreSQL with Django's connection pool, sized from freecs.pooling's
+# settings, see there. An explicit OPTIONS['pool'] is used as is, and
+# 'pool': False turns pooling off. Django only pools psycopg 3 connections;
+# with psycopg2 every request connects.
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, settings_dict, alias=DEFAULT_DB_ALIAS):
+        config = pool_settings(alias)
+        options = {}
+        if is_psycopg3:
+            options['pool'] = psycopg_pool_options(alias)
+            if config['PREPARE']:
+                options.update(server_side_binding=True, prepare_threshold=config['PREPARE_THRESHOLD'])
+        # explicit OPTIONS win
+        super().__init__({**settings_dict, 'OPTIONS': {**options, **settings_dict.get('OPTIONS', {})}}, alias)
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            connection = super().get_new_connection(conn_params)
+        else:
+            register_native_pool(self.alias, pool)
+            start = time.perf_counter()
+            try:
+                connection = super().get_new_connection(conn_params)
+            except PoolTimeout:
+                instrumentation.pool_timeouts.inc((self.alias,))
+                raise
+            finally:
+                instrumentation.pool_wait_seconds.observe((self.alias,), time.perf_counter() - start)
+        if is_psycopg3:
+            connection.prepared_max = pool_settings(self.alias)['PREPARED_MAX']
+        return connection
@@ -0,0 +1,13 @@
+from django.db.backends.sqlite3 import base
+
+from ...pooling import PooledDatabaseWrapperMixin, pool_settings
+
+# SQLite with connections from freecs.pooling, see there for settings. An
+# in-memory database is never closed by Django, so it isn't pooled either.
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params.setdefault('cached_statements', pool_settings(self.alias)['STATEMENT_CACHE'])
+        return params
@@ -0,0 +1,23 @@
+from importlib import import_module
+
+# name -> module for `manage.py benchmark <name>`. Each module exposes
+# add_arguments(parser) and run(command, **options) returning JSON-able results.
+SUITES = {
+    'auth': 'freecs.benchmarks.auth',
+    'endpoints': 'freecs.benchmarks.endpoints',
+    'serializers': 'freecs.benchmarks.serializers',
+    'pagination': 'freecs.benchmarks.pagination',
+    'search': 'freecs.benchmarks.search',
+    'fragments': 'freecs.benchmarks.fragments',
+    'facets': 'freecs.benchmarks.facets',
+    'import': 'freecs.benchmarks.imports',
+    'importtime': 'freecs.benchmarks.importtime',
+    'snapshot': 'freecs.benchmarks.snapshot',
+    'rendering': 'freecs.benchmarks.rendering',
+    'skills': 'freecs.benchmarks.skills',
+    'pooling': 'freecs.benchmarks.pooling',
+}
+
+
+def load_suite(name):
+    return import_module(SUITES[name])
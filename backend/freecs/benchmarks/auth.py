@@ -0,0 +1,66 @@
+import time
+
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from ..authentication import ClaimsJWTAuthentication, member_claims
+from ..models import Instructor, Member
+from ..views import get_tokens_for_user
+from .seed import seed_instructors
+
+# Per-request cost of resolving who an authenticated instructor is: stock
+# JWTAuthentication plus the Member and Instructor lookups the write views
+# used to run, against the claims-based principal. Reported as requests/sec
+# for that part of the request, with the queries each path issues.
+
+
+def add_arguments(parser):
+    parser.add_argument('--auth-requests', type=int, default=2000, help='authenticated requests per timed run')
+
+
+def stock(request):
+    user, _ = JWTAuthentication().authenticate(request)
+    member = Member.objects.get(user=user)
+    instructor = Instructor.objects.get(member=member)
+    return member.id, instructor.id, member.is_instructor
+
+
+def claims(request):
+    principal, _ = ClaimsJWTAuthentication().authenticate(request)
+    return member_claims(principal)
+
+
+def requests_per_second(resolve, requests, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for request in requests:
+            resolve(request)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(requests) / best
+
+
+def run(command, rows=100, repeat=5, seed=0, auth_requests=2000, **options):
+    instructor_ids = seed_instructors(max(rows, 1), seed=seed)
+    users = list(Member.objects.filter(instructor__id__in=instructor_ids).select_related('user'))
+    factory = RequestFactory()
+    requests = []
+    for i in range(auth_requests):
+        token = get_tokens_for_user(users[i % len(users)].user)['access']
+        requests.append(Request(factory.get('/', HTTP_AUTHORIZATION=f'Bearer {token}')))
+
+    results = {}
+    for name, resolve in (('stock', stock), ('claims', claims)):
+        resolve(requests[0])  # warms the token version cache
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            resolve(requests[0])
+        rps = requests_per_second(resolve, requests, repeat)
+        results[name] = {'rps': rps, 'queries': len(ctx.captured_queries)}
+        command.stdout.write(f'{name:>8}  {rps:10.0f} req/s  {len(ctx.captured_queries)} queries per request')
+    command.stdout.write(f'claims principal is {results["claims"]["rps"] / results["stock"]["rps"]:.1f}x faster')
+    return results
@@ -0,0 +1,157 @@
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from unittest import mock
+from urllib.parse import urlencode
+
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from .. import recommendations, response_cache, snapshot
+from ..models import CoursePosting, Preference
+from ..search import rebuild_index
+from .load import run_load
+from .seed import seed_catalogue
+from .timing import percentile
+
+# Every public read endpoint, called in-process through the test client:
+# latency percentiles and SQL query count per endpoint. With --concurrency the
+# same endpoints are also served by a threaded WSGI server on a local port and
+# driven by the load driver for throughput. The response cache is bypassed
+# unless --response-cache is given, so the numbers are the cost of building
+# each response.
+
+
+def add_arguments(parser):
+    parser.add_argument('--endpoints', help='comma separated subset of ' + ', '.join(ENDPOINTS))
+    parser.add_argument('--concurrency', type=int, default=0,
+                        help='also drive each endpoint with this many client threads over HTTP')
+    parser.add_argument('--requests', type=int, default=1000, help='requests per endpoint for the load driver')
+    parser.add_argument('--response-cache', action='store_true', dest='keep_response_cache',
+                        help='leave the response cache on')
+
+
+def _url(name, params=None, **kwargs):
+    def build(ctx):
+        path = reverse(name, kwargs={key: ctx[value] for key, value in kwargs.items()})
+        return path, params or {}
+    return build
+
+
+ENDPOINTS = {
+    'courses': _url('courses'),
+    'courses_by_price': _url('courses', {'ordering': '-price'}),
+    'courses_by_popularity': _url('courses', {'ordering': '-enrollment_count'}),
+    'categories': _url('category'),
+    'instructors': _url('instructor-list'),
+    'enrollments': _url('enrollment'),
+    'search': _url('search', {'q': 'python data'}),
+    'search_fuzzy': _url('search', {'q': 'machin lerning'}),
+    'preferred_courses': _url('preferred_courses', member_id='member_id'),
+    'async_courses': _url('async-courses'),
+}
+
+
+class NullBackend:
+    def get(self, key):
+        return None
+
+    def set(self, key, entry):
+        pass
+
+    def clear(self):
+        pass
+
+
+@contextmanager
+def response_cache_off(enabled):
+    if enabled:
+        yield
+        return
+    with mock.patch.object(response_cache, '_backend', NullBackend()):
+        yield
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+@contextmanager
+def local_server():
+    server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler, allow_reuse_address=False)
+    server.set_app(get_wsgi_application())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_address[1]}'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def time_endpoint(client, path, params, repeat):
+    # the first call counts queries and warms up, the timed calls run without query capture.
+    # With DEBUG on, seeding fills the bounded query log and a full log can't be diffed.
+    connection.queries_log.clear()
+    with CaptureQueriesContext(connection) as ctx:
+        response = client.get(path, params)
+    if response.status_code != 200:
+        raise RuntimeError(f'GET {path} returned {response.status_code}')
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        client.get(path, params)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'queries': len(ctx.captured_queries),
+        'median_ms': statistics.median(samples),
+        'p90_ms': percentile(samples, 90),
+        'p99_ms': percentile(samples, 99),
+        'repeat': repeat,
+    }
+
+
+def run(command, rows=10000, repeat=20, seed=0, endpoints=None, concurrency=0, requests=1000,
+        keep_response_cache=False, **options):
+    names = endpoints.split(',') if endpoints else list(ENDPOINTS)
+    command.stdout.write(f'seeding a {rows}-course catalogue...')
+    sizes = seed_catalogue(rows, seed=seed)
+    command.stdout.write(', '.join(f'{count} {table}' for table, count in sizes.items()))
+    if not CoursePosting.objects.exists():
+        command.stdout.write('building search index...')
+        rebuild_index()
+    # recommendations for every member would dwarf the run, one ranked member is enough
+    member_id = Preference.objects.order_by('member_id').values_list('member_id', flat=True).first()
+    recommendations.recompute_member(member_id)
+    # the catalogue snapshot is built once per worker, not per request
+    snapshot.rebuild()
+    ctx = {'member_id': member_id}
+
+    results = {'sizes': sizes, 'endpoints': {}}
+    client = APIClient()
+    with override_settings(ALLOWED_HOSTS=['testserver', '127.0.0.1']), response_cache_off(keep_response_cache):
+        for name in names:
+            path, params = ENDPOINTS[name](ctx)
+            stats = time_endpoint(client, path, params, repeat)
+            results['endpoints'][name] = stats
+            command.stdout.write(f'{name:>22}  {stats["queries"]:3d} queries  p50 {stats["median_ms"]:8.2f} ms'
+                                 f'  p90 {stats["p90_ms"]:8.2f} ms  p99 {stats["p99_ms"]:8.2f} ms')
+
+        if concurrency:
+            with local_server() as base_url:
+                for name in names:
+                    path, params = ENDPOINTS[name](ctx)
+                    url = base_url + path + (f'?{urlencode(params)}' if params else '')
+                    load = run_load(url, concurrency=concurrency, total=requests)
+                    results['endpoints'][name]['load'] = load
+                    command.stdout.write(f'{name:>22}  {load["rps"]:9.1f} req/s  p50 {load["p50_ms"]:8.2f} ms'
+                                         f'  p99 {load["p99_ms"]:8.2f} ms  errors {load["errors"]}')
+    return results
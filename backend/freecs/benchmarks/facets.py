@@ -0,0 +1,58 @@
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from .. import snapshot
+from ..models import Category, Instructor
+from .endpoints import response_cache_off, time_endpoint
+from .seed import seed_catalogue
+
+# Filtered and sorted course list pages with facet counts, requested through
+# the test client with the response cache off. Each case is a query string
+# for CourseView; the thresholds file holds the latency budget per case.
+
+
+def add_arguments(parser):
+    parser.add_argument('--cases', help='comma separated subset of ' + ', '.join(CASES))
+
+
+def _cases(ctx):
+    two = ','.join(str(category_id) for category_id in ctx['categories'][:2])
+    return {
+        'unfiltered': {},
+        'category_any': {'category': two},
+        'category_all': {'category': two, 'category_match': 'all'},
+        'price_range': {'min_price': '20', 'max_price': '60', 'ordering': 'price'},
+        'price_range_by_popularity': {'min_price': '20', 'max_price': '60', 'ordering': 'popularity'},
+        'duration_newest': {'min_duration': 10, 'max_duration': 20, 'ordering': 'newest'},
+        'instructor': {'instructor': ctx['instructor']},
+        'everything': {'category': two, 'min_price': '10', 'max_price': '150', 'min_duration': 5,
+                       'ordering': '-duration'},
+    }
+
+
+CASES = list(_cases({'categories': [0, 0], 'instructor': 0}))
+
+
+def run(command, rows=100000, repeat=20, seed=0, cases=None, **options):
+    command.stdout.write(f'seeding a {rows}-course catalogue...')
+    sizes = seed_catalogue(rows, seed=seed)
+    command.stdout.write(', '.join(f'{count} {table}' for table, count in sizes.items()))
+    command.stdout.write('building the catalogue snapshot...')
+    snapshot.rebuild()
+    ctx = {
+        'categories': list(Category.objects.order_by('id').values_list('id', flat=True)),
+        'instructor': Instructor.objects.order_by('id').values_list('id', flat=True).first(),
+    }
+
+    names = cases.split(',') if cases else CASES
+    all_cases = _cases(ctx)
+    client = APIClient()
+    results = {'sizes': sizes, 'cases': {}}
+    with override_settings(ALLOWED_HOSTS=['testserver']), response_cache_off(False):
+        for name in names:
+            stats = time_endpoint(client, reverse('courses'), all_cases[name], repeat)
+            results['cases'][name] = stats
+            command.stdout.write(f'{name:>26}  {stats["queries"]:3d} queries  p50 {stats["median_ms"]:8.2f} ms'
+                                 f'  p99 {stats["p99_ms"]:8.2f} ms')
+    return results
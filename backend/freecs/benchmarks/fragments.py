@@ -0,0 +1,39 @@
+from .. import fragments
+from ..compiled import compile_serializer
+from ..models import Course
+from ..query_plan import optimize_queryset
+from ..serializers import CourseSerializer
+from .seed import link_course_categories, link_course_instructors, seed_courses, seed_instructors
+from .timing import measure
+
+# CourseSerializer with and without the per-object fragment cache, stock and
+# compiled (compiled.py). Popular instructors teach hundreds of courses, so
+# most instructor payloads repeat.
+
+
+def add_arguments(parser):
+    parser.add_argument('--instructors', type=int, default=50,
+                        help='instructor pool size; rows / instructors is the average courses per instructor')
+    parser.add_argument('--batch', type=int, default=1000, help='courses serialized per timed run')
+
+
+def run(command, rows=10000, repeat=5, seed=0, instructors=50, batch=1000, **options):
+    command.stdout.write(f'seeding {rows} courses taught by {instructors} instructors...')
+    seed_courses(rows, seed=seed)
+    link_course_categories(seed=seed)
+    link_course_instructors(seed_instructors(instructors, seed=seed), seed=seed)
+
+    courses = list(optimize_queryset(Course.objects.order_by('id'), CourseSerializer)[:batch])
+    compiled = compile_serializer(CourseSerializer)
+    results = {'courses': len(courses)}
+    for name, serialize in [('stock', lambda: CourseSerializer(courses, many=True).data),
+                            ('compiled', lambda: compiled.serialize(courses))]:
+        with fragments.disabled():
+            uncached = measure(serialize, repeat)
+        fragments.fragments.clear()
+        cached = measure(serialize, repeat)
+        command.stdout.write(f'{name:>8}  {len(courses)} courses  {uncached["median_ms"]:8.2f} ms'
+                             f'  fragment cache {cached["median_ms"]:8.2f} ms'
+                             f'  ({uncached["median_ms"] / cached["median_ms"]:.1f}x)')
+        results[name] = {'uncached': uncached, 'fragment_cache': cached}
+    return results
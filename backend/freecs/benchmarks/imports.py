@@ -0,0 +1,59 @@
+import time
+
+from django.db import transaction
+
+from ..importer import import_courses
+from ..serializers import CourseCreateUpdateSerializer
+from .seed import WORDS, seed_categories, seed_instructors
+
+# Rows per second for the bulk course importer against saving the same rows
+# one at a time through CourseCreateUpdateSerializer, as POST /courses/add does.
+# Each run is rolled back, so both paths start from the same table.
+
+
+def add_arguments(parser):
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--single-rows', type=int, default=500,
+                        help='rows saved through the single-create path, which is much slower')
+
+
+def payload(n, category_ids, instructor_ids):
+    return [{
+        'name': f'{WORDS[i % len(WORDS)].title()} import {i}',
+        'description': 'Imported course.',
+        'price': '19.99',
+        'duration': 1 + i % 100,
+        'category': [category_ids[i % len(category_ids)]],
+        'instructors': [instructor_ids[i % len(instructor_ids)]],
+    } for i in range(n)]
+
+
+def rows_per_second(fn, n, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with transaction.atomic():
+            fn()
+            transaction.set_rollback(True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return n / best
+
+
+def run(command, rows=10000, repeat=3, seed=0, chunk_size=1000, single_rows=500, **options):
+    category_ids = seed_categories()
+    instructor_ids = seed_instructors(50, seed=seed)
+    bulk_rows = payload(rows, category_ids, instructor_ids)
+    single = payload(min(single_rows, rows), category_ids, instructor_ids)
+
+    def create_one_by_one():
+        for row in single:
+            serializer = CourseCreateUpdateSerializer(data=row)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+
+    bulk_rate = rows_per_second(lambda: import_courses(bulk_rows, chunk_size=chunk_size), rows, repeat)
+    single_rate = rows_per_second(create_one_by_one, len(single), repeat)
+    command.stdout.write(f'single create {single_rate:10.0f} rows/s  bulk import {bulk_rate:10.0f} rows/s'
+                         f'  ({bulk_rate / single_rate:.1f}x)')
+    return {'rows': rows, 'chunk_size': chunk_size, 'single_rows_per_s': single_rate, 'bulk_rows_per_s': bulk_rate}
@@ -0,0 +1,129 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Worker cold start: a fresh interpreter per run goes through what a WSGI
+# worker does before its first request (django.setup(), the middleware
+# chain, the URLconf) and then imports every view, which is what first
+# dispatch costs now that views load lazily (see lazy_views.py). Reports the
+# time of each phase, the whole process, resident memory and module counts
+# after boot and after the views, and the slowest top-level imports from
+# `python -X importtime`.
+
+BOOT_DONE = '-- boot done'
+
+CHILD = '''
+import json, os, sys, time
+
+def rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+marks = [time.perf_counter()]
+import django
+django.setup()
+marks.append(time.perf_counter())
+from django.core.wsgi import get_wsgi_application
+get_wsgi_application()
+marks.append(time.perf_counter())
+from django.urls import get_resolver
+get_resolver().url_patterns
+marks.append(time.perf_counter())
+boot = {'rss_bytes': rss(), 'modules': len(sys.modules)}
+sys.stderr.write(%(marker)r + '\\n')
+sys.stderr.flush()
+
+from freecs import lazy_views
+# -X importtime only sees the import statement, not importlib.import_module()
+for module in lazy_views.view_modules():
+    __import__(module)
+views = lazy_views.preload()
+marks.append(time.perf_counter())
+loaded = {'rss_bytes': rss(), 'modules': len(sys.modules)}
+phases = ['setup', 'middleware', 'urlconf', 'views']
+print(json.dumps({'phases': {name: (marks[i + 1] - marks[i]) * 1000 for i, name in enumerate(phases)},
+                  'boot': boot, 'loaded': loaded, 'views': views}))
+''' % {'marker': BOOT_DONE}
+
+
+def add_arguments(parser):
+    parser.add_argument('--top', type=int, default=15, help='slowest top-level imports to list')
+
+
+def parse_importtime(stderr):
+    # {module: (cumulative ms, imported at top level)}, split at the end of boot
+    sections = [{}, {}]
+    current = sections[0]
+    for line in stderr.splitlines():
+        if line.strip() == BOOT_DONE:
+            current = sections[1]
+            continue
+        if not line.startswith('import time:'):
+            continue
+        try:
+            _, cumulative, name = line[len('import time:'):].split('|')
+            cumulative = int(cumulative)
+        except ValueError:
+            continue  # the header line
+        current[name.strip()] = (cumulative / 1000, not name.startswith('  '))
+    return sections
+
+
+def boot_once():
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+    start = time.perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD], env=env, capture_output=True,
+                             text=True, check=True)
+    elapsed = (time.perf_counter() - start) * 1000
+    run = json.loads(process.stdout.strip().splitlines()[-1])
+    run['process_ms'] = elapsed
+    run['imports'] = parse_importtime(process.stderr)
+    return run
+
+
+def _median(runs, get):
+    return statistics.median(get(run) for run in runs)
+
+
+def _slowest(imports, top):
+    top_level = [(name, ms) for name, (ms, is_top_level) in imports.items() if is_top_level]
+    return [{'module': name, 'cumulative_ms': round(ms, 2)}
+            for name, ms in sorted(top_level, key=lambda item: -item[1])[:top]]
+
+
+def run(command, repeat=5, top=15, **options):
+    command.stdout.write(f'booting {repeat} fresh workers...')
+    runs = [boot_once() for _ in range(repeat)]
+    phases = {name: {'median_ms': _median(runs, lambda run: run['phases'][name])} for name in runs[0]['phases']}
+    results = {
+        'process': {'median_ms': _median(runs, lambda run: run['process_ms'])},
+        'boot': {'median_ms': sum(phases[name]['median_ms'] for name in ('setup', 'middleware', 'urlconf'))},
+        'phases': phases,
+        'memory': {
+            'boot_rss_bytes': _median(runs, lambda run: run['boot']['rss_bytes']),
+            'loaded_rss_bytes': _median(runs, lambda run: run['loaded']['rss_bytes']),
+        },
+        'modules': {'boot': runs[0]['boot']['modules'], 'loaded': runs[0]['loaded']['modules']},
+        'views': runs[0]['views'],
+        'slowest_imports': {'boot': _slowest(runs[-1]['imports'][0], top),
+                            'first_dispatch': _slowest(runs[-1]['imports'][1], top)},
+    }
+
+    split = ', '.join(f'{name} {stats["median_ms"]:.1f}' for name, stats in phases.items())
+    command.stdout.write(f'process {results["process"]["median_ms"]:8.1f} ms  boot {results["boot"]["median_ms"]:8.1f} ms'
+                         f'  ({split})')
+    command.stdout.write(f'rss after boot {results["memory"]["boot_rss_bytes"] / 2**20:7.1f} MiB'
+                         f'  after {results["views"]} views {results["memory"]["loaded_rss_bytes"] / 2**20:7.1f} MiB'
+                         f'  modules {results["modules"]["boot"]} -> {results["modules"]["loaded"]}')
+    for section, imports in results['slowest_imports'].items():
+        command.stdout.write(f'slowest imports during {section.replace("_", " ")}:')
+        for item in imports:
+            command.stdout.write(f'  {item["cumulative_ms"]:8.1f} ms  {item["module"]}')
+    return results
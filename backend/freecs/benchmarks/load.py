@@ -0,0 +1,73 @@
+import http.client
+import threading
+import time
+from urllib.parse import urlsplit
+
+from .timing import percentile
+
+# Closed-loop HTTP load driver: `concurrency` client threads, each with its own
+# keep-alive connection, issue requests back to back until `total` have been
+# sent. Point it at a running server, e.g. gunicorn (WSGI) and uvicorn (ASGI)
+# serving the same database, to compare the two deployments.
+
+
+def _connection(url, timeout):
+    parts = urlsplit(url)
+    cls = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    return cls(parts.netloc, timeout=timeout)
+
+
+def run_load(url, concurrency=50, total=2000, timeout=30, headers=None):
+    parts = urlsplit(url)
+    path = parts.path + (f'?{parts.query}' if parts.query else '')
+    remaining = [total]
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+
+    def worker():
+        conn = _connection(url, timeout)
+        local = []
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    break
+                remaining[0] -= 1
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path, headers=headers or {})
+                response = conn.getresponse()
+                response.read()
+                ok = response.status < 500
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = _connection(url, timeout)
+                ok = False
+            local.append((time.perf_counter() - start) * 1000)
+            if not ok:
+                with lock:
+                    errors[0] += 1
+        conn.close()
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'url': url,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': errors[0],
+        'seconds': elapsed,
+        'rps': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 50),
+        'p90_ms': percentile(latencies, 90),
+        'p99_ms': percentile(latencies, 99),
+        'max_ms': latencies[-1] if latencies else 0.0,
+    }
@@ -0,0 +1,49 @@
+from django.test import RequestFactory
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.request import Request
+
+from ..models import Course
+from ..pagination import KeysetPagination
+from .seed import seed_courses
+from .timing import measure
+
+# Keyset vs limit/offset pagination over a large course table. Keyset pages
+# should cost the same at page 1 and page 10,000; offset pages grow linearly.
+
+
+def add_arguments(parser):
+    parser.add_argument('--pages', default='1,10,100,1000,10000',
+                        help='comma separated page numbers to time')
+    parser.add_argument('--page-size', type=int, default=100)
+
+
+def run(command, rows=1000000, repeat=5, seed=0, pages='1,10,100,1000,10000', page_size=100, **options):
+    command.stdout.write(f'seeding {rows} courses...')
+    seed_courses(rows, seed=seed)
+    factory = RequestFactory()
+    queryset = Course.objects.all()
+    ids = Course.objects.order_by('id').values_list('id', flat=True)
+    results = []
+
+    for page in [int(p) for p in pages.split(',')]:
+        offset = (page - 1) * page_size
+        if offset >= rows:
+            continue
+
+        keyset = KeysetPagination(page_size=page_size)
+        params = {}
+        if offset:
+            # the cursor a client holds after walking to this page
+            boundary = Course(pk=ids[offset - 1])
+            params['cursor'] = keyset.encode_cursor('id', boundary)
+        keyset_request = Request(factory.get('/courses/', params))
+        keyset_stats = measure(lambda: keyset.paginate_queryset(queryset, keyset_request), repeat)
+
+        offset_request = Request(factory.get('/courses/', {'limit': page_size, 'offset': offset}))
+        offset_stats = measure(
+            lambda: LimitOffsetPagination().paginate_queryset(queryset.order_by('id'), offset_request), repeat)
+
+        results.append({'page': page, 'keyset': keyset_stats, 'limit_offset': offset_stats})
+        command.stdout.write(f'page {page:>6}  keyset {keyset_stats["median_ms"]:8.2f} ms'
+                             f'  limit/offset {offset_stats["median_ms"]:8.2f} ms')
+    return results
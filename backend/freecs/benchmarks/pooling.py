@@ -0,0 +1,98 @@
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.db import connection, connections
+from django.db.utils import load_backend
+
+from .. import pooling
+from .timing import measure, percentile
+
+# Connection cost per request: --cycles times connect, one query the course
+# list runs and close, with the benchmark database's own backend and with
+# the pooled one from freecs/backends/, then the same with --pool-threads
+# threads sharing a pool smaller than the thread count, reporting the
+# connection wait time percentiles. Against PostgreSQL the unpooled number
+# includes the connection handshake; an in-memory SQLite test database is
+# replaced by a temporary file, which pooling can share.
+
+POOLED_ENGINES = {'postgresql': 'freecs.backends.postgresql', 'sqlite': 'freecs.backends.sqlite3'}
+QUERY = 'SELECT id, name FROM freecs_course ORDER BY name, id LIMIT %s'
+
+
+def add_arguments(parser):
+    parser.add_argument('--cycles', type=int, default=500, help='connect/query/close cycles per timed run')
+    parser.add_argument('--pool-threads', type=int, default=8, help='threads sharing the pool')
+
+
+def _wrapper(settings_dict, engine, alias):
+    settings_dict = connections.configure_settings({'default': {**settings_dict, 'ENGINE': engine,
+                                                                'CONN_MAX_AGE': 0}})['default']
+    return load_backend(engine).DatabaseWrapper(settings_dict, alias)
+
+
+def _cycles(settings_dict, engine, alias, cycles):
+    for _ in range(cycles):
+        wrapper = _wrapper(settings_dict, engine, alias)
+        with wrapper.cursor() as cursor:
+            cursor.execute(QUERY, [20])
+            cursor.fetchall()
+        wrapper.close()
+
+
+def _contended(settings_dict, engine, threads, cycles):
+    waits = []
+
+    def work():
+        for _ in range(cycles // threads):
+            start = time.perf_counter()
+            wrapper = _wrapper(settings_dict, engine, 'benchmark_contended')
+            wrapper.ensure_connection()
+            waits.append((time.perf_counter() - start) * 1000)
+            with wrapper.cursor() as cursor:
+                cursor.execute(QUERY, [20])
+                cursor.fetchall()
+            wrapper.close()
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    waits.sort()
+    return {'p50_ms': percentile(waits, 50), 'p99_ms': percentile(waits, 99), 'max_ms': waits[-1] if waits else 0.0}
+
+
+def run(command, rows=0, repeat=5, seed=0, cycles=500, pool_threads=8, **options):
+    settings_dict = dict(connection.settings_dict)
+    path = None
+    if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+        handle, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        settings_dict['NAME'] = path
+        with _wrapper(settings_dict, 'django.db.backends.sqlite3', 'benchmark_setup').cursor() as cursor:
+            cursor.execute('CREATE TABLE freecs_course (id integer PRIMARY KEY, name varchar(200))')
+    engine = POOLED_ENGINES[connection.vendor]
+    try:
+        results = {}
+        for name, engine_name in (('unpooled', settings_dict['ENGINE']), ('pooled', engine)):
+            if name == 'unpooled' and engine_name.startswith('freecs.backends.'):
+                continue
+            stats = measure(lambda: _cycles(settings_dict, engine_name, f'benchmark_{name}', cycles), repeat)
+            stats['us_per_cycle'] = stats['median_ms'] * 1000 / cycles
+            results[name] = stats
+            command.stdout.write(f'{name:>9}  {stats["median_ms"]:8.2f} ms  {stats["us_per_cycle"]:8.1f} us/cycle')
+
+        size = max(pool_threads // 2, 1)
+        with mock.patch.dict(pooling._config, {'MAX_SIZE': size, 'TIMEOUT': 30}):
+            results['contended'] = _contended(settings_dict, engine, pool_threads, cycles)
+        results['contended']['pool_size'] = size
+        command.stdout.write(f'{pool_threads} threads, pool of {size}: wait p50 '
+                             f'{results["contended"]["p50_ms"]:.3f} ms  p99 {results["contended"]["p99_ms"]:.3f} ms')
+        return results
+    finally:
+        pooling.close_pools()
+        if path:
+            os.remove(path)
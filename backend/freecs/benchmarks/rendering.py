@@ -0,0 +1,54 @@
+from .. import compression, rendering
+from ..snapshot import build
+from .seed import seed_catalogue
+from .timing import measure
+
+# Response bodies for the course list: time to encode a --page-size page of
+# snapshot course payloads with each available JSON encoder, and for every
+# available encoding and a few levels, the compressed size, the ratio and
+# the time to compress it, whole and streamed in 16 KiB chunks.
+
+LEVELS = {'gzip': (1, 6, 9), 'br': (1, 4, 9), 'zstd': (1, 3, 9)}
+STREAM_CHUNK = 16384
+
+
+def add_arguments(parser):
+    pass
+
+
+def _streamed(body, encoding, level):
+    stream = compression.CODECS[encoding](level)
+    out = [stream.compress(body[start:start + STREAM_CHUNK]) + stream.flush()
+           for start in range(0, len(body), STREAM_CHUNK)]
+    return b''.join(out) + stream.finish()
+
+
+def run(command, rows=10000, repeat=5, seed=0, page_size=100, **options):
+    command.stdout.write(f'seeding a {rows}-course catalogue...')
+    seed_catalogue(rows, seed=seed)
+    snapshot = build()
+    page = {'results': snapshot.course_payloads(range(min(page_size, len(snapshot.courses))))}
+    body = rendering.dumps(page, 'json')
+    results = {'body_bytes': len(body), 'encoders': {}, 'compression': {}}
+
+    encoders = ['json'] + (['orjson'] if rendering.orjson is not None else [])
+    for encoder in encoders:
+        stats = measure(lambda: rendering.dumps(page, encoder), repeat)
+        stats['mb_per_s'] = len(body) / 2**20 / (stats['median_ms'] / 1000) if stats['median_ms'] else 0.0
+        results['encoders'][encoder] = stats
+        command.stdout.write(f'{encoder:>8}  {len(body):9d} bytes  {stats["median_ms"]:8.2f} ms'
+                             f'  {stats["mb_per_s"]:8.1f} MiB/s')
+
+    for encoding in compression.CODECS:
+        for level in LEVELS[encoding]:
+            compressed = compression.compress(body, encoding, level)
+            stats = measure(lambda: compression.compress(body, encoding, level), repeat)
+            streamed = measure(lambda: _streamed(body, encoding, level), repeat)
+            stats.update({'bytes': len(compressed), 'ratio': len(body) / len(compressed),
+                          'streamed_bytes': len(_streamed(body, encoding, level)),
+                          'streamed_median_ms': streamed['median_ms']})
+            results['compression'][f'{encoding}_{level}'] = stats
+            command.stdout.write(f'{encoding:>5} {level}  {len(compressed):9d} bytes  x{stats["ratio"]:5.1f}'
+                                 f'  {stats["median_ms"]:7.2f} ms  streamed {stats["streamed_bytes"]:9d} bytes'
+                                 f'  {stats["streamed_median_ms"]:7.2f} ms')
+    return results
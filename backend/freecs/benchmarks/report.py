@@ -0,0 +1,90 @@
+import json
+import os
+import platform
+
+import django
+from django.db import connection
+
+# Saved results, run-to-run comparison and threshold checks for
+# `manage.py benchmark`. Results are flattened to dotted paths such as
+# "endpoints.courses.p99_ms", which is also how thresholds name a metric.
+
+THRESHOLDS_FILE = os.path.join(os.path.dirname(__file__), 'thresholds.json')
+
+# which numbers are compared, and whether bigger is better
+LOWER_IS_BETTER = ('median_ms', 'p50_ms', 'p90_ms', 'p99_ms', 'queries', 'rss_bytes')
+HIGHER_IS_BETTER = ('rps', '_per_s')
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'machine': platform.machine(),
+    }
+
+
+def save(path, suite, options, results):
+    with open(path, 'w') as f:
+        json.dump({'suite': suite, 'options': options, 'environment': environment(), 'results': results},
+                  f, indent=2, default=str)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def flatten(value, prefix=''):
+    if isinstance(value, dict):
+        flat = {}
+        for key, item in value.items():
+            flat.update(flatten(item, f'{prefix}{key}.'))
+        return flat
+    if isinstance(value, list):
+        flat = {}
+        for i, item in enumerate(value):
+            flat.update(flatten(item, f'{prefix}{i}.'))
+        return flat
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return {prefix[:-1]: value}
+    return {}
+
+
+def _direction(path):
+    name = path.rsplit('.', 1)[-1]
+    if name.endswith(LOWER_IS_BETTER):
+        return -1
+    if name.endswith(HIGHER_IS_BETTER):
+        return 1
+    return 0
+
+
+def compare(baseline, current, tolerance=0.2):
+    # (path, before, after) for every compared metric that got worse by more than tolerance
+    before, after = flatten(baseline), flatten(current)
+    regressions = []
+    for path, new in sorted(after.items()):
+        old = before.get(path)
+        direction = _direction(path)
+        if old is None or not direction:
+            continue
+        if direction < 0 and new > old * (1 + tolerance) and new - old > 1e-9:
+            regressions.append((path, old, new))
+        elif direction > 0 and new < old * (1 - tolerance):
+            regressions.append((path, old, new))
+    return regressions
+
+
+def check_thresholds(results, thresholds):
+    # thresholds map a path to its limit: a maximum for times and counts, a minimum for rates
+    flat = flatten(results)
+    failures = []
+    for path, limit in sorted(thresholds.items()):
+        value = flat.get(path)
+        if value is None:
+            continue
+        if (_direction(path) > 0 and value < limit) or (_direction(path) <= 0 and value > limit):
+            failures.append((path, limit, value))
+    return failures
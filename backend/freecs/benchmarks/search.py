@@ -0,0 +1,41 @@
+from django.db.models import Q
+
+from ..models import Course, CoursePosting
+from ..search import rebuild_index, search_course_ids
+from .seed import link_course_categories, seed_courses
+from .timing import measure
+
+# Indexed search vs the old per-request iregex scan over name and category name.
+
+
+def add_arguments(parser):
+    parser.add_argument('--terms', default='python,machine learning,secur,databse',
+                        help='comma separated search texts to time')
+
+
+def iregex_search(text):
+    # the query SearchView ran before the index existed
+    return list(Course.objects.filter(Q(name__iregex=text) | Q(category__name__iregex=text)))
+
+
+def indexed_search(text):
+    ids, _ = search_course_ids(text)
+    return list(Course.objects.filter(id__in=ids))
+
+
+def run(command, rows=100000, repeat=5, seed=0, terms='', **options):
+    command.stdout.write(f'seeding {rows} courses...')
+    seed_courses(rows, seed=seed)
+    link_course_categories(seed=seed)
+    if not CoursePosting.objects.exists():
+        command.stdout.write('building search index...')
+        rebuild_index()
+
+    results = []
+    for text in terms.split(','):
+        indexed = measure(lambda: indexed_search(text), repeat)
+        iregex = measure(lambda: iregex_search(text), repeat)
+        results.append({'text': text, 'indexed': indexed, 'iregex': iregex})
+        command.stdout.write(f'{text!r:>20}  indexed {indexed["median_ms"]:8.2f} ms'
+                             f'  iregex {iregex["median_ms"]:8.2f} ms')
+    return results
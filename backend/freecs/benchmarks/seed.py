@@ -0,0 +1,150 @@
+import random
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+
+from ..counters import reconcile_course_counts, reconcile_enrollment_counts
+from ..models import Category, Course, Enrollment, Instructor, Member, Preference
+
+# Deterministic data generators for the benchmarks. The same seed always
+# produces the same rows, so two runs on different commits are comparable.
+
+WORDS = ['python', 'django', 'data', 'web', 'design', 'machine', 'learning', 'cloud', 'security', 'mobile',
+         'algorithms', 'databases', 'networks', 'systems', 'graphics', 'testing', 'devops', 'rust', 'java', 'go']
+
+
+def course_rows(n, seed=0, start=0):
+    rng = random.Random(seed + start)
+    for i in range(start, start + n):
+        words = rng.sample(WORDS, 3)
+        yield Course(
+            name=f'{" ".join(words).title()} {i}',
+            description=f'A course about {", ".join(words)}.',
+            price=Decimal(rng.randrange(0, 50000)) / 100,
+            duration=rng.randrange(1, 200),
+        )
+
+
+def seed_courses(n, seed=0, batch_size=10000):
+    # tops the table up to n rows, so an existing benchmark database is reused
+    existing = Course.objects.count()
+    for start in range(existing, n, batch_size):
+        Course.objects.bulk_create(course_rows(min(batch_size, n - start), seed=seed, start=start),
+                                   batch_size=batch_size)
+    return Course.objects.count()
+
+
+def seed_categories(n=20):
+    existing = Category.objects.count()
+    Category.objects.bulk_create(Category(name=f'{WORDS[i % len(WORDS)].title()} {i}') for i in range(existing, n))
+    return list(Category.objects.order_by('id').values_list('id', flat=True)[:n])
+
+
+def link_course_categories(seed=0, per_course=2, batch_size=10000):
+    # gives every course without a category `per_course` random categories
+    rng = random.Random(seed)
+    category_ids = seed_categories()
+    through = Course.category.through
+    unlinked = Course.objects.filter(category__isnull=True).order_by('id').values_list('id', flat=True)
+    links = []
+    for course_id in unlinked.iterator(chunk_size=batch_size):
+        links.extend(through(course_id=course_id, category_id=c) for c in rng.sample(category_ids, per_course))
+        if len(links) >= batch_size:
+            through.objects.bulk_create(links)
+            links = []
+    through.objects.bulk_create(links)
+
+
+def seed_instructors(n, seed=0, batch_size=5000):
+    rng = random.Random(seed)
+    existing = Instructor.objects.count()
+    for start in range(existing, n, batch_size):
+        names = [f'bench_teacher_{i}' for i in range(start, min(start + batch_size, n))]
+        User.objects.bulk_create([User(username=name, email=f'{name}@example.com', first_name=name.title(),
+                                       last_name='Bench', password='!') for name in names])
+        users = User.objects.filter(username__in=names)
+        members = Member.objects.bulk_create([Member(user=user, is_instructor=True) for user in users])
+        Instructor.objects.bulk_create([
+            Instructor(member=member, skills={'main': rng.choice(WORDS), 'extra': rng.choice(WORDS)},
+                       bio='Benchmark instructor', experience=rng.randrange(1, 30),
+                       rate_per_hour=Decimal(rng.randrange(1000, 20000)) / 100)
+            for member in members
+        ])
+    return list(Instructor.objects.order_by('id').values_list('id', flat=True)[:n])
+
+
+def link_course_instructors(instructor_ids, seed=0, per_course=2, batch_size=10000):
+    # gives every course without instructors `per_course` random ones
+    rng = random.Random(seed)
+    through = Course.instructors.through
+    untaught = Course.objects.filter(instructors__isnull=True).order_by('id').values_list('id', flat=True)
+    links = []
+    for course_id in untaught.iterator(chunk_size=batch_size):
+        links.extend(through(course_id=course_id, instructor_id=i) for i in rng.sample(instructor_ids, per_course))
+        if len(links) >= batch_size:
+            through.objects.bulk_create(links)
+            links = []
+    through.objects.bulk_create(links)
+
+
+def seed_members(n, seed=0, batch_size=5000):
+    # students, on top of the members seed_instructors creates
+    existing = Member.objects.filter(is_instructor=False).count()
+    for start in range(existing, n, batch_size):
+        names = [f'bench_student_{i}' for i in range(start, min(start + batch_size, n))]
+        User.objects.bulk_create([User(username=name, email=f'{name}@example.com', first_name=name.title(),
+                                       last_name='Bench', password='!') for name in names])
+        users = User.objects.filter(username__in=names)
+        Member.objects.bulk_create([Member(user=user, is_instructor=False) for user in users])
+    return list(Member.objects.filter(is_instructor=False).order_by('id').values_list('id', flat=True)[:n])
+
+
+def seed_enrollments(n, member_ids, seed=0, batch_size=10000):
+    # enrolls random members until n courses have an enrollment
+    rng = random.Random(seed)
+    existing = Enrollment.objects.count()
+    open_courses = (Course.objects.filter(enrollment__isnull=True).order_by('id')
+                    .values_list('id', flat=True)[:max(n - existing, 0)])
+    batch = []
+    for course_id in open_courses.iterator(chunk_size=batch_size):
+        batch.append(Enrollment(member_id=rng.choice(member_ids), course_id=course_id))
+        if len(batch) >= batch_size:
+            Enrollment.objects.bulk_create(batch)
+            batch = []
+    Enrollment.objects.bulk_create(batch)
+    # bulk_create skips the counter signals
+    reconcile_enrollment_counts()
+
+
+def seed_preferences(member_ids, seed=0, per_member=3, batch_size=10000):
+    rng = random.Random(seed)
+    category_ids = seed_categories()
+    through = Preference.category.through
+    have = set(Preference.objects.values_list('member_id', flat=True))
+    for start in range(0, len(member_ids), batch_size):
+        preferences = Preference.objects.bulk_create(
+            [Preference(member_id=m) for m in member_ids[start:start + batch_size] if m not in have])
+        through.objects.bulk_create([
+            through(preference_id=preference.id, category_id=c)
+            for preference in preferences for c in rng.sample(category_ids, per_member)
+        ])
+
+
+def seed_catalogue(rows, seed=0):
+    # every table at a scale derived from the course count, e.g. 1k, 100k or 1M
+    seed_courses(rows, seed=seed)
+    link_course_categories(seed=seed)
+    instructor_ids = seed_instructors(max(rows // 100, 10), seed=seed)
+    link_course_instructors(instructor_ids, seed=seed)
+    member_ids = seed_members(max(rows // 10, 10), seed=seed)
+    seed_enrollments(rows // 2, member_ids, seed=seed)
+    seed_preferences(member_ids, seed=seed)
+    reconcile_course_counts()
+    return {
+        'courses': Course.objects.count(),
+        'categories': Category.objects.count(),
+        'instructors': len(instructor_ids),
+        'members': len(member_ids),
+        'enrollments': Enrollment.objects.count(),
+        'preferences': Preference.objects.count(),
+    }
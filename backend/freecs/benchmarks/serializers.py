@@ -0,0 +1,86 @@
+from django.contrib.auth.models import User
+
+from .. import fragments
+from ..compiled import compile_serializer
+from ..models import Category, Course, Enrollment, Instructor, Member
+from ..query_plan import optimize_queryset
+from ..serializers import (CategorySerializer, CourseCreateUpdateSerializer, CourseSerializer, EnrollmentSerializer,
+                           InstructorSerializer, MemberSerializer, UserProfileSerializer)
+from .seed import seed_catalogue
+from .timing import measure
+
+# Micro-benchmarks for each serializer: time to serialize --objects rows that
+# are already loaded, so only serializer work is measured, plus validation of
+# the course create payload. The fragment cache is off, since it would hide
+# the cost of the serializers themselves.
+#
+# Each read serializer is also run compiled (compiled.py) on the same
+# instances, and end to end against the database: the stock serializer on a
+# planned queryset versus the compiled one on .values() rows. Rates are rows
+# per second.
+
+READ_SERIALIZERS = {
+    'category': (Category, CategorySerializer),
+    'instructor': (Instructor, InstructorSerializer),
+    'course': (Course, CourseSerializer),
+    'enrollment': (Enrollment, EnrollmentSerializer),
+    'member': (Member, MemberSerializer),
+    'user_profile': (User, UserProfileSerializer),
+}
+
+
+def add_arguments(parser):
+    parser.add_argument('--objects', type=int, default=1000, help='rows serialized per timed run')
+
+
+def with_rate(stats, objects):
+    stats['objects'] = objects
+    stats['us_per_object'] = stats['median_ms'] * 1000 / max(objects, 1)
+    stats['rows_per_s'] = objects * 1000 / stats['median_ms'] if stats['median_ms'] else 0.0
+    return stats
+
+
+def run(command, rows=10000, repeat=5, seed=0, objects=1000, **options):
+    command.stdout.write(f'seeding a {rows}-course catalogue...')
+    seed_catalogue(rows, seed=seed)
+    results = {}
+
+    with fragments.disabled():
+        for name, (model, serializer_class) in READ_SERIALIZERS.items():
+            queryset = optimize_queryset(model.objects.order_by('id'), serializer_class)[:objects]
+            instances = list(queryset)
+            compiled = compile_serializer(serializer_class)
+            stats = with_rate(measure(lambda: serializer_class(instances, many=True).data, repeat), len(instances))
+            stats['compiled'] = with_rate(measure(lambda: compiled.serialize(instances), repeat), len(instances))
+            stats['stock_query'] = with_rate(
+                measure(lambda: serializer_class(list(queryset.all()), many=True).data, repeat), len(instances))
+            if compiled.supports_values:
+                values = model.objects.order_by('id')[:objects]
+                stats['values'] = with_rate(measure(lambda: list(compiled.values(values)), repeat), len(instances))
+            results[name] = stats
+            command.stdout.write(f'{name:>16}  {len(instances):6d} objects  {stats["median_ms"]:8.2f} ms'
+                                 f'  {stats["us_per_object"]:8.1f} us/object')
+            for mode in ('compiled', 'stock_query', 'values'):
+                if mode in stats:
+                    command.stdout.write(f'{mode:>28}  {stats[mode]["median_ms"]:8.2f} ms'
+                                         f'  {stats[mode]["rows_per_s"]:10.0f} rows/s'
+                                         f'  x{stats[mode]["rows_per_s"] / stats["rows_per_s"]:.1f}')
+
+    course = Course.objects.prefetch_related('category', 'instructors').order_by('id').first()
+    payload = {
+        'name': course.name, 'description': course.description, 'price': str(course.price),
+        'duration': course.duration, 'category': [c.id for c in course.category.all()],
+        'instructors': [i.id for i in course.instructors.all()],
+    }
+
+    def validate():
+        for _ in range(objects):
+            CourseCreateUpdateSerializer(data=payload).is_valid(raise_exception=True)
+
+    stats = measure(validate, repeat)
+    stats['objects'] = objects
+    stats['us_per_object'] = stats['median_ms'] * 1000 / objects
+    results['course_create_validation'] = stats
+    command.stdout.write(f'{"course_create":>16}  {objects:6d} payloads {stats["median_ms"]:8.2f} ms'
+                         f'  {stats["us_per_object"]:8.1f} us/payload')
+    return results
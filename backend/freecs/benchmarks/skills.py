@@ -0,0 +1,59 @@
+from ..models import Instructor, InstructorSkill
+from ..skills import rebuild_index, search_instructor_ids
+from .seed import seed_instructors
+from .timing import measure
+
+# Skill search over the instructor skill index vs scanning the skills JSON of
+# every instructor, for a first page of 20 ranked by experience. Each query
+# is skills[:match][:min_experience].
+
+QUERIES = ['python', 'python,rust:any', 'python,rust:all', 'data:any:20', 'web,cloud,go:any:10']
+
+
+def add_arguments(parser):
+    parser.add_argument('--skill-queries', help='";" separated queries, e.g. "python,rust:all:10;data"')
+
+
+def _parse(query):
+    skills, match, min_experience = (query.split(':') + ['any', ''][query.count(':'):])[:3]
+    return skills.split(','), match, int(min_experience) if min_experience else None
+
+
+def indexed_search(skills, match, min_experience):
+    ids, _ = search_instructor_ids(skills, match, min_experience=min_experience)
+    return ids
+
+
+def scanned_search(skills, match, min_experience):
+    # the JSON scan, ordered like the index; icontains matches substrings too, which only flatters it
+    instructors = Instructor.objects.all()
+    if min_experience is not None:
+        instructors = instructors.filter(experience__gte=min_experience)
+    if match == 'all':
+        for skill in skills:
+            instructors = instructors.filter(skills__icontains=skill)
+    else:
+        query = None
+        for skill in skills:
+            lookup = instructors.filter(skills__icontains=skill)
+            query = lookup if query is None else query | lookup
+        instructors = query
+    return list(instructors.order_by('-experience', 'id').values_list('id', flat=True)[:20])
+
+
+def run(command, rows=100000, repeat=5, seed=0, skill_queries=None, **options):
+    command.stdout.write(f'seeding {rows} instructors...')
+    seed_instructors(rows, seed=seed)
+    if InstructorSkill.objects.values('instructor').distinct().count() < rows:
+        command.stdout.write('building skill index...')
+        rebuild_index()
+
+    results = []
+    for query in skill_queries.split(';') if skill_queries else QUERIES:
+        args = _parse(query)
+        indexed = measure(lambda: indexed_search(*args), repeat)
+        scanned = measure(lambda: scanned_search(*args), repeat)
+        results.append({'query': query, 'indexed': indexed, 'scanned': scanned})
+        command.stdout.write(f'{query!r:>24}  indexed {indexed["median_ms"]:8.2f} ms'
+                             f'  scanned {scanned["median_ms"]:8.2f} ms')
+    return results
@@ -0,0 +1,77 @@
+import tracemalloc
+
+from django.db.models import F
+from django.test import RequestFactory
+from rest_framework.request import Request
+
+from ..models import Course
+from ..pagination import KeysetPagination
+from ..query_plan import optimize_queryset
+from ..serializers import CourseSerializer
+from ..snapshot import build
+from .seed import seed_catalogue
+from .timing import measure
+
+# The catalogue snapshot: full build time, rebuild time after --changed
+# course writes, memory held by the snapshot against the same courses loaded
+# as prefetched model instances, and the time to serve a course list page
+# from memory against the queryset path it replaced.
+
+SORT_KEYS = ['name', 'price', 'duration', 'enrollment_count']
+
+
+def add_arguments(parser):
+    parser.add_argument('--changed', type=int, default=10, help='courses written between snapshot rebuilds')
+
+
+def traced_bytes(load):
+    tracemalloc.start()
+    try:
+        value = load()
+        return value, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def run(command, rows=10000, repeat=5, seed=0, changed=10, **options):
+    command.stdout.write(f'seeding a {rows}-course catalogue...')
+    seed_catalogue(rows, seed=seed)
+    results = {}
+
+    results['full_build'] = measure(build, max(repeat // 2, 1))
+    snapshot, snapshot_bytes = traced_bytes(build)
+    _, instance_bytes = traced_bytes(
+        lambda: list(optimize_queryset(Course.objects.order_by('id'), CourseSerializer)))
+    results['memory'] = {'snapshot_bytes': snapshot_bytes, 'instance_bytes': instance_bytes}
+    command.stdout.write(f'full build  {results["full_build"]["median_ms"]:9.1f} ms'
+                         f'  snapshot {snapshot_bytes / 2**20:7.1f} MiB'
+                         f'  model instances {instance_bytes / 2**20:7.1f} MiB')
+
+    course_ids = list(Course.objects.order_by('id').values_list('id', flat=True)[:changed])
+
+    def rebuild():
+        Course.objects.filter(id__in=course_ids).update(version=F('version') + 1)
+        return build(snapshot)
+
+    results['incremental_build'] = measure(rebuild, repeat)
+    command.stdout.write(f'rebuild after {len(course_ids)} changed courses'
+                         f'  {results["incremental_build"]["median_ms"]:9.1f} ms')
+
+    factory = RequestFactory()
+    for ordering in ('id', '-price'):
+        request = Request(factory.get('/', {'ordering': ordering}))
+
+        def from_snapshot():
+            paginator = KeysetPagination(sort_keys=SORT_KEYS)
+            return snapshot.course_payloads(paginator.paginate_sorted(snapshot.courses, request))
+
+        def from_queryset():
+            paginator = KeysetPagination(sort_keys=SORT_KEYS)
+            page = paginator.paginate_queryset(optimize_queryset(Course.objects.all(), CourseSerializer), request)
+            return CourseSerializer(page, many=True).data
+
+        for name, page in (('snapshot', from_snapshot), ('queryset', from_queryset)):
+            stats = measure(page, repeat)
+            results[f'page_{name}_{ordering.lstrip("-")}'] = stats
+            command.stdout.write(f'{name:>9} page by {ordering:<7} {stats["median_ms"]:9.2f} ms')
+    return results
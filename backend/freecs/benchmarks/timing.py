@@ -0,0 +1,27 @@
+import statistics
+import time
+
+
+def measure(fn, repeat=5, warmup=1):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'min_ms': samples[0],
+        'median_ms': statistics.median(samples),
+        'max_ms': samples[-1],
+        'repeat': repeat,
+    }
+
+
+def percentile(sorted_samples, p):
+    # nearest-rank percentile of an already sorted list
+    if not sorted_samples:
+        return 0.0
+    rank = max(int(round(p / 100 * len(sorted_samples))) - 1, 0)
+    return sorted_samples[min(rank, len(sorted_samples) - 1)]
@@ -0,0 +1,283 @@
+from itertools import count, islice
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db.models import F, ForeignObjectRel
+from django.db.models.manager import BaseManager
+from rest_framework import fields, serializers
+from rest_framework.relations import PKOnlyObject
+
+from . import instrumentation
+from .fragments import FragmentCacheMixin, fragment
+
+# Compiled read-only serializers.
+#
+# compile_serializer() turns a serializer class into one generated function
+# per nested serializer, built once from the declared fields: a dict literal
+# whose values are plain attribute reads and conversions. Fields of the
+# CharField and IntegerField families become str()/int(), JSONField the value
+# itself, other fields call their own bound to_representation(). Fields that
+# don't read a model attribute (methods, dotted or '*' sources, reverse
+# accessors) go through DRF's get_attribute() as before. The output is the
+# stock serializer's, key order and None handling included, which
+# CompiledSerializerTests checks against the real serializers.
+#
+# .values(queryset) serializes straight from queryset.values() rows, nested
+# foreign keys included, and loads each many-to-many or reverse relation with
+# one extra values() query per chunk of rows, in the related model's ordering
+# (primary key when it has none). Only serializers made of model fields and
+# forward single relations can do that; others raise ImproperlyConfigured.
+#
+# Serializers with FragmentCacheMixin go through the fragment cache
+# (fragments.py) here too, so an instructor teaching hundreds of courses is
+# built once per version rather than once per course.
+#
+# serialize() counts as serializer time in the request instrumentation, like
+# Serializer.data does. FREECS_SERIALIZERS = {'COMPILED': False} sends serialize() and
+# serialize_values() back to the stock serializers.
+
+COMPILED = getattr(settings, 'FREECS_SERIALIZERS', {}).get('COMPILED', True)
+CHUNK_SIZE = 2000
+
+# field classes whose to_representation() is a builtin; exact classes only, subclasses may override it
+_BUILTINS = {
+    fields.CharField: 'str', fields.EmailField: 'str', fields.SlugField: 'str', fields.URLField: 'str',
+    fields.IntegerField: 'int',
+}
+PARENT = 'compiled_parent'
+
+_compiled = {}
+
+
+def _generic(field, instance):
+    # one field the way Serializer.to_representation() does it
+    attribute = field.get_attribute(instance)
+    check_for_none = attribute.pk if isinstance(attribute, PKOnlyObject) else attribute
+    return None if check_for_none is None else field.to_representation(attribute)
+
+
+def _related(instance, cache_name, attr):
+    # prefetched rows without building the related manager, which costs more than the rows' payloads
+    try:
+        return instance._prefetched_objects_cache[cache_name]
+    except (AttributeError, KeyError):
+        return getattr(instance, attr).all()
+
+
+def _model_field(serializer, field):
+    # the model field a serializer field reads as a plain attribute, or None
+    model = getattr(getattr(serializer, 'Meta', None), 'model', None)
+    if model is None or field.source == '*' or len(field.source_attrs) != 1:
+        return None
+    try:
+        model_field = model._meta.get_field(field.source)
+    except FieldDoesNotExist:
+        return None
+    if isinstance(model_field, ForeignObjectRel) and model_field.get_accessor_name() != field.source:
+        return None
+    return model_field
+
+
+def _nested(field):
+    if isinstance(field, serializers.ListSerializer) and isinstance(field.child, serializers.Serializer):
+        return field.child, True
+    if isinstance(field, serializers.Serializer):
+        return field, False
+    return None, False
+
+
+class _Source:
+    # generated code and the objects it refers to
+    def __init__(self):
+        self.namespace = {'_generic': _generic, '_related': _related, '_BaseManager': BaseManager}
+        self._names = count()
+
+    def local(self):
+        return f'v{next(self._names)}'
+
+    def ref(self, value, prefix='f'):
+        name = f'{prefix}{next(self._names)}'
+        self.namespace[name] = value
+        return name
+
+    def function(self, name, arg, expression):
+        code = f'def {name}({arg}):\n    return {expression}\n'
+        exec(compile(code, f'<compiled {name}>', 'exec'), self.namespace)
+        return self.namespace[name]
+
+
+def _convert(source, field, read):
+    # the representation of a scalar read by `read`
+    if isinstance(field, fields.JSONField) and not field.binary:
+        return read
+    value = source.local()
+    builtin = _BUILTINS.get(type(field))
+    if builtin is not None:
+        return f'(None if ({value} := {read}) is None else {builtin}({value}))'
+    convert = source.ref(field.to_representation)
+    if isinstance(field, fields.BooleanField):
+        return f'(None if ({value} := {read}) is None else {value} if {value}.__class__ is bool else {convert}({value}))'
+    return f'(None if ({value} := {read}) is None else {convert}({value}))'
+
+
+def _cached(serializer, function):
+    # the instance function, through the fragment cache when the serializer uses it
+    if not isinstance(serializer, FragmentCacheMixin):
+        return function
+    serializer_class = type(serializer)
+    return lambda instance: fragment(serializer_class, instance, function)
+
+
+def _instance_function(serializer):
+    source = _Source()
+    items = []
+    for field in serializer._readable_fields:
+        model_field = _model_field(serializer, field)
+        nested, many = _nested(field)
+        read = f'instance.{field.source}'
+        if (model_field is None or (nested is None and model_field.is_relation)
+                or (nested is not None and many != (model_field.many_to_many or model_field.one_to_many))
+                or (nested is not None and not many and not model_field.concrete)):
+            # reverse one-to-ones raise rather than return None when missing
+            expression = f'_generic({source.ref(field)}, instance)'
+        elif nested is None:
+            expression = _convert(source, field, read)
+        else:
+            child = source.ref(_cached(nested, _instance_function(nested)), 'c')
+            value = source.local()
+            if many and model_field.many_to_many and model_field.concrete:
+                expression = f'[{child}(item) for item in _related(instance, {model_field.name!r}, {field.source!r})]'
+            elif many:
+                items_of = f'({value}.all() if isinstance({value}, _BaseManager) else {value})'
+                expression = f'(None if ({value} := {read}) is None else [{child}(item) for item in {items_of}])'
+            else:
+                expression = f'(None if ({value} := {read}) is None else {child}({value}))'
+        items.append(f'{field.field_name!r}: {expression}')
+    return source.function(f'{type(serializer).__name__}_to_representation', 'instance', '{' + ', '.join(items) + '}')
+
+
+class _ValuesPlan:
+    # what .values() reads for a serializer, and the relations loaded beside it
+    def __init__(self, serializer):
+        self.source = _Source()
+        self.lookups = []
+        self.relations = []
+        expression = self._expression(serializer, '')
+        self.from_row = self.source.function(f'{type(serializer).__name__}_from_row', 'row', expression)
+        self.lookups = list(dict.fromkeys(self.lookups))
+
+    def _expression(self, serializer, prefix):
+        model = serializer.Meta.model
+        items = []
+        for field in serializer._readable_fields:
+            model_field = _model_field(serializer, field)
+            nested, many = _nested(field)
+            name = serializer.__class__.__name__ + '.' + field.field_name
+            if model_field is None:
+                raise ImproperlyConfigured(f'{name} does not read a model field, it can only be serialized '
+                                           f'from instances')
+            lookup = prefix + field.source
+            if nested is None:
+                if model_field.is_relation:
+                    raise ImproperlyConfigured(f'{name} is a related field, it can only be serialized from instances')
+                self.lookups.append(lookup)
+                expression = _convert(self.source, field, f'row[{lookup!r}]')
+            elif many:
+                if not (model_field.many_to_many or model_field.one_to_many):
+                    raise ImproperlyConfigured(f'{name} is a list of a single relation')
+                slot = f'{PARENT}_{len(self.relations)}'
+                parent = prefix[:-2] if prefix else model._meta.pk.name
+                self.lookups.append(parent)
+                self.relations.append((slot, parent, model_field, _ValuesPlan(nested)))
+                expression = f'row[{slot!r}]'
+            else:
+                if not model_field.concrete:
+                    raise ImproperlyConfigured(f'{name} is a reverse relation, it can only be serialized from '
+                                               f'instances')
+                expression = self._expression(nested, lookup + '__')
+                if model_field.null:
+                    self.lookups.append(lookup)
+                    expression = f'(None if row[{lookup!r}] is None else {expression})'
+            items.append(f'{field.field_name!r}: {expression}')
+        return '{' + ', '.join(items) + '}'
+
+    def load_relations(self, rows):
+        for slot, parent, model_field, plan in self.relations:
+            ids = {row[parent] for row in rows} - {None}
+            children = {}
+            if ids:
+                model = model_field.related_model
+                query_name = (model_field.field.name if isinstance(model_field, ForeignObjectRel)
+                              else model_field.related_query_name())
+                related = list(model._default_manager.filter(**{f'{query_name}__in': ids})
+                               .order_by(query_name, *(model._meta.ordering or ['pk']))
+                               .values(*plan.lookups, **{PARENT: F(query_name)}))
+                plan.load_relations(related)
+                for row in related:
+                    children.setdefault(row[PARENT], []).append(plan.from_row(row))
+            for row in rows:
+                row[slot] = children.get(row[parent], [])
+
+
+class CompiledSerializer:
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        serializer = serializer_class()
+        self.to_representation = _cached(serializer, _instance_function(serializer))
+        self._plan = None
+
+    def serialize(self, instances):
+        # ListSerializer(instances).data as a plain list
+        if isinstance(instances, BaseManager):
+            instances = instances.all()
+        to_representation = self.to_representation
+        return [to_representation(instance) for instance in instances]
+
+    @property
+    def plan(self):
+        if self._plan is None:
+            self._plan = _ValuesPlan(self.serializer_class())
+        return self._plan
+
+    @property
+    def supports_values(self):
+        try:
+            self.plan
+        except ImproperlyConfigured:
+            return False
+        return True
+
+    def values(self, queryset, chunk_size=CHUNK_SIZE):
+        # representations of a queryset's rows, read with .values(); prefetches are dropped
+        plan = self.plan
+        rows = queryset.prefetch_related(None).values(*plan.lookups).iterator(chunk_size=chunk_size)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                return
+            plan.load_relations(chunk)
+            for row in chunk:
+                yield plan.from_row(row)
+
+
+def compile_serializer(serializer_class):
+    # once per class, like field_cache.py and query_plan.py
+    compiled = _compiled.get(serializer_class)
+    if compiled is None:
+        compiled = _compiled[serializer_class] = CompiledSerializer(serializer_class)
+    return compiled
+
+
+def serialize(serializer_class, instances):
+    if COMPILED:
+        with instrumentation.timed_serializer():
+            return compile_serializer(serializer_class).serialize(instances)
+    return list(serializer_class(instances, many=True).data)
+
+
+def serialize_values(serializer_class, queryset, chunk_size=CHUNK_SIZE):
+    # the rows of queryset, from .values() when the serializer allows it
+    if COMPILED and compile_serializer(serializer_class).supports_values:
+        return compile_serializer(serializer_class).values(queryset, chunk_size)
+    serializer = serializer_class()
+    return (serializer.to_representation(instance) for instance in queryset.iterator(chunk_size=chunk_size))
@@ -0,0 +1,296 @@
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+from . import instrumentation
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Response compression negotiated from Accept-Encoding.
+#
+# zstd (with the zstandard package), brotli (with the brotli package) and
+# gzip are offered in that order when the client weighs them equally;
+# otherwise its q-values decide, and a client that accepts none of them gets
+# the plain body. Text, JSON and NDJSON bodies of at least MIN_SIZE bytes are
+# compressed; streamed bodies are compressed chunk by chunk and flushed after
+# each one, so the first rows still go out as soon as they're serialized.
+# A compressed body that comes out bigger than the original isn't used.
+#
+# Levels are per encoding, and ROUTES overrides them per URL name, or turns
+# compression off for a route with None:
+#
+#     MIDDLEWARE = ['freecs.compression.CompressionMiddleware', ...]  # near the top
+#     FREECS_COMPRESSION = {'MIN_SIZE': 1024, 'LEVELS': {'zstd': 3, 'br': 4, 'gzip': 6},
+#                           'ROUTES': {'enrollment-export': {'gzip': 1, 'zstd': 1}, 'metrics': None}}
+#
+# Responses with an ETag (see response_cache.py) keep their compressed body
+# in a small LRU, so a cached page isn't compressed again on every hit; the
+# ETag itself becomes weak, as Django's GZipMiddleware does. Bytes in, out
+# and saved and the time spent are recorded per route and encoding (see
+# instrumentation.py).
+
+_config = getattr(settings, 'FREECS_COMPRESSION', {})
+MIN_SIZE = _config.get('MIN_SIZE', 1024)
+LEVELS = {'zstd': 3, 'br': 4, 'gzip': 6, **_config.get('LEVELS', {})}
+ROUTES = _config.get('ROUTES', {})
+CACHE_ENTRIES = _config.get('CACHE_ENTRIES', 256)
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'application/javascript', 'application/xml',
+                      'image/svg+xml')
+
+
+#codecs
+class GzipStream:
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class ZstdStream:
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+class BrotliStream:
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+# preferred first
+CODECS = {}
+if zstandard is not None:
+    CODECS['zstd'] = ZstdStream
+if brotli is not None:
+    CODECS['br'] = BrotliStream
+CODECS['gzip'] = GzipStream
+
+
+def compress(data, encoding, level):
+    stream = CODECS[encoding](level)
+    return stream.compress(data) + stream.finish()
+
+
+#negotiation
+def accepted_encodings(header):
+    # {coding: q} from an Accept-Encoding header
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def route_levels(route):
+    # {encoding: level} the route may be sent with
+    override = ROUTES.get(route, {})
+    if override is None:
+        return {}
+    levels = {**LEVELS, **override}
+    return {encoding: levels[encoding] for encoding in CODECS if levels.get(encoding) is not None}
+
+
+def negotiate(header, levels):
+    accepted = accepted_encodings(header)
+    if 'x-gzip' in accepted and 'gzip' not in accepted:
+        accepted['gzip'] = accepted['x-gzip']
+    best, best_q = None, 0.0
+    for encoding in levels:
+        q = accepted.get(encoding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compressible(response):
+    content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+    return (content_type.startswith('text/') or content_type in COMPRESSIBLE_TYPES
+            or content_type.endswith('+json'))
+
+
+#compressed bodies of responses with an ETag
+class BodyCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def set(self, key, body):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+bodies = BodyCache(CACHE_ENTRIES)
+
+
+def _record(route, encoding, size_in, size_out, seconds):
+    labels = (route, encoding)
+    instrumentation.compress_seconds.observe(labels, seconds)
+    instrumentation.compression_input_bytes.inc(labels, size_in)
+    instrumentation.compression_output_bytes.inc(labels, size_out)
+    instrumentation.compression_saved_bytes.inc(labels, size_in - size_out)
+
+
+class _StreamTotals:
+    def __init__(self, route, encoding):
+        self.route, self.encoding = route, encoding
+        self.size_in = self.size_out = 0
+        self.seconds = 0.0
+
+    def step(self, stream, chunk, last=False):
+        start = time.perf_counter()
+        out = stream.compress(chunk) + (stream.finish() if last else stream.flush())
+        self.seconds += time.perf_counter() - start
+        self.size_in += len(chunk)
+        self.size_out += len(out)
+        if last:
+            _record(self.route, self.encoding, self.size_in, self.size_out, self.seconds)
+        return out
+
+
+def _compressed_stream(chunks, stream, totals):
+    for chunk in chunks:
+        out = totals.step(stream, chunk)
+        if out:
+            yield out
+    yield totals.step(stream, b'', last=True)
+
+
+async def _acompressed_stream(chunks, stream, totals):
+    async for chunk in chunks:
+        out = totals.step(stream, chunk)
+        if out:
+            yield out
+    yield totals.step(stream, b'', last=True)
+
+
+class CompressionMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process(request, await self.get_response(request))
+
+    def process(self, request, response):
+        if (response.status_code < 200 or response.status_code in (204, 206, 304)
+                or response.has_header('Content-Encoding') or not compressible(response)
+                or 'no-transform' in response.get('Cache-Control', '')):
+            return response
+        if not response.streaming and len(response.content) < MIN_SIZE:
+            return response
+        route = instrumentation.route_name(request)
+        levels = route_levels(route)
+        if not levels:
+            return response
+        patch_vary_headers(response, ['Accept-Encoding'])
+        encoding = negotiate(request.META.get('HTTP_ACCEPT_ENCODING', ''), levels)
+        if encoding is None:
+            return response
+        level = levels[encoding]
+
+        if response.streaming:
+            totals = _StreamTotals(route, encoding)
+            if response.is_async:
+                response.streaming_content = _acompressed_stream(response.streaming_content, CODECS[encoding](level),
+                                                                 totals)
+            else:
+                response.streaming_content = _compressed_stream(response.streaming_content, CODECS[encoding](level),
+                                                                totals)
+            del response['Content-Length']
+        else:
+            content = response.content
+            etag = response.get('ETag')
+            key = (etag, encoding, level) if etag else None
+            body = bodies.get(key) if key else None
+            seconds = 0.0
+            if body is None:
+                start = time.perf_counter()
+                body = compress(content, encoding, level)
+                seconds = time.perf_counter() - start
+                if key:
+                    bodies.set(key, body)
+            if len(body) >= len(content):
+                return response
+            _record(route, encoding, len(content), len(body), seconds)
+            response.content = body
+            response['Content-Length'] = str(len(body))
+
+        etag = response.get('ETag')
+        if etag and not etag.startswith('W/'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
@@ -0,0 +1,61 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Category, Course, Enrollment
+
+# Denormalized counters: Course.enrollment_count and Category.course_count.
+#
+# signals.py moves them by one on single writes. Anything that can't say
+# exactly what changed (removals, clears, bulk writes) recounts the affected
+# rows here with one UPDATE ... SET count = (SELECT COUNT(*) ...), and
+# `manage.py reconcile_counters` runs the same recount over whole tables.
+# course_count is part of the cached category fragment, so every change to it
+# bumps the category version as well, and enrollment_count changes bump the
+# course version the catalogue snapshot watches.
+
+BATCH_SIZE = 1000
+
+
+def _enrollment_total():
+    return Coalesce(Subquery(Enrollment.objects.filter(course=OuterRef('pk')).order_by()
+                             .values('course').annotate(n=Count('id')).values('n')), 0)
+
+
+def _course_total():
+    through = Course.category.through
+    return Coalesce(Subquery(through.objects.filter(category=OuterRef('pk')).order_by()
+                             .values('category').annotate(n=Count('id')).values('n')), 0)
+
+
+def _reconcile(queryset, field, total, extra=None, batch_size=BATCH_SIZE):
+    # only rows whose counter disagrees with the real count are written
+    drifted = list(queryset.annotate(actual=total).exclude(**{field: F('actual')})
+                   .order_by('id').values_list('id', flat=True))
+    for start in range(0, len(drifted), batch_size):
+        queryset.model.objects.filter(id__in=drifted[start:start + batch_size]).update(
+            **{field: total}, **(extra or {}))
+    return len(drifted)
+
+
+def reconcile_enrollment_counts(course_ids=None, batch_size=BATCH_SIZE):
+    courses = Course.objects.all() if course_ids is None else Course.objects.filter(id__in=list(course_ids))
+    return _reconcile(courses, 'enrollment_count', _enrollment_total(), {'version': F('version') + 1}, batch_size)
+
+
+def reconcile_course_counts(category_ids=None, batch_size=BATCH_SIZE):
+    categories = Category.objects.all() if category_ids is None else Category.objects.filter(id__in=list(category_ids))
+    return _reconcile(categories, 'course_count', _course_total(), {'version': F('version') + 1}, batch_size)
+
+
+def add_enrollments(course_id, n=1):
+    Course.objects.filter(pk=course_id).update(enrollment_count=F('enrollment_count') + n, version=F('version') + 1)
+
+
+def remove_enrollment(course_id):
+    Course.objects.filter(pk=course_id, enrollment_count__gt=0).update(
+        enrollment_count=F('enrollment_count') - 1, version=F('version') + 1)
+
+
+def add_courses(category_ids, n=1):
+    Category.objects.filter(id__in=list(category_ids)).update(
+        course_count=F('course_count') + n, version=F('version') + 1)
@@ -0,0 +1,118 @@
+import random
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.db.models import F, Q
+
+from . import counters, response_cache, tasks
+from .models import Course, Enrollment, Member
+
+# Enrollment write path, built for registration-day bursts.
+#
+# enroll() takes (member_id, course_id) pairs and commits them in batches of
+# BATCH_SIZE, one transaction per batch:
+#
+# 1. Pairs that are already enrolled come back as 'existing' and are skipped,
+#    so retries and double submits are harmless. The unique (member, course)
+#    constraint covers requests racing each other.
+# 2. Seats are taken per course with one conditional UPDATE of
+#    enrollment_count (WHERE capacity IS NULL OR enrollment_count + n <=
+#    capacity), in course id order so concurrent batches can't deadlock. When
+#    a course can't take all n, its row is locked and the seats left are
+#    handed out in request order; the rest come back as 'full'.
+# 3. The rows go in with one INSERT ... ON CONFLICT DO NOTHING, and the
+#    touched courses are recounted in the same transaction, so a pair that
+#    raced in from another batch isn't counted twice. The batch's
+#    refresh_course_scores task is queued in that transaction too.
+#
+# A batch that hits a lock timeout or deadlock is retried up to RETRIES times
+# with jittered backoff. The courses scope is invalidated once per call,
+# rather than the per-row work the Enrollment signals do for single saves.
+# Tuned with FREECS_ENROLLMENT = {'BATCH_SIZE': 500, 'RETRIES': 5}.
+
+CREATED = 'created'
+EXISTING = 'existing'
+FULL = 'full'
+INVALID = 'invalid'
+
+_config = getattr(settings, 'FREECS_ENROLLMENT', {})
+BATCH_SIZE = _config.get('BATCH_SIZE', 500)
+RETRIES = _config.get('RETRIES', 5)
+BACKOFF_SECONDS = 0.05
+
+
+def _take_seats(course_id, n):
+    # how many of n seats the course gives out
+    courses = Course.objects.filter(pk=course_id)
+    room = Q(capacity__isnull=True) | Q(capacity__gte=F('enrollment_count') + n)
+    if courses.filter(room).update(enrollment_count=F('enrollment_count') + n, version=F('version') + 1):
+        return n
+    row = courses.select_for_update().values_list('enrollment_count', 'capacity').first()
+    if row is None:
+        return 0
+    count, capacity = row
+    granted = max(min(capacity - count, n), 0)
+    if granted:
+        courses.update(enrollment_count=F('enrollment_count') + granted, version=F('version') + 1)
+    return granted
+
+
+def _commit_batch(pairs):
+    statuses = {}
+    member_ids = {member_id for member_id, _ in pairs}
+    course_ids = {course_id for _, course_id in pairs}
+    with transaction.atomic():
+        members = set(Member.objects.filter(id__in=member_ids).values_list('id', flat=True))
+        courses = set(Course.objects.filter(id__in=course_ids).values_list('id', flat=True))
+        existing = set(Enrollment.objects.filter(member_id__in=member_ids, course_id__in=course_ids)
+                       .values_list('member_id', 'course_id'))
+        wanted = defaultdict(list)
+        for pair in pairs:
+            member_id, course_id = pair
+            if member_id not in members or course_id not in courses:
+                statuses[pair] = INVALID
+            elif pair in existing:
+                statuses[pair] = EXISTING
+            else:
+                wanted[course_id].append(pair)
+
+        accepted = []
+        for course_id in sorted(wanted):
+            granted = _take_seats(course_id, len(wanted[course_id]))
+            for i, pair in enumerate(wanted[course_id]):
+                statuses[pair] = CREATED if i < granted else FULL
+            accepted.extend(wanted[course_id][:granted])
+
+        Enrollment.objects.bulk_create([Enrollment(member_id=member_id, course_id=course_id)
+                                        for member_id, course_id in accepted], ignore_conflicts=True)
+        enrolled = sorted({course_id for _, course_id in accepted})
+        counters.reconcile_enrollment_counts(enrolled)
+        if enrolled:
+            tasks.enqueue('refresh_course_scores', {'course_ids': enrolled})
+    return statuses
+
+
+def _commit_with_retries(pairs):
+    for attempt in range(RETRIES + 1):
+        try:
+            return _commit_batch(pairs)
+        except OperationalError:
+            # lock timeouts, deadlocks and serialization failures; the batch was rolled back
+            if attempt == RETRIES:
+                raise
+            time.sleep(BACKOFF_SECONDS * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def enroll(pairs, batch_size=None):
+    # {(member_id, course_id): status} for every distinct pair
+    pairs = list(dict.fromkeys(pairs))
+    batch_size = batch_size or BATCH_SIZE
+    statuses = {}
+    for start in range(0, len(pairs), batch_size):
+        statuses.update(_commit_with_retries(pairs[start:start + batch_size]))
+
+    if CREATED in statuses.values():
+        response_cache.invalidate('courses')
+    return statuses
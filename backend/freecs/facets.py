@@ -0,0 +1,151 @@
+from decimal import Decimal
+
+from django.conf import settings
+from rest_framework import serializers
+
+from .snapshot import from_cents, to_cents
+
+# Filters and facet counts for the course list, answered from the catalogue
+# snapshot without touching the database.
+#
+# Each filter becomes a bitset over snapshot course positions: categories use
+# the per-category bitsets (OR for ?category_match=any, AND for all),
+# instructors their course positions, and price/duration ranges OR the
+# precomputed slices of the column's sort order, with only the two partial
+# slices set bit by bit. The filters are ANDed. A selective result is pulled
+# out of the bitset and sorted; a broad one is walked in the sort order,
+# skipping rows not in the bitset, and a range on the sort field itself
+# narrows that walk to the range.
+#
+# Facet counts are popcounts of the result ANDed with each category's bitset
+# and each price bucket's bitset. A facet is counted under every filter except
+# its own, so each count says how many courses picking that value would give.
+# FREECS_FACETS = {'PRICE_BUCKETS': [10, 25, 50, 100, 250]} sets the bucket
+# edges; the first bucket starts at 0 and the last one is open.
+
+PRICE_BUCKETS = [Decimal(str(edge)) for edge in
+                 getattr(settings, 'FREECS_FACETS', {}).get('PRICE_BUCKETS', [10, 25, 50, 100, 250])]
+# results with at most 1/SPARSE_RATIO of the catalogue are extracted and sorted rather than walked
+SPARSE_RATIO = 64
+COURSE_SORT_KEYS = ['name', 'price', 'duration', 'enrollment_count', 'created_at']
+ORDERING_ALIASES = {'popularity': '-enrollment_count', 'newest': '-created_at'}
+
+
+class IdsField(serializers.ListField):
+    # ?category=1,2 or ?category=1&category=2
+    child = serializers.IntegerField(min_value=1)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = [data]
+        return super().to_internal_value([part for item in data for part in str(item).split(',') if part.strip()])
+
+
+class CourseFilterSerializer(serializers.Serializer):
+    category = IdsField(required=False)
+    category_match = serializers.ChoiceField(['any', 'all'], default='any')
+    instructor = IdsField(required=False)
+    min_price = serializers.DecimalField(max_digits=8, decimal_places=2, required=False)
+    max_price = serializers.DecimalField(max_digits=8, decimal_places=2, required=False)
+    min_duration = serializers.IntegerField(required=False)
+    max_duration = serializers.IntegerField(required=False)
+
+
+class Selection:
+    # the rows KeysetPagination.paginate_sorted walks for a filtered list
+    def __init__(self, table, mask, ranges):
+        self.table = table
+        self.mask = mask
+        self.ranges = ranges
+        self.keep = None
+
+    def order(self, field):
+        table = self.table
+        if self.mask.bit_count() * SPARSE_RATIO <= len(table):
+            return sorted(table.positions(self.mask), key=table.sort_key(field))
+        self.keep = table.member_test(self.mask)
+        if field in self.ranges:
+            start, stop = table.range_bounds(field, *self.ranges[field])
+            return table.order(field)[start:stop]
+        return table.order(field)
+
+    def __getattr__(self, name):
+        return getattr(self.table, name)
+
+
+class CourseFilter:
+    def __init__(self, category=None, category_match='any', instructor=None, min_price=None, max_price=None,
+                 min_duration=None, max_duration=None):
+        self.category = category
+        self.require_all = category_match == 'all'
+        self.instructor = instructor
+        self.ranges = {}
+        if min_price is not None or max_price is not None:
+            self.ranges['price'] = (None if min_price is None else to_cents(min_price),
+                                    None if max_price is None else to_cents(max_price))
+        if min_duration is not None or max_duration is not None:
+            self.ranges['duration'] = (min_duration, max_duration)
+
+    @classmethod
+    def from_request(cls, request):
+        serializer = CourseFilterSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return cls(**serializer.validated_data)
+
+    def masks(self, table):
+        # facet name -> bitset of the courses that filter lets through
+        masks = {}
+        if self.category:
+            masks['category'] = table.in_categories(self.category, self.require_all)
+        if self.instructor:
+            masks['instructor'] = table.mask_of(
+                position for instructor_id in self.instructor
+                for position in table.instructor_positions.get(instructor_id, ()))
+        for field, bounds in self.ranges.items():
+            masks[field] = table.range_mask(field, *bounds)
+        return masks
+
+    def select(self, table, masks):
+        if not masks:
+            return table
+        return Selection(table, _intersect(masks.values(), table), self.ranges)
+
+    def facets(self, snapshot, masks):
+        courses, categories = snapshot.courses, snapshot.categories
+        within = _intersect((mask for name, mask in masks.items() if name != 'category'), courses)
+        category_counts = []
+        for category_id, payload in zip(categories.ids, categories.payloads):
+            count = (courses.category_bits.get(category_id, 0) & within).bit_count()
+            if count:
+                category_counts.append({'id': category_id, 'name': payload['name'], 'count': count})
+        category_counts.sort(key=lambda facet: (-facet['count'], facet['id']))
+
+        within = _intersect((mask for name, mask in masks.items() if name != 'price'), courses)
+        price_counts = [
+            {'min': _price_text(low), 'max': _price_text(high), 'count': (bucket & within).bit_count()}
+            for (low, high), bucket in zip(_price_edges(), price_buckets(courses))
+        ]
+        return {'category': category_counts, 'price': price_counts}
+
+
+def _intersect(masks, table):
+    result = table.everything()
+    for mask in masks:
+        result &= mask
+    return result
+
+
+def _price_edges():
+    edges = [0, *(to_cents(edge) for edge in PRICE_BUCKETS)]
+    return list(zip(edges, [*edges[1:], None]))
+
+
+def _price_text(cents):
+    return None if cents is None else f'{from_cents(cents):f}'
+
+
+def price_buckets(table):
+    # bucket bitsets, [low, high) in cents, built once per snapshot
+    def build():
+        return [table.range_mask('price', low, None if high is None else high - 1) for low, high in _price_edges()]
+    return table.memo('price_buckets', build)
@@ -0,0 +1,18 @@
+import copy
+
+# ModelSerializer builds its fields from the model's meta on every
+# instantiation, and nested and many=True serializers are instantiated again
+# for each response. CachedFieldsMixin builds them once per class and gives
+# each instance deep copies, which is what DRF does with declared fields
+# anyway. Only for serializers whose fields don't depend on the instance,
+# context or request.
+
+_fields = {}
+
+
+class CachedFieldsMixin:
+    def get_fields(self):
+        serializer_class = type(self)
+        if serializer_class not in _fields:
+            _fields[serializer_class] = super().get_fields()
+        return copy.deepcopy(_fields[serializer_class])
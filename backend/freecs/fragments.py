@@ -0,0 +1,81 @@
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+# Per-object cache of serialized fragments.
+#
+# Instructor and Category rows carry a `version` column that signals.py bumps
+# whenever the row, or for instructors the member and user nested in their
+# payload, changes. A fragment is stored under (serializer, pk, version), so
+# a stale one can never be read back, and an instructor teaching hundreds of
+# courses is serialized once instead of once per course. The stock
+# serializers go through FragmentCacheMixin and the compiled ones (compiled.py)
+# through fragment(), under the same keys, since their output is the same.
+# The cache is in-process; other workers simply miss on the new version.
+#
+# Sized with FREECS_FRAGMENT_CACHE = {'MAX_ENTRIES': 20000}; 0 disables it.
+
+
+class FragmentCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.enabled = max_entries > 0
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return fragment
+
+    def set(self, key, fragment):
+        with self._lock:
+            self._entries[key] = fragment
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+fragments = FragmentCache(getattr(settings, 'FREECS_FRAGMENT_CACHE', {}).get('MAX_ENTRIES', 20000))
+
+
+@contextmanager
+def disabled():
+    previous, fragments.enabled = fragments.enabled, False
+    try:
+        yield
+    finally:
+        fragments.enabled = previous
+
+
+def fragment(serializer_class, instance, build):
+    # build(instance), or the fragment cached for this version of instance.
+    # The cached dict is shared between responses, so don't mutate it.
+    version = getattr(instance, 'version', None)
+    if not fragments.enabled or version is None:
+        return build(instance)
+    key = (serializer_class, instance.pk, version)
+    cached = fragments.get(key)
+    if cached is None:
+        cached = build(instance)
+        fragments.set(key, cached)
+    return cached
+
+
+class FragmentCacheMixin:
+    # for read-only ModelSerializers whose model has a `version` column
+    def to_representation(self, instance):
+        return fragment(self.__class__, instance, super().to_representation)
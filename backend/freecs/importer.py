@@ -0,0 +1,193 @@
+import csv
+import io
+
+from django.db import transaction
+from rest_framework import serializers
+from rest_framework.parsers import BaseParser
+
+from . import counters, enrollments, response_cache, tasks
+from .models import Category, Course, Instructor, Member
+
+# Bulk course and enrollment imports. Rows are validated chunk by chunk with a
+# list serializer that collects per-row errors instead of rejecting the whole
+# batch. Related ids are checked with one query per chunk, and valid rows are
+# written with bulk_create, plus bulk inserts into the M2M through tables,
+# inside one transaction per chunk. bulk_create skips model signals, so the
+# touched counters are recounted in the same transaction, and the search index
+# and recommendations are brought up to date by queued tasks. Enrollments go
+# through the enrollments.py pipeline, so seat limits hold and rows that are
+# already there are skipped rather than reported.
+
+CHUNK_SIZE = 1000
+LIST_SEPARATOR = ';'
+
+
+class ImportListSerializer(serializers.ListSerializer):
+    # unlike the stock ListSerializer, a bad row doesn't fail the batch
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            raise serializers.ValidationError({'non_field_errors': ['Expected a list of rows.']})
+        self.row_errors = {}
+        valid = []
+        for index, item in enumerate(data):
+            try:
+                valid.append((index, self.child.run_validation(item)))
+            except serializers.ValidationError as exc:
+                self.row_errors[index] = exc.detail
+        return valid
+
+
+class IdListField(serializers.ListField):
+    # accepts [1, 2] from JSON and "1;2" from CSV
+    child = serializers.IntegerField(min_value=1)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = [part.strip() for part in data.split(LIST_SEPARATOR) if part.strip()]
+        return super().to_internal_value(data)
+
+
+class CourseImportSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=200)
+    description = serializers.CharField(allow_blank=True)
+    price = serializers.DecimalField(max_digits=6, decimal_places=2)
+    duration = serializers.IntegerField()
+    category = IdListField(required=False, default=list)
+    instructors = IdListField(required=False, default=list)
+
+    class Meta:
+        list_serializer_class = ImportListSerializer
+
+
+class EnrollmentImportSerializer(serializers.Serializer):
+    member = serializers.IntegerField(min_value=1)
+    course = serializers.IntegerField(min_value=1)
+
+    class Meta:
+        list_serializer_class = ImportListSerializer
+
+
+class CSVParser(BaseParser):
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        return parse_csv(stream.read().decode('utf-8-sig'))
+
+
+def parse_csv(text):
+    return [dict(row) for row in csv.DictReader(io.StringIO(text))]
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.skipped = 0
+        self.errors = []
+
+    def add_errors(self, offset, row_errors):
+        for index, detail in sorted(row_errors.items()):
+            self.errors.append({'row': offset + index, 'errors': detail})
+
+    def as_dict(self):
+        return {'created': self.created, 'skipped': self.skipped, 'errors': self.errors}
+
+
+def _chunks(rows, chunk_size):
+    for offset in range(0, len(rows), chunk_size):
+        yield offset, rows[offset:offset + chunk_size]
+
+
+def _validate(serializer_class, chunk):
+    serializer = serializer_class(data=chunk, many=True)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data, dict(serializer.row_errors)
+
+
+def _existing(model, ids):
+    return set(model.objects.filter(id__in=ids).values_list('id', flat=True)) if ids else set()
+
+
+def import_courses(rows, chunk_size=CHUNK_SIZE):
+    result = ImportResult()
+    for offset, chunk in _chunks(rows, chunk_size):
+        valid, row_errors = _validate(CourseImportSerializer, chunk)
+        categories = _existing(Category, {i for _, row in valid for i in row['category']})
+        instructors = _existing(Instructor, {i for _, row in valid for i in row['instructors']})
+
+        accepted = []
+        for index, row in valid:
+            errors = {}
+            missing = sorted(set(row['category']) - categories)
+            if missing:
+                errors['category'] = [f'Invalid pk "{pk}" - object does not exist.' for pk in missing]
+            missing = sorted(set(row['instructors']) - instructors)
+            if missing:
+                errors['instructors'] = [f'Invalid pk "{pk}" - object does not exist.' for pk in missing]
+            if errors:
+                row_errors[index] = errors
+            else:
+                accepted.append(row)
+        result.add_errors(offset, row_errors)
+
+        with transaction.atomic():
+            courses = Course.objects.bulk_create([
+                Course(name=row['name'], description=row['description'], price=row['price'],
+                       duration=row['duration'])
+                for row in accepted
+            ])
+            Course.category.through.objects.bulk_create([
+                Course.category.through(course_id=course.id, category_id=category_id)
+                for course, row in zip(courses, accepted) for category_id in set(row['category'])
+            ])
+            Course.instructors.through.objects.bulk_create([
+                Course.instructors.through(course_id=course.id, instructor_id=instructor_id)
+                for course, row in zip(courses, accepted) for instructor_id in set(row['instructors'])
+            ])
+            counters.reconcile_course_counts({i for row in accepted for i in row['category']})
+        result.created += len(courses)
+        if courses:
+            tasks.enqueue('index_imported_courses', {'course_ids': [course.id for course in courses]})
+
+    if result.created:
+        response_cache.invalidate('categories', 'courses')
+    return result
+
+
+def import_enrollments(rows, chunk_size=CHUNK_SIZE):
+    result = ImportResult()
+    for offset, chunk in _chunks(rows, chunk_size):
+        valid, row_errors = _validate(EnrollmentImportSerializer, chunk)
+        members = _existing(Member, {row['member'] for _, row in valid})
+        courses = _existing(Course, {row['course'] for _, row in valid})
+
+        accepted = []
+        for index, row in valid:
+            errors = {}
+            if row['member'] not in members:
+                errors['member'] = [f'Invalid pk "{row["member"]}" - object does not exist.']
+            if row['course'] not in courses:
+                errors['course'] = [f'Invalid pk "{row["course"]}" - object does not exist.']
+            if errors:
+                row_errors[index] = errors
+            else:
+                accepted.append((index, (row['member'], row['course'])))
+
+        statuses = enrollments.enroll([pair for _, pair in accepted], batch_size=chunk_size)
+        seen = set()
+        for index, pair in accepted:
+            outcome = statuses[pair]
+            if outcome == enrollments.FULL:
+                row_errors[index] = {'course': ['This course is full.']}
+            elif outcome == enrollments.CREATED and pair not in seen:
+                result.created += 1
+            else:
+                result.skipped += 1
+            seen.add(pair)
+        result.add_errors(offset, row_errors)
+    return result
+
+
+IMPORTERS = {
+    'courses': import_courses,
+    'enrollments': import_enrollments,
+}
@@ -0,0 +1,345 @@
+import hmac
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, HttpResponseForbidden
+
+# Per-request latency and SQL instrumentation.
+#
+# InstrumentationMiddleware times every request and, for a sampled share of
+# them, opens a RequestStats in a context variable. A wrapper installed on
+# every database connection adds each query's time and fingerprint to the
+# current stats, and the outermost `serializer.data` or compiled serialize()
+# adds serializer time.
+# Both wrappers do nothing when no request is being sampled. Results go into
+# in-process histograms labelled by route, which metrics_view serves in the
+# Prometheus text format. A request that repeats one query shape at least
+# N_PLUS_ONE_THRESHOLD times is logged as a likely N+1.
+#
+# Enable with 'freecs.instrumentation.InstrumentationMiddleware' in MIDDLEWARE.
+# Tuned with FREECS_METRICS = {'SAMPLE_RATE': 1.0, 'N_PLUS_ONE_THRESHOLD': 10,
+# 'TOKEN': None}. The metrics endpoint answers staff users, like the response
+# cache stats, and scrapers sending "Authorization: Bearer <TOKEN>" when TOKEN
+# is set; everyone else gets a 403.
+
+logger = logging.getLogger(__name__)
+
+_config = getattr(settings, 'FREECS_METRICS', {})
+SAMPLE_RATE = _config.get('SAMPLE_RATE', 1.0)
+N_PLUS_ONE_THRESHOLD = _config.get('N_PLUS_ONE_THRESHOLD', 10)
+TOKEN = _config.get('TOKEN')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+ENCODE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+POOL_WAIT_BUCKETS = (0.0001, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+#metrics registry
+class Histogram:
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        for key, counts, total, count in sorted(series):
+            labels = _labels(self.labels, key)
+            for bound, n in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{_labels(self.labels, key, le=bound)} {n}')
+            lines.append(f'{self.name}_bucket{_labels(self.labels, key, le="+Inf")} {count}')
+            lines.append(f'{self.name}_sum{labels} {total:.6f}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+class CounterMetric:
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = Counter()
+        self._lock = threading.Lock()
+
+    def inc(self, label_values, amount=1):
+        with self._lock:
+            self._values[label_values] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f'{self.name}{_labels(self.labels, key)} {value}' for key, value in values)
+        return lines
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, le=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+requests_total = CounterMetric('freecs_requests_total', 'Requests handled.', ('route', 'method', 'status'))
+request_seconds = Histogram('freecs_request_duration_seconds', 'Wall time per request.',
+                            ('route', 'method'), LATENCY_BUCKETS)
+sql_queries = Histogram('freecs_request_sql_queries', 'SQL queries per sampled request.',
+                        ('route', 'method'), QUERY_BUCKETS)
+sql_seconds = Histogram('freecs_request_sql_seconds', 'Total SQL time per sampled request.',
+                        ('route', 'method'), LATENCY_BUCKETS)
+serializer_seconds = Histogram('freecs_request_serializer_seconds', 'Serializer time per sampled request.',
+                               ('route', 'method'), LATENCY_BUCKETS)
+n_plus_one_total = CounterMetric('freecs_n_plus_one_total', 'Sampled requests that repeated one query shape '
+                                 'at least N_PLUS_ONE_THRESHOLD times.', ('route',))
+# rendering.py and compression.py, recorded on every request
+render_seconds = Histogram('freecs_render_seconds', 'JSON encode time per response.', ('route', 'encoder'),
+                           ENCODE_BUCKETS)
+rendered_bytes = CounterMetric('freecs_rendered_bytes_total', 'JSON bytes rendered.', ('route', 'encoder'))
+compress_seconds = Histogram('freecs_compress_seconds', 'Compression time per response.', ('route', 'encoding'),
+                             ENCODE_BUCKETS)
+compression_input_bytes = CounterMetric('freecs_compression_input_bytes_total', 'Body bytes before compression.',
+                                        ('route', 'encoding'))
+compression_output_bytes = CounterMetric('freecs_compression_output_bytes_total', 'Body bytes sent compressed.',
+                                         ('route', 'encoding'))
+compression_saved_bytes = CounterMetric('freecs_compression_saved_bytes_total', 'Body bytes compression saved.',
+                                        ('route', 'encoding'))
+# pooling.py
+pool_wait_seconds = Histogram('freecs_db_pool_wait_seconds', 'Time spent waiting for a pooled connection.',
+                              ('alias',), POOL_WAIT_BUCKETS)
+pool_timeouts = CounterMetric('freecs_db_pool_timeouts_total', 'Connection requests that timed out waiting.',
+                              ('alias',))
+pool_connections_opened = CounterMetric('freecs_db_pool_connections_opened_total', 'Database connections opened.',
+                                        ('alias',))
+pool_connections_closed = CounterMetric('freecs_db_pool_connections_closed_total', 'Pooled connections closed.',
+                                        ('alias', 'reason'))
+METRICS = [requests_total, request_seconds, sql_queries, sql_seconds, serializer_seconds, n_plus_one_total,
+           render_seconds, rendered_bytes, compress_seconds, compression_input_bytes, compression_output_bytes,
+           compression_saved_bytes, pool_wait_seconds, pool_timeouts, pool_connections_opened,
+           pool_connections_closed]
+
+
+def render():
+    from . import pooling, response_cache
+    from .fragments import fragments
+
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    # the response and fragment caches keep their own counters
+    for name, value in response_cache.stats.as_dict().items():
+        lines.append(f'# TYPE freecs_response_cache_{name}_total counter')
+        lines.append(f'freecs_response_cache_{name}_total {value}')
+    for name in ('hits', 'misses'):
+        lines.append(f'# TYPE freecs_fragment_cache_{name}_total counter')
+        lines.append(f'freecs_fragment_cache_{name}_total {getattr(fragments, name)}')
+    # pool saturation: connections open, in use and waited for, against the pool size
+    pools = sorted(pooling.pool_stats().items())
+    for name in ('size', 'in_use', 'idle', 'waiting', 'max_size') if pools else ():
+        lines.append(f'# TYPE freecs_db_pool_{name} gauge')
+        lines.extend(f'freecs_db_pool_{name}{_labels(("alias",), (alias,))} {stats[name]}' for alias, stats in pools)
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    for metric in METRICS:
+        metric.clear()
+
+
+#per-request stats
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.fingerprints = Counter()
+
+    def duplicates(self, threshold):
+        return [(sql, n) for sql, n in self.fingerprints.most_common() if n >= threshold]
+
+
+_current = ContextVar('freecs_request_stats', default=None)
+
+_literals = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_in_lists = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+
+
+def fingerprint(sql):
+    # queries that differ only in literal values or IN-list length share a fingerprint
+    return _in_lists.sub('(...)', _literals.sub('?', sql))
+
+
+def record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.sql_time += time.perf_counter() - start
+        stats.queries += 1
+        stats.fingerprints[fingerprint(sql)] += 1
+
+
+def install_query_recorder(sender=None, connection=None, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def timed_serializer():
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    # nested serializers run inside the outermost one, count it once
+    stats.serializer_depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serializer_depth -= 1
+        if not stats.serializer_depth:
+            stats.serializer_time += time.perf_counter() - start
+
+
+def _timed_data(prop):
+    def data(self):
+        with timed_serializer():
+            return prop.fget(self)
+    return property(data)
+
+
+def install_serializer_timer():
+    from rest_framework import serializers
+
+    for cls in (serializers.Serializer, serializers.ListSerializer):
+        if not getattr(cls.__dict__['data'].fget, '_freecs_timed', False):
+            timed = _timed_data(cls.__dict__['data'])
+            timed.fget._freecs_timed = True
+            cls.data = timed
+
+
+def install():
+    # connections opened from now on, in any thread, get the wrapper from connection_created
+    connection_created.connect(install_query_recorder, dispatch_uid='freecs.instrumentation')
+    for connection in connections.all(initialized_only=True):
+        install_query_recorder(connection=connection)
+    install_serializer_timer()
+
+
+#middleware
+def route_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        install()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats, token, start = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, stats, start)
+        return response
+
+    async def __acall__(self, request):
+        stats, token, start = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, stats, start)
+        return response
+
+    def start(self):
+        stats = RequestStats() if random.random() < SAMPLE_RATE else None
+        return stats, _current.set(stats), time.perf_counter()
+
+    def finish(self, request, response, stats, start):
+        # streamed bodies are timed to the first byte, their later queries aren't seen
+        elapsed = time.perf_counter() - start
+        route, method = route_name(request), request.method
+        requests_total.inc((route, method, str(response.status_code)))
+        request_seconds.observe((route, method), elapsed)
+        if stats is None:
+            return
+        sql_queries.observe((route, method), stats.queries)
+        sql_seconds.observe((route, method), stats.sql_time)
+        serializer_seconds.observe((route, method), stats.serializer_time)
+        duplicates = stats.duplicates(N_PLUS_ONE_THRESHOLD)
+        if duplicates:
+            n_plus_one_total.inc((route,))
+            sql, count = duplicates[0]
+            logger.warning('Possible N+1 on %s %s: %d queries, %d like %r', method, route, stats.queries, count, sql,
+                           extra={'route': route, 'method': method, 'queries': stats.queries,
+                                  'sql_seconds': round(stats.sql_time, 6), 'duplicates': duplicates[:5]})
+
+
+#endpoint
+def _may_scrape(request):
+    if TOKEN and hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {TOKEN}'.encode()):
+        return True
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_active and user.is_staff)
+
+
+def metrics_view(request):
+    if not _may_scrape(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
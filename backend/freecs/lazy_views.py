@@ -0,0 +1,75 @@
+from importlib import import_module
+
+from django.urls.resolvers import RoutePattern, URLPattern
+from django.utils.functional import cached_property
+
+# URL routes whose views are imported on first dispatch.
+#
+# urls.py names each view by dotted path, so loading the URLconf (which
+# management commands and every worker do at startup) imports no view
+# module, and with it none of SimpleJWT, DRF's renderers or the mail and
+# token modules the views pull in. The first request routed to a LazyView
+# imports its module and calls as_view() once; attribute lookups Django makes
+# before calling the view (csrf_exempt, view_class, the coroutine marker) do
+# the same, so CSRF exemption and async views behave as if imported eagerly.
+# reverse() only needs the route and name and never imports anything.
+#
+# preload() imports every registered view, for servers that fork workers
+# from a warmed parent.
+
+_registry = []
+
+
+class LazyView:
+    def __init__(self, path, **initkwargs):
+        self.path = path
+        self.initkwargs = initkwargs
+
+    @cached_property
+    def view(self):
+        module_path, name = self.path.rsplit('.', 1)
+        target = getattr(import_module(module_path), name)
+        # class-based views go through as_view(), plain functions are used as they are
+        return target.as_view(**self.initkwargs) if hasattr(target, 'as_view') else target
+
+    @property
+    def loaded(self):
+        return 'view' in self.__dict__
+
+    def __call__(self, request, *args, **kwargs):
+        return self.view(request, *args, **kwargs)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.view, name)
+
+    def __repr__(self):
+        return f'<LazyView {self.path}>'
+
+
+class LazyURLPattern(URLPattern):
+    @cached_property
+    def lookup_str(self):
+        # what the resolver indexes callbacks by; the default reads the view's module
+        return self.callback.path
+
+
+def lazy_path(route, view_path, kwargs=None, name=None, **initkwargs):
+    view = LazyView(view_path, **initkwargs)
+    _registry.append(view)
+    return LazyURLPattern(RoutePattern(route, name=name, is_endpoint=True), view, kwargs or {}, name)
+
+
+def preload():
+    for view in _registry:
+        view.view
+    return len(_registry)
+
+
+def view_modules():
+    return sorted({view.path.rsplit('.', 1)[0] for view in _registry})
+
+
+def loaded_views():
+    return [view.path for view in _registry if view.loaded]
@@ -0,0 +1,302 @@
+import os
+import threading
+import time
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hasher, identify_hasher, make_password
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.exceptions import APIException, Throttled
+from rest_framework.throttling import BaseThrottle
+
+from . import instrumentation
+
+# Login pipeline used by LoginView.
+#
+# 1. A sliding-window limiter turns away clients that made IP_LIMIT attempts,
+#    or usernames that had USERNAME_LIMIT failures, within the window. This
+#    happens before any hashing, so credential stuffing costs no CPU.
+# 2. The password check runs in a process pool of HASH_WORKERS processes. At
+#    most MAX_PENDING checks are queued, and anything beyond that gets a 503
+#    instead of piling up, so a burst of logins can't starve other requests.
+#    A check keeps its slot until it finishes, even when the request gave up
+#    on it after HASH_TIMEOUT seconds with a 503; a pool whose worker died is
+#    replaced. Unknown usernames are checked against a dummy hash to take the
+#    same time.
+# 3. If the stored hash is outdated, because of a different hasher or a new
+#    work factor, the pool also computes the new hash and it's saved. A
+#    rehash changes the token version, so earlier access tokens are revoked.
+#
+# The checks follow ModelBackend: username and password, active users only.
+# Tuned with FREECS_LOGIN = {'HASH_WORKERS': 2, 'MAX_PENDING': 16,
+# 'HASH_TIMEOUT': 10, 'IP_LIMIT': (30, 60), 'USERNAME_LIMIT': (5, 300),
+# 'LIMITER_BACKEND': 'memory', 'LIMITER_MAX_KEYS': 100000, 'CACHE_ALIAS': 'default',
+# 'PBKDF2_ITERATIONS': None}. The limits are
+# (attempts, seconds). HASH_WORKERS 0 hashes in the request thread. The
+# 'memory' limiter backend tracks at most LIMITER_MAX_KEYS IPs and usernames
+# per process, so stuffing with random usernames can't grow it without bound;
+# the 'cache' backend shares windows between workers through a Django cache.
+
+_config = getattr(settings, 'FREECS_LOGIN', {})
+HASH_WORKERS = _config.get('HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2))
+MAX_PENDING = _config.get('MAX_PENDING', max(HASH_WORKERS, 1) * 8)
+HASH_TIMEOUT = _config.get('HASH_TIMEOUT', 10)
+IP_LIMIT = tuple(_config.get('IP_LIMIT', (30, 60)))
+USERNAME_LIMIT = tuple(_config.get('USERNAME_LIMIT', (5, 300)))
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    # list first in PASSWORD_HASHERS; changing PBKDF2_ITERATIONS rehashes users as they log in
+    iterations = _config.get('PBKDF2_ITERATIONS') or PBKDF2PasswordHasher.iterations
+
+
+class LoginBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many logins in progress, try again shortly.'
+    default_code = 'login_busy'
+
+
+#metrics
+hash_seconds = instrumentation.Histogram('freecs_login_hash_seconds', 'Password hash time per login attempt.',
+                                         (), instrumentation.LATENCY_BUCKETS)
+attempts_total = instrumentation.CounterMetric('freecs_login_attempts_total', 'Login attempts by outcome.',
+                                               ('result',))
+instrumentation.METRICS.extend([hash_seconds, attempts_total])
+
+
+#sliding-window limiter
+class MemoryWindowBackend:
+    # per process. Keys are kept least recently hit first; once there are twice as many as at the
+    # last sweep, keys without a hit left in their window are dropped, and past max_keys the least
+    # recently hit ones too, which only loosens their limits
+    MIN_SWEEP = 1024
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._hits = {}
+        self._sweep_at = min(self.MIN_SWEEP, max_keys)
+        self._lock = threading.Lock()
+
+    def recent(self, key, now, window):
+        with self._lock:
+            _, hits = self._hits.get(key, (window, None))
+            if not hits:
+                return []
+            while hits and hits[0] <= now - window:
+                hits.popleft()
+            if not hits:
+                del self._hits[key]
+            return list(hits)
+
+    def add(self, key, now, window):
+        with self._lock:
+            _, hits = self._hits.pop(key, (window, deque()))
+            hits.append(now)
+            self._hits[key] = (window, hits)
+            if len(self._hits) >= self._sweep_at:
+                self._sweep(now)
+
+    def _sweep(self, now):
+        for key, (window, hits) in list(self._hits.items()):
+            if hits[-1] <= now - window:
+                del self._hits[key]
+        for key in list(islice(self._hits, max(len(self._hits) - self.max_keys * 3 // 4, 0))):
+            del self._hits[key]
+        self._sweep_at = min(max(self.MIN_SWEEP, 2 * len(self._hits)), self.max_keys)
+
+    def clear(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+
+    def reset(self):
+        with self._lock:
+            self._hits.clear()
+
+
+class CacheWindowBackend:
+    # shared through a Django cache; concurrent adds can lose a hit, which only loosens the limit
+    def __init__(self, alias='default'):
+        self.cache = caches[alias]
+
+    def recent(self, key, now, window):
+        return [hit for hit in self.cache.get(key, []) if hit > now - window]
+
+    def add(self, key, now, window):
+        self.cache.set(key, self.recent(key, now, window) + [now], int(window) + 1)
+
+    def clear(self, key):
+        self.cache.delete(key)
+
+    def reset(self):
+        pass
+
+
+class SlidingWindowLimiter:
+    def __init__(self, name, limit, window, backend):
+        self.name = name
+        self.limit = limit
+        self.window = window
+        self.backend = backend
+
+    def _key(self, ident):
+        return f'freecs:login:{self.name}:{ident}'
+
+    def retry_after(self, ident, now=None):
+        # seconds until ident may try again, 0 if it may now
+        now = time.time() if now is None else now
+        hits = self.backend.recent(self._key(ident), now, self.window)
+        if len(hits) < self.limit:
+            return 0
+        return hits[-self.limit] + self.window - now
+
+    def hit(self, ident, now=None):
+        self.backend.add(self._key(ident), time.time() if now is None else now, self.window)
+
+    def clear(self, ident):
+        self.backend.clear(self._key(ident))
+
+
+def _window_backend():
+    if _config.get('LIMITER_BACKEND', 'memory') == 'cache':
+        return CacheWindowBackend(_config.get('CACHE_ALIAS', 'default'))
+    return MemoryWindowBackend(_config.get('LIMITER_MAX_KEYS', 100000))
+
+
+_backend = _window_backend()
+ip_limiter = SlidingWindowLimiter('ip', *IP_LIMIT, _backend)
+username_limiter = SlidingWindowLimiter('username', *USERNAME_LIMIT, _backend)
+
+
+#hashing pool
+def _init_worker(settings_module):
+    # spawned workers start without Django set up; forked ones already have it
+    if settings_module:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+def check_password_hash(password, encoded):
+    # (matches, new hash if the stored one is outdated, seconds spent)
+    start = time.perf_counter()
+    hasher = identify_hasher(encoded)
+    ok = hasher.verify(password, encoded)
+    new_encoded = None
+    if ok and (hasher.algorithm != get_hasher().algorithm or hasher.must_update(encoded)):
+        new_encoded = make_password(password)
+    return ok, new_encoded, time.perf_counter() - start
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(MAX_PENDING)
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=HASH_WORKERS, initializer=_init_worker,
+                                        initargs=(os.environ.get('DJANGO_SETTINGS_MODULE'),))
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def _discard_pool(broken):
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    # cancelled checks release their slots through their done callbacks
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def _busy(result):
+    attempts_total.inc((result,))
+    return LoginBusy()
+
+
+def verify(password, encoded):
+    if HASH_WORKERS <= 0:
+        return check_password_hash(password, encoded)
+    if not _pending.acquire(blocking=False):
+        raise _busy('busy')
+    pool = get_pool()
+    try:
+        future = pool.submit(check_password_hash, password, encoded)
+    except BrokenProcessPool:
+        _pending.release()
+        _discard_pool(pool)
+        raise _busy('pool_broken')
+    except BaseException:
+        _pending.release()
+        raise
+    # the slot stays taken while the worker is still hashing, even after this request stops waiting
+    future.add_done_callback(lambda _: _pending.release())
+    try:
+        return future.result(timeout=HASH_TIMEOUT)
+    except FutureTimeoutError:
+        raise _busy('timeout')
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        raise _busy('pool_broken')
+
+
+_dummy = []
+
+
+def dummy_hash():
+    if not _dummy:
+        _dummy.append(make_password('freecs-login-timing-equalizer'))
+    return _dummy[0]
+
+
+#pipeline
+def client_ip(request):
+    # honours REST_FRAMEWORK['NUM_PROXIES'] like DRF's throttles
+    return BaseThrottle().get_ident(request)
+
+
+def _throttle(result, wait):
+    attempts_total.inc((result,))
+    raise Throttled(wait=max(wait, 1))
+
+
+def authenticate_login(request, username, password):
+    ip = client_ip(request)
+    ident = username.lower()
+    wait = ip_limiter.retry_after(ip)
+    if wait:
+        _throttle('throttled_ip', wait)
+    wait = username_limiter.retry_after(ident)
+    if wait:
+        _throttle('throttled_username', wait)
+    ip_limiter.hit(ip)
+
+    user = User._default_manager.filter(username=username).first()
+    usable = user is not None and user.has_usable_password()
+    ok, new_encoded, seconds = verify(password, user.password if usable else dummy_hash())
+    hash_seconds.observe((), seconds)
+
+    if not (usable and ok and user.is_active):
+        username_limiter.hit(ident)
+        attempts_total.inc(('failed',))
+        return None
+    username_limiter.clear(ident)
+    if new_encoded:
+        user.password = new_encoded
+        user.save(update_fields=['password'])
+    attempts_total.inc(('ok',))
+    return user
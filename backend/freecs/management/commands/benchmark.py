@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from ...benchmarks import SUITES, load_suite, report
+
+
+def row_count(value):
+    # 1000, 10k, 1m
+    units = {'k': 1000, 'm': 1000000}
+    suffix = value[-1:].lower()
+    try:
+        if suffix in units:
+            return int(float(value[:-1]) * units[suffix])
+        return int(value)
+    except ValueError:
+        raise CommandError(f'invalid row count {value!r}')
+
+
+class Command(BaseCommand):
+    help = ('Run a performance benchmark against a throwaway copy of the database. Save runs with --output, '
+            'diff them with --compare and fail on regressions with --check.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=sorted(SUITES))
+        parser.add_argument('--rows', type=row_count, help='table size, e.g. 1k, 100k or 1m; defaults per suite')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keepdb', action='store_true',
+                            help='keep the seeded benchmark database between runs')
+        parser.add_argument('--output', help='write the results as JSON to this file')
+        parser.add_argument('--compare', help='earlier --output file to diff against')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='relative slowdown --compare accepts before failing')
+        parser.add_argument('--check', action='store_true', help='fail if a stored threshold is exceeded')
+        parser.add_argument('--thresholds', default=report.THRESHOLDS_FILE, help='thresholds file for --check')
+        for name in SUITES:
+            load_suite(name).add_arguments(parser)
+
+    def handle(self, *args, suite, keepdb=False, output=None, compare=None, tolerance=0.2, check=False,
+               thresholds=report.THRESHOLDS_FILE, **options):
+        if options.get('rows') is None:
+            options.pop('rows', None)
+        # benchmarks seed large tables, so they never touch the real database
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keepdb)
+        try:
+            results = load_suite(suite).run(self, **options)
+        except KeyboardInterrupt:
+            raise CommandError('benchmark interrupted')
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+
+        if output:
+            report.save(output, suite, {key: options[key] for key in ('rows', 'repeat', 'seed') if key in options},
+                        results)
+            self.stdout.write(f'results written to {output}')
+
+        failures = []
+        if compare:
+            baseline = report.load(compare)
+            if baseline['suite'] != suite:
+                raise CommandError(f'{compare} holds a {baseline["suite"]} run, not {suite}')
+            for path, before, after in report.compare(baseline['results'], results, tolerance):
+                failures.append(f'{path}: {before:.2f} -> {after:.2f}')
+        if check:
+            limits = report.load(thresholds).get(suite, {})
+            for path, limit, value in report.check_thresholds(results, limits):
+                failures.append(f'{path}: {value:.2f} (limit {limit})')
+        if failures:
+            raise CommandError('performance regressions:\n  ' + '\n  '.join(failures))
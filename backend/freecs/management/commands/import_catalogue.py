@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from ...importer import CHUNK_SIZE, IMPORTERS, parse_csv
+
+
+class Command(BaseCommand):
+    help = 'Bulk import courses or enrollments from a JSON (list of objects) or CSV file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS))
+        parser.add_argument('path')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument('--errors', help='write per-row errors as JSON to this file')
+
+    def handle(self, *args, kind, path, chunk_size=CHUNK_SIZE, errors=None, **options):
+        with open(path, encoding='utf-8-sig') as f:
+            rows = parse_csv(f.read()) if path.lower().endswith('.csv') else json.load(f)
+        try:
+            result = IMPORTERS[kind](rows, chunk_size=chunk_size)
+        except ValidationError as exc:
+            raise CommandError(exc.detail)
+
+        self.stdout.write(self.style.SUCCESS(f'created {result.created} {kind}'))
+        if result.errors:
+            self.stdout.write(self.style.WARNING(f'{len(result.errors)} row(s) rejected'))
+            if errors:
+                with open(errors, 'w') as f:
+                    json.dump(result.errors, f, indent=2)
+            else:
+                for error in result.errors[:20]:
+                    self.stdout.write(f'  row {error["row"]}: {error["errors"]}')
@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...benchmarks.load import run_load
+
+
+class Command(BaseCommand):
+    help = ('Drive concurrent load at one or more running deployments and compare requests/sec and latency, '
+            'e.g. loadtest wsgi=http://127.0.0.1:8000/courses/ asgi=http://127.0.0.1:8001/async/courses/')
+
+    def add_arguments(self, parser):
+        parser.add_argument('targets', nargs='+', help='label=url pairs')
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--header', action='append', default=[], help='extra "Name: value" request header')
+        parser.add_argument('--output', help='write the results as JSON to this file')
+
+    def handle(self, *args, targets, concurrency, requests, timeout, header, output=None, **options):
+        headers = dict(h.split(':', 1) for h in header)
+        headers = {name.strip(): value.strip() for name, value in headers.items()}
+        results = {}
+        for target in targets:
+            label, sep, url = target.partition('=')
+            if not sep:
+                raise CommandError(f'expected label=url, got {target!r}')
+            result = run_load(url, concurrency=concurrency, total=requests, timeout=timeout, headers=headers)
+            results[label] = result
+            self.stdout.write(f'{label:>8}  {result["rps"]:9.1f} req/s  p50 {result["p50_ms"]:8.2f} ms'
+                              f'  p99 {result["p99_ms"]:8.2f} ms  errors {result["errors"]}')
+        if output:
+            with open(output, 'w') as f:
+                json.dump(results, f, indent=2)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from ...recommendations import rebuild_all
+
+
+class Command(BaseCommand):
+    help = 'Recompute every member\'s preferred-course ranking. Run periodically so recency scores stay fresh.'
+
+    def handle(self, *args, **options):
+        rebuild_all()
+        self.stdout.write(self.style.SUCCESS('Recommendations rebuilt.'))
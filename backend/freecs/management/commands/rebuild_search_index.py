@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from ...search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the course search index from scratch, e.g. after bulk imports that skip model signals.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, batch_size=500, **options):
+        rebuild_index(batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from ...skills import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the instructor skill index from scratch, e.g. after bulk imports that skip model signals.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, batch_size=2000, **options):
+        rebuild_index(batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS('Skill index rebuilt.'))
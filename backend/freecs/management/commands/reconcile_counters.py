@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from ...counters import BATCH_SIZE, reconcile_course_counts, reconcile_enrollment_counts
+
+
+class Command(BaseCommand):
+    help = 'Recount Course.enrollment_count and Category.course_count, rewriting only the rows that drifted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, batch_size=BATCH_SIZE, **options):
+        courses = reconcile_enrollment_counts(batch_size=batch_size)
+        categories = reconcile_course_counts(batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Fixed {courses} course enrollment count(s) and {categories} category course count(s).'))
@@ -0,0 +1,26 @@
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from ...tasks import BATCH_SIZE, run_pending
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks (emails and other slow side effects).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='drain the due tasks once and exit')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--sleep', type=float, default=1.0, help='seconds to wait when the queue is empty')
+
+    def handle(self, *args, once=False, batch_size=BATCH_SIZE, sleep=1.0, **options):
+        worker = uuid.uuid4().hex
+        while True:
+            processed = run_pending(limit=batch_size, worker=worker)
+            if processed:
+                self.stdout.write(f'ran {processed} task(s)')
+            elif once:
+                return
+            else:
+                time.sleep(sleep)
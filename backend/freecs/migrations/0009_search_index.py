@@ -0,0 +1,90 @@
+# Generated by Django 5.0.7 on 2026-10-18 14:12
+
+import re
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# search.py as of this migration
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+STOP_WORDS = {'a', 'an', 'and', 'the', 'of', 'to', 'in', 'for', 'on', 'with', 'is', 'by', 'at', 'or'}
+FIELD_WEIGHTS = {'name': 3.0, 'category': 2.0, 'skills': 1.5, 'description': 1.0}
+
+
+def _tokens(text):
+    return [token[:64] for token in TOKEN_RE.findall(str(text).lower()) if len(token) >= 2 and token not in STOP_WORDS]
+
+
+def _skill_strings(skills):
+    if isinstance(skills, dict):
+        skills = list(skills.values())
+    if isinstance(skills, (list, tuple)):
+        for value in skills:
+            yield from _skill_strings(value)
+    elif skills is not None:
+        yield str(skills)
+
+
+def fill_index(apps, schema_editor):
+    # existing courses, so search works without a `manage.py rebuild_search_index`
+    Course = apps.get_model('freecs', 'Course')
+    SearchTerm = apps.get_model('freecs', 'SearchTerm')
+    CoursePosting = apps.get_model('freecs', 'CoursePosting')
+    courses = Course.objects.order_by('id').prefetch_related('category', 'instructors')
+    for start in range(0, Course.objects.count(), 500):
+        per_course = {}
+        for course in courses[start:start + 500]:
+            weights = defaultdict(float)
+            fields = [
+                ('name', [course.name]),
+                ('description', [course.description]),
+                ('category', [category.name for category in course.category.all()]),
+                ('skills', [s for instructor in course.instructors.all() for s in _skill_strings(instructor.skills)]),
+            ]
+            for field, texts in fields:
+                for text in texts:
+                    for token in _tokens(text):
+                        weights[token] += FIELD_WEIGHTS[field]
+            per_course[course.id] = weights
+        terms = list({term for weights in per_course.values() for term in weights})
+        SearchTerm.objects.bulk_create([SearchTerm(term=term, length=len(term), tail=term[1:]) for term in terms],
+                                       ignore_conflicts=True, batch_size=1000)
+        term_ids = dict(SearchTerm.objects.filter(term__in=terms).values_list('term', 'id'))
+        CoursePosting.objects.bulk_create([
+            CoursePosting(term_id=term_ids[term], course_id=course_id, weight=weight)
+            for course_id, weights in per_course.items()
+            for term, weight in weights.items()
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freecs', '0008_alter_preference_member'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, unique=True)),
+                ('length', models.PositiveSmallIntegerField()),
+                ('tail', models.CharField(db_index=True, max_length=63)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CoursePosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weight', models.FloatField()),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_postings', to='freecs.course')),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='postings', to='freecs.searchterm')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('term', 'course'), name='unique_term_course_posting')],
+            },
+        ),
+        migrations.RunPython(fill_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 5.0.7 on 2026-10-18 14:14
+
+import math
+from collections import Counter, defaultdict
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count
+
+# recommendations.py as of this migration
+OVERLAP_WEIGHT = 10.0
+POPULARITY_WEIGHT = 2.0
+RECENCY_WEIGHT_PER_YEAR = 2.0
+RECENCY_EPOCH = 1577836800
+
+
+def _score(overlap, popularity, created_at):
+    recency_years = (created_at.timestamp() - RECENCY_EPOCH) / (365.25 * 86400)
+    return (OVERLAP_WEIGHT * overlap + POPULARITY_WEIGHT * math.log1p(popularity)
+            + RECENCY_WEIGHT_PER_YEAR * recency_years)
+
+
+def fill_recommendations(apps, schema_editor):
+    # members with preferences get their rankings without a rebuild
+    Course = apps.get_model('freecs', 'Course')
+    Enrollment = apps.get_model('freecs', 'Enrollment')
+    Preference = apps.get_model('freecs', 'Preference')
+    CourseRecommendation = apps.get_model('freecs', 'CourseRecommendation')
+    courses_of = defaultdict(list)
+    for course_id, category_id in Course.category.through.objects.values_list('course_id', 'category_id'):
+        courses_of[category_id].append(course_id)
+    if not courses_of:
+        return
+    created = dict(Course.objects.values_list('id', 'created_at'))
+    popularity = dict(Enrollment.objects.values('course_id').annotate(n=Count('id')).values_list('course_id', 'n'))
+    categories_of = defaultdict(list)
+    for member_id, category_id in Preference.category.through.objects.values_list('preference__member_id',
+                                                                                  'category_id'):
+        categories_of[member_id].append(category_id)
+    rows = []
+    for member_id, category_ids in categories_of.items():
+        overlaps = Counter(course_id for category_id in set(category_ids) for course_id in courses_of[category_id])
+        rows.extend(
+            CourseRecommendation(member_id=member_id, course_id=course_id, overlap=overlap,
+                                 score=_score(overlap, popularity.get(course_id, 0), created[course_id]))
+            for course_id, overlap in overlaps.items()
+        )
+        if len(rows) >= 1000:
+            CourseRecommendation.objects.bulk_create(rows, batch_size=1000)
+            rows = []
+    CourseRecommendation.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freecs', '0009_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.CreateModel(
+            name='CourseRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('overlap', models.PositiveIntegerField()),
+                ('score', models.FloatField()),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='freecs.course')),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='freecs.member')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['member', '-score', 'course'], name='recommendation_rank_idx')],
+                'constraints': [models.UniqueConstraint(fields=('member', 'course'), name='unique_member_course_recommendation')],
+            },
+        ),
+        migrations.RunPython(fill_recommendations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-18 14:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freecs', '0010_course_recommendation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+        migrations.AddField(
+            model_name='instructor',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 5.0.7 on 2026-10-18 15:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def merge_duplicate_members(apps, schema_editor):
+    # Member.user becomes unique: keep each user's oldest member and move the
+    # others' enrollments, instructor profile and preference onto it
+    Member = apps.get_model('freecs', 'Member')
+    Enrollment = apps.get_model('freecs', 'Enrollment')
+    Instructor = apps.get_model('freecs', 'Instructor')
+    Preference = apps.get_model('freecs', 'Preference')
+    duplicated = Member.objects.values('user_id').annotate(n=Count('id')).filter(n__gt=1)
+    for row in duplicated:
+        keep, *extra = Member.objects.filter(user_id=row['user_id']).order_by('id')
+        extra_ids = [member.id for member in extra]
+        Enrollment.objects.filter(member_id__in=extra_ids).update(member=keep)
+        for model in (Instructor, Preference):
+            moved = model.objects.filter(member_id__in=extra_ids).order_by('id').first()
+            if moved and not model.objects.filter(member=keep).exists():
+                moved.member = keep
+                moved.save(update_fields=['member'])
+        if any(member.is_instructor for member in extra) and not keep.is_instructor:
+            keep.is_instructor = True
+            keep.save(update_fields=['is_instructor'])
+        Member.objects.filter(id__in=extra_ids).delete()
+    # fire the deferred foreign key checks now: PostgreSQL won't alter freecs_member
+    # below, in the same transaction, while it has pending trigger events
+    schema_editor.connection.check_constraints()
+
+
+def fill_counters(apps, schema_editor):
+    Course = apps.get_model('freecs', 'Course')
+    Category = apps.get_model('freecs', 'Category')
+    Enrollment = apps.get_model('freecs', 'Enrollment')
+    through = Course.category.through
+    enrollments = (Enrollment.objects.filter(course=OuterRef('pk')).order_by()
+                   .values('course').annotate(n=Count('id')).values('n'))
+    Course.objects.update(enrollment_count=Coalesce(Subquery(enrollments), 0))
+    courses = (through.objects.filter(category=OuterRef('pk')).order_by()
+               .values('category').annotate(n=Count('id')).values('n'))
+    Category.objects.update(course_count=Coalesce(Subquery(courses), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freecs', '0012_task_queue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_members, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='category',
+            name='course_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='enrollment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='member',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['name', 'id'], name='category_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['course_count', 'id'], name='category_size_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['name', 'id'], name='course_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['price', 'id'], name='course_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['duration', 'id'], name='course_duration_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['enrollment_count', 'id'], name='course_popularity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='enrollment',
+            index=models.Index(fields=['enrollment_date', 'id'], name='enrollment_date_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
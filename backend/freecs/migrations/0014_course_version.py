@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freecs', '0013_counters_and_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
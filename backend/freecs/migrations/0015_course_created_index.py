@@ -0,0 +1,17 @@
+# Generated by Django 5.0.7 on 2026-10-18 16:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freecs', '0014_course_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['created_at', 'id'], name='course_created_idx'),
+        ),
+    ]
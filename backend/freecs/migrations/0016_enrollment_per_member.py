@@ -0,0 +1,28 @@
+# Generated by Django 5.0.7 on 2026-10-18 17:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freecs', '0015_course_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='enrollment',
+            name='course',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='freecs.course'),
+        ),
+        migrations.AddConstraint(
+            model_name='enrollment',
+            constraint=models.UniqueConstraint(fields=('member', 'course'), name='unique_member_course_enrollment'),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.0.7 on 2026-10-18 17:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _skill_names(skills):
+    # skills.skill_names() as of this migration
+    if isinstance(skills, dict):
+        skills = list(skills.values())
+    names = []
+    for value in skills if isinstance(skills, (list, tuple)) else [skills]:
+        if isinstance(value, (dict, list, tuple)):
+            names.extend(_skill_names(value))
+        elif value is not None:
+            name = ' '.join(str(value).lower().split())[:64]
+            if name:
+                names.append(name)
+    return list(dict.fromkeys(names))
+
+
+def fill_skills(apps, schema_editor):
+    Instructor = apps.get_model('freecs', 'Instructor')
+    Skill = apps.get_model('freecs', 'Skill')
+    InstructorSkill = apps.get_model('freecs', 'InstructorSkill')
+    rows = Instructor.objects.order_by('id').values_list('id', 'skills', 'experience', 'rate_per_hour')
+    batch = []
+    for row in rows.iterator(chunk_size=2000):
+        batch.append(row)
+        if len(batch) == 2000:
+            _link(Skill, InstructorSkill, batch)
+            batch = []
+    _link(Skill, InstructorSkill, batch)
+    counts = (InstructorSkill.objects.filter(skill=OuterRef('pk')).order_by()
+              .values('skill').annotate(n=Count('id')).values('n'))
+    Skill.objects.update(instructor_count=Coalesce(Subquery(counts), 0))
+
+
+def _link(Skill, InstructorSkill, batch):
+    names = {instructor_id: _skill_names(skills) for instructor_id, skills, _, _ in batch}
+    wanted = {name for per_instructor in names.values() for name in per_instructor}
+    if not wanted:
+        return
+    Skill.objects.bulk_create([Skill(name=name) for name in wanted], ignore_conflicts=True)
+    skill_ids = dict(Skill.objects.filter(name__in=wanted).values_list('name', 'id'))
+    InstructorSkill.objects.bulk_create([
+        InstructorSkill(instructor_id=instructor_id, skill_id=skill_ids[name], experience=experience or 0,
+                        rate_per_hour=rate_per_hour)
+        for instructor_id, _, experience, rate_per_hour in batch
+        for name in names[instructor_id]
+    ], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('freecs', '0016_enrollment_per_member'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Skill',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('instructor_count', models.PositiveIntegerField(default=0, editable=False)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='InstructorSkill',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('experience', models.IntegerField(default=0)),
+                ('rate_per_hour', models.DecimalField(blank=True, decimal_places=2, max_digits=6, null=True)),
+                ('instructor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='skill_links', to='freecs.instructor')),
+                ('skill', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='instructor_links', to='freecs.skill')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['skill', '-experience', 'instructor'], name='skill_rank_idx')],
+                'constraints': [models.UniqueConstraint(fields=('skill', 'instructor'), name='unique_skill_instructor')],
+            },
+        ),
+        migrations.RunPython(fill_skills, migrations.RunPython.noop),
+    ]
@@ -4,7 +4,7 @@ from django.contrib.auth.models import User
 # Member table with default user
 class Member(models.Model):
     
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    user = models.OneToOneField(User, on_delete=models.CASCADE)
     is_instructor = models.BooleanField()
 
     def __str__(self):
@@ -18,6 +18,8 @@ class Instructor(models.Model):
     bio = models.TextField(null=True, blank=True)
     experience = models.IntegerField(null=True, blank=True)
     rate_per_hour = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
+    # bumped when this row or its member/user changes, keys cached fragments and snapshot payloads
+    version = models.PositiveIntegerField(default=1, editable=False)
 
     def __str__(self):
         return f"{self.member.user.username} - {self.skills or 'No skills'}"
@@ -25,11 +27,18 @@ class Instructor(models.Model):
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
+    version = models.PositiveIntegerField(default=1, editable=False)
+    # kept in step by signals.py, `manage.py reconcile_counters` repairs drift
+    course_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name
     class Meta:
         verbose_name_plural = "Categories"
+        indexes = [
+            models.Index(fields=['name', 'id'], name='category_name_idx'),
+            models.Index(fields=['course_count', 'id'], name='category_size_idx'),
+        ]
 
 
 # Course Model
@@ -40,6 +49,22 @@ class Course(models.Model):
     instructors = models.ManyToManyField(Instructor)
     price = models.DecimalField(max_digits=6, decimal_places=2)
     duration = models.IntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # seats, None for no limit; enforced by enrollments.py against enrollment_count
+    capacity = models.PositiveIntegerField(null=True, blank=True)
+    enrollment_count = models.PositiveIntegerField(default=0, editable=False)
+    # bumped when the row, its links or its enrollment count change, see snapshot.py
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    # (sort key, id) pairs for the keyset-paginated course list
+    class Meta:
+        indexes = [
+            models.Index(fields=['name', 'id'], name='course_name_idx'),
+            models.Index(fields=['price', 'id'], name='course_price_idx'),
+            models.Index(fields=['duration', 'id'], name='course_duration_idx'),
+            models.Index(fields=['enrollment_count', 'id'], name='course_popularity_idx'),
+            models.Index(fields=['created_at', 'id'], name='course_created_idx'),
+        ]
 
     def __str__(self) -> str:
         return self.name
@@ -47,8 +72,18 @@ class Course(models.Model):
 
 class Enrollment(models.Model):
     member = models.ForeignKey(Member, on_delete=models.CASCADE)
-    course = models.OneToOneField(Course, on_delete=models.CASCADE, default=None)
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
     enrollment_date = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['member', 'course'], name='unique_member_course_enrollment'),
+        ]
+        indexes = [
+            models.Index(fields=['enrollment_date', 'id'], name='enrollment_date_idx'),
+        ]
+
+
 class Preference(models.Model):
     member = models.OneToOneField(Member, on_delete=models.CASCADE)
     category = models.ManyToManyField(Category)
@@ -56,3 +91,98 @@ class Preference(models.Model):
 
     def __str__(self) -> str:
         return self.member.user.username
+
+
+# Search index vocabulary, one row per distinct token (see search.py)
+class SearchTerm(models.Model):
+    term = models.CharField(max_length=64, unique=True)
+    length = models.PositiveSmallIntegerField()
+    # the term less its first letter, for typo lookups when that letter is the typo
+    tail = models.CharField(max_length=63, db_index=True)
+
+    def __str__(self) -> str:
+        return self.term
+
+
+# Inverted index postings: how strongly a term is associated with a course
+class CoursePosting(models.Model):
+    term = models.ForeignKey(SearchTerm, on_delete=models.CASCADE, related_name='postings')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='search_postings')
+    weight = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['term', 'course'], name='unique_term_course_posting'),
+        ]
+
+
+# Instructor skill vocabulary, one row per normalized skill name (see skills.py)
+class Skill(models.Model):
+    name = models.CharField(max_length=64, unique=True)
+    # instructors with the skill, kept in step by skills.py
+    instructor_count = models.PositiveIntegerField(default=0, editable=False)
+
+    def __str__(self) -> str:
+        return self.name
+
+
+# Instructor-skill links, with the instructor's experience and rate copied in so
+# a skill's instructors are read ranked and filtered from skill_rank_idx alone
+class InstructorSkill(models.Model):
+    instructor = models.ForeignKey(Instructor, on_delete=models.CASCADE, related_name='skill_links')
+    skill = models.ForeignKey(Skill, on_delete=models.CASCADE, related_name='instructor_links', db_index=False)
+    # no experience counts as 0
+    experience = models.IntegerField(default=0)
+    rate_per_hour = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['skill', 'instructor'], name='unique_skill_instructor'),
+        ]
+        indexes = [
+            models.Index(fields=['skill', '-experience', 'instructor'], name='skill_rank_idx'),
+        ]
+
+
+# Precomputed preferred-course ranking per member (see recommendations.py)
+class CourseRecommendation(models.Model):
+    member = models.ForeignKey(Member, on_delete=models.CASCADE, related_name='recommendations')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='recommendations')
+    overlap = models.PositiveIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['member', 'course'], name='unique_member_course_recommendation'),
+        ]
+        indexes = [
+            models.Index(fields=['member', '-score', 'course'], name='recommendation_rank_idx'),
+        ]
+
+
+# Background job queue (see tasks.py)
+class Task(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField()
+    locked_by = models.CharField(max_length=32, blank=True, default='')
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='task_due_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.name} ({self.status})'
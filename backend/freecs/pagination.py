@@ -0,0 +1,250 @@
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+from django.core import signing
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# Keyset pagination shared by the list endpoints.
+#
+# Rows are ordered by (sort_key, id) and a page is fetched with
+# "WHERE (sort_key, id) > (last_key, last_id) LIMIT n", so page 10,000 costs
+# the same as page 1. The cursor carries the boundary row and is signed, so
+# clients can't forge positions or change the ordering mid-walk.
+#
+# paginate_sorted runs the same seek over in-memory rows (the catalogue
+# snapshot), issuing and accepting the same cursors.
+
+
+class KeysetPagination(BasePagination):
+    page_size = 50
+    max_page_size = 500
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    salt = 'freecs.pagination'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self, sort_key='id', sort_keys=None, page_size=None, aliases=None):
+        # sort_keys lists the extra orderings a client may pick with ?ordering=.
+        # They must be non-nullable, a NULL boundary can't be seeked past.
+        # aliases name orderings, e.g. {'newest': '-created_at'}.
+        self.default_sort_key = sort_key
+        self.sort_keys = set(sort_keys or []) | {sort_key}
+        self.aliases = aliases or {}
+        if page_size is not None:
+            self.page_size = page_size
+
+    def encode_cursor(self, ordering, row, reverse=False):
+        payload = {'o': ordering, 'i': row.pk, 'r': reverse}
+        field = ordering.lstrip('-')
+        if field != 'id':
+            value = getattr(row, field)
+            payload['k'] = value if isinstance(value, (int, str)) else str(value)
+        return signing.dumps(payload, salt=self.salt, compress=True)
+
+    def decode_cursor(self, cursor):
+        try:
+            return signing.loads(cursor, salt=self.salt)
+        except signing.BadSignature:
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get(self.ordering_query_param, self.default_sort_key)
+        ordering = self.aliases.get(ordering, ordering)
+        if ordering.lstrip('-') not in self.sort_keys:
+            return self.default_sort_key
+        return ordering
+
+    def _seek(self, queryset, ordering, position, reverse):
+        field = ordering.lstrip('-')
+        descending = ordering.startswith('-') != reverse
+        op = 'lt' if descending else 'gt'
+        if field == 'id':
+            return queryset.filter(**{f'id__{op}': position['i']})
+        return queryset.filter(
+            Q(**{f'{field}__{op}': position['k']}) | Q(**{field: position['k'], f'id__{op}': position['i']})
+        )
+
+    def _order(self, queryset, ordering, reverse):
+        field = ordering.lstrip('-')
+        descending = ordering.startswith('-') != reverse
+        prefix = '-' if descending else ''
+        if field == 'id':
+            return queryset.order_by(prefix + 'id')
+        return queryset.order_by(prefix + field, prefix + 'id')
+
+    def _read_cursor(self, request):
+        self.request = request
+        self.size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request)
+        self.cursor_given = False
+        self.reverse = False
+        self.rows = None
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        position = self.decode_cursor(cursor)
+        # a cursor is only meaningful for the ordering it was issued under
+        self.ordering = position.get('o') or ''
+        if self.ordering.lstrip('-') not in self.sort_keys:
+            raise NotFound(self.invalid_cursor_message)
+        self.cursor_given = True
+        self.reverse = position.get('r', False)
+        return position
+
+    def _page_queryset(self, queryset, request):
+        position = self._read_cursor(request)
+        if position is not None:
+            queryset = self._seek(queryset, self.ordering, position, self.reverse)
+        return self._order(queryset, self.ordering, self.reverse)[:self.size + 1]
+
+    def _set_page(self, rows):
+        has_more = len(rows) > self.size
+        rows = rows[:self.size]
+        if self.reverse:
+            rows.reverse()
+            self.has_next = bool(rows)
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor_given and bool(rows)
+        self.page = rows
+        return rows
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self._set_page(list(self._page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        return self._set_page([row async for row in self._page_queryset(queryset, request)])
+
+    def paginate_sorted(self, rows, request):
+        # rows gives positions in (field, id) order and their sort keys, see
+        # snapshot.Table, and may filter them with rows.keep(position), see
+        # facets.Selection. Returns a page of positions.
+        position = self._read_cursor(request)
+        self.rows = rows
+        field = self.ordering.lstrip('-')
+        order = rows.order(field)
+        keep = getattr(rows, 'keep', None)
+        descending = self.ordering.startswith('-') != self.reverse
+        if position is None:
+            index = len(order) - 1 if descending else 0
+        else:
+            boundary = (rows.cursor_key(field, position.get('k', position['i'])), position['i'])
+            key = rows.sort_key(field)
+            if descending:
+                index = bisect_left(order, boundary, key=key) - 1
+            else:
+                index = bisect_right(order, boundary, key=key)
+        step = -1 if descending else 1
+        page = []
+        while 0 <= index < len(order) and len(page) <= self.size:
+            if keep is None or keep(order[index]):
+                page.append(order[index])
+            index += step
+        return self._set_page(page)
+
+    def _link(self, cursor):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.ordering_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def _boundary(self, row):
+        return row if self.rows is None else self.rows.cursor_row(row)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self.encode_cursor(self.ordering, self._boundary(self.page[-1])))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self._link(self.encode_cursor(self.ordering, self._boundary(self.page[0]), reverse=True))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+# Page-number pagination over a result list that is already ranked, such as
+# search hits. The fetch callback returns (rows, has_more) for an offset and
+# limit, so no COUNT(*) is needed.
+class RankedPagination(BasePagination):
+    page_size = 20
+    max_page_size = 100
+    page_query_param = 'page'
+    page_size_query_param = 'page_size'
+
+    def _positive_int(self, request, name, default, cutoff=None):
+        try:
+            value = int(request.query_params[name])
+        except (KeyError, ValueError):
+            return default
+        if value <= 0:
+            return default
+        return min(value, cutoff) if cutoff else value
+
+    def paginate_ranked(self, fetch, request):
+        self.request = request
+        self.page_number = self._positive_int(request, self.page_query_param, 1)
+        size = self._positive_int(request, self.page_size_query_param, self.page_size, self.max_page_size)
+        rows, self.has_next = fetch((self.page_number - 1) * size, size)
+        return rows
+
+    async def apaginate_ranked(self, fetch, request):
+        # fetch is a coroutine function here
+        self.request = request
+        self.page_number = self._positive_int(request, self.page_query_param, 1)
+        size = self._positive_int(request, self.page_size_query_param, self.page_size, self.max_page_size)
+        rows, self.has_next = await fetch((self.page_number - 1) * size, size)
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if self.page_number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.page_number - 1)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
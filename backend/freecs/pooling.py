@@ -0,0 +1,296 @@
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.utils import OperationalError
+
+from . import instrumentation
+
+# Database connection pooling, one bounded pool per database alias and worker
+# process.
+#
+# The backends in freecs/backends/ take their connections from a pool and
+# give them back when Django closes them, which it does at the end of every
+# request with CONN_MAX_AGE = 0 (the only value they accept, a persistent
+# connection would hold on to its pool slot):
+#
+#     DATABASES = {'default': {'ENGINE': 'freecs.backends.postgresql', 'CONN_MAX_AGE': 0, ...}}
+#     FREECS_POOL = {'MAX_SIZE': 10, 'TIMEOUT': 5, 'MAX_AGE': 600, 'MAX_IDLE': 300, 'CHECK_AFTER': 30,
+#                    'DATABASES': {'replica': {'MAX_SIZE': 20}}}
+#
+# PostgreSQL uses Django's own pool (psycopg_pool, psycopg 3 only), built
+# from these settings by psycopg_pool_options() unless OPTIONS['pool'] is
+# given; it keeps MIN_SIZE connections open, and CONN_HEALTH_CHECKS rather
+# than CHECK_AFTER decides whether a connection is checked before use.
+# Other databases, SQLite in this project, use the ConnectionPool below.
+#
+# At most MAX_SIZE connections are open per process; a thread that finds
+# none free waits up to TIMEOUT seconds and then gets an OperationalError.
+# The most recently used idle connection goes out first. A connection is
+# closed instead of reused once it is MAX_AGE seconds old or has been idle
+# for MAX_IDLE, and one that has been idle for CHECK_AFTER seconds, or saw a
+# database error, must answer a SELECT 1 before it is handed out. Closing
+# inside a transaction rolls it back first. Async views are served the same
+# way: Django runs their queries in worker threads, and the pool is shared
+# between threads. A forked worker starts its own pool rather than share
+# its parent's sockets.
+#
+# Reused connections keep their statement caches. With psycopg 3 the
+# PostgreSQL backend binds parameters server side and prepares a query shape
+# once it has run PREPARE_THRESHOLD times on a connection, keeping up to
+# PREPARED_MAX statements each; 'PREPARE': False goes back to client-side
+# binding, which PgBouncer in transaction mode needs. SQLite connections
+# keep STATEMENT_CACHE compiled statements.
+#
+# Time spent waiting for a connection, timeouts, and connections opened and
+# closed are recorded per alias (only waits and timeouts for PostgreSQL),
+# and the metrics endpoint reports each pool's open, in use and waiting
+# counts against its size (see instrumentation.py).
+
+_config = getattr(settings, 'FREECS_POOL', {})
+DEFAULTS = {
+    'MIN_SIZE': 1,
+    'MAX_SIZE': 10,
+    'TIMEOUT': 5,
+    'MAX_AGE': 600,
+    'MAX_IDLE': 300,
+    'CHECK_AFTER': 30,
+    'PREPARE': True,
+    'PREPARE_THRESHOLD': 2,
+    'PREPARED_MAX': 200,
+    'STATEMENT_CACHE': 256,
+}
+
+
+def pool_settings(alias):
+    overrides = _config.get('DATABASES', {}).get(alias, {})
+    return {key: overrides.get(key, _config.get(key, default)) for key, default in DEFAULTS.items()}
+
+
+def psycopg_pool_options(alias):
+    # keyword arguments for psycopg_pool.ConnectionPool, which Django builds from OPTIONS['pool']
+    config = pool_settings(alias)
+    options = {'name': alias, 'min_size': min(config['MIN_SIZE'], config['MAX_SIZE']), 'max_size': config['MAX_SIZE'],
+               'timeout': config['TIMEOUT']}
+    for key, option in (('MAX_AGE', 'max_lifetime'), ('MAX_IDLE', 'max_idle')):
+        if config[key] is not None:
+            options[option] = config[key]
+    return options
+
+
+class _Pooled:
+    __slots__ = ('pool', 'connection', 'created', 'released', 'suspect')
+
+    def __init__(self, pool, connection):
+        self.pool = pool
+        self.connection = connection
+        self.created = self.released = time.monotonic()
+        self.suspect = False
+
+
+def _ping(connection):
+    try:
+        cursor = connection.cursor()
+        try:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+        finally:
+            cursor.close()
+    except Exception:
+        return False
+    return True
+
+
+def _close(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+    def __init__(self, alias, max_size=10, timeout=5, max_age=600, max_idle=300, check_after=30):
+        if max_size < 1:
+            raise ImproperlyConfigured(f"FREECS_POOL MAX_SIZE for '{alias}' must be at least 1")
+        self.alias = alias
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_age = max_age
+        self.max_idle = max_idle
+        self.check_after = check_after
+        self.pid = os.getpid()
+        self._idle = []
+        self._size = 0
+        self._waiting = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, connect):
+        # a _Pooled connection, opened with connect() when no idle one is left
+        while True:
+            pooled = self._checkout()
+            if pooled is None:
+                try:
+                    pooled = _Pooled(self, connect())
+                except BaseException:
+                    self._forget()
+                    raise
+                instrumentation.pool_connections_opened.inc((self.alias,))
+                return pooled
+            now = time.monotonic()
+            reason = self._expired(pooled, now)
+            if reason is None and self.max_idle is not None and now - pooled.released > self.max_idle:
+                reason = 'idle'
+            if reason is None and (pooled.suspect or now - pooled.released > self.check_after):
+                reason = None if _ping(pooled.connection) else 'unusable'
+            if reason is None:
+                return pooled
+            self._discard(pooled, reason)
+
+    def release(self, pooled, reusable=True):
+        now = time.monotonic()
+        reason = 'error' if not reusable else self._expired(pooled, now)
+        if reason is not None or self.pid != os.getpid():
+            self._discard(pooled, reason or 'fork')
+            return
+        pooled.released = now
+        with self._condition:
+            # the oldest idle connections are at the bottom of the stack
+            expired = 0
+            while (self.max_idle is not None and expired < len(self._idle)
+                   and now - self._idle[expired].released > self.max_idle):
+                expired += 1
+            idle, self._idle = self._idle[:expired], self._idle[expired:]
+            self._idle.append(pooled)
+            self._condition.notify()
+        for pooled in idle:
+            self._discard(pooled, 'idle')
+
+    def _expired(self, pooled, now):
+        if self.max_age is not None and now - pooled.created > self.max_age:
+            return 'age'
+        return None
+
+    def _checkout(self):
+        # an idle connection, or None with a slot reserved for a new one
+        start = time.perf_counter()
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            self._waiting += 1
+            try:
+                while True:
+                    if self._idle:
+                        return self._idle.pop()
+                    if self._size < self.max_size:
+                        self._size += 1
+                        return None
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        instrumentation.pool_timeouts.inc((self.alias,))
+                        raise OperationalError(f"no connection to '{self.alias}' came free within "
+                                               f"{self.timeout}s, all {self.max_size} are in use")
+                    self._condition.wait(remaining)
+            finally:
+                self._waiting -= 1
+                instrumentation.pool_wait_seconds.observe((self.alias,), time.perf_counter() - start)
+
+    def _forget(self):
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def _discard(self, pooled, reason):
+        # a forked worker's inherited sockets belong to its parent, so they're dropped without closing
+        if reason != 'fork':
+            _close(pooled.connection)
+        instrumentation.pool_connections_closed.inc((self.alias, reason))
+        self._forget()
+
+    def close(self):
+        with self._condition:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._discard(pooled, 'shutdown')
+
+    def stats(self):
+        with self._condition:
+            return {'size': self._size, 'idle': len(self._idle), 'in_use': self._size - len(self._idle),
+                    'waiting': self._waiting, 'max_size': self.max_size}
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias):
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is None or pool.pid != os.getpid():
+            config = pool_settings(alias)
+            pool = _pools[alias] = ConnectionPool(alias, max_size=config['MAX_SIZE'], timeout=config['TIMEOUT'],
+                                                  max_age=config['MAX_AGE'], max_idle=config['MAX_IDLE'],
+                                                  check_after=config['CHECK_AFTER'])
+        return pool
+
+
+_native_pools = {}
+
+
+def register_native_pool(alias, pool):
+    # a psycopg_pool.ConnectionPool, for pool_stats()
+    _native_pools[alias] = pool
+
+
+def _native_stats(pool):
+    stats = pool.get_stats()
+    size, idle = stats.get('pool_size', 0), stats.get('pool_available', 0)
+    return {'size': size, 'idle': idle, 'in_use': size - idle, 'waiting': stats.get('requests_waiting', 0),
+            'max_size': pool.max_size}
+
+
+def pool_stats():
+    # {alias: stats} for this process's pools
+    with _pools_lock:
+        pools = [pool for pool in _pools.values() if pool.pid == os.getpid()]
+    stats = {alias: _native_stats(pool) for alias, pool in list(_native_pools.items())}
+    stats.update((pool.alias, pool.stats()) for pool in pools)
+    return stats
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        if pool.pid == os.getpid():
+            pool.close()
+
+
+class PooledDatabaseWrapperMixin:
+    # put before a backend's DatabaseWrapper
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.settings_dict['CONN_MAX_AGE'] != 0:
+            raise ImproperlyConfigured(f"Database '{self.alias}' is pooled, its CONN_MAX_AGE must be 0")
+        self._pooled = None
+
+    def get_new_connection(self, conn_params):
+        connect = super().get_new_connection
+        self._pooled = get_pool(self.alias).acquire(lambda: connect(conn_params))
+        return self._pooled.connection
+
+    def _close(self):
+        pooled, self._pooled = self._pooled, None
+        if pooled is None or pooled.connection is not self.connection:
+            return super()._close()
+        reusable = True
+        if self.in_atomic_block or not self.autocommit:
+            try:
+                self.connection.rollback()
+            except Exception:
+                reusable = False
+        pooled.suspect = self.errors_occurred
+        # the connection may be handed to another thread right away, so this wrapper lets go of it now
+        self.connection = None
+        pooled.pool.release(pooled, reusable)
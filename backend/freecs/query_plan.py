@@ -0,0 +1,80 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+# Builds select_related/prefetch_related for a queryset from the nested
+# serializers a response serializer declares, so list views issue a fixed
+# number of queries no matter how many rows are on the page.
+#
+# Forward FK/OneToOne relations are joined with select_related. Many-to-many
+# and reverse relations get a Prefetch whose queryset is planned recursively
+# from the nested serializer. Anything the fields don't reveal (method fields,
+# properties) can be declared on the serializer Meta:
+#
+#     class Meta:
+#         select_related = ['member__user']
+#         prefetch_related = ['category']
+
+_plans = {}
+
+
+def _nested_serializer(field):
+    if isinstance(field, serializers.ListSerializer):
+        field = field.child
+    if isinstance(field, serializers.ModelSerializer):
+        return field
+    return None
+
+
+def _build_plan(serializer, prefix=''):
+    model = serializer.Meta.model
+    select = [prefix + path for path in getattr(serializer.Meta, 'select_related', [])]
+    prefetch = [(prefix + path, None) for path in getattr(serializer.Meta, 'prefetch_related', [])]
+
+    for field in serializer.fields.values():
+        nested = _nested_serializer(field)
+        if nested is None or field.source == '*' or '.' in field.source:
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        if not model_field.is_relation:
+            continue
+
+        path = prefix + field.source
+        if model_field.many_to_many or model_field.one_to_many:
+            prefetch.append((path, nested))
+        else:
+            select.append(path)
+            nested_select, nested_prefetch = _build_plan(nested, prefix=path + '__')
+            select.extend(nested_select)
+            prefetch.extend(nested_prefetch)
+
+    return select, prefetch
+
+
+def get_query_plan(serializer):
+    # the plan only depends on declared fields, so it is computed once per class
+    serializer_class = serializer if isinstance(serializer, type) else serializer.__class__
+    if serializer_class not in _plans:
+        instance = serializer if not isinstance(serializer, type) else serializer_class()
+        _plans[serializer_class] = _build_plan(instance)
+    return _plans[serializer_class]
+
+
+def optimize_queryset(queryset, serializer):
+    select, prefetch = get_query_plan(serializer)
+    if select:
+        queryset = queryset.select_related(*select)
+    lookups = []
+    for path, nested in prefetch:
+        if nested is None:
+            lookups.append(path)
+            continue
+        related_model = nested.Meta.model
+        # Prefetch objects are mutated by Django while prefetching, build fresh ones per queryset
+        lookups.append(Prefetch(path, queryset=optimize_queryset(related_model._default_manager.all(), nested)))
+    if lookups:
+        queryset = queryset.prefetch_related(*lookups)
+    return queryset
@@ -0,0 +1,182 @@
+import math
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Course, CourseRecommendation, Preference
+
+# Precomputed preferred-course rankings.
+#
+# Every member with preferences has one CourseRecommendation row per course
+# sharing at least one of their categories. The row stores how many categories
+# overlap and a score mixing that overlap with enrollment popularity and
+# course recency. The score doesn't depend on when it was computed, so rows
+# written at different times rank against each other. Signal handlers and
+# the task queue update only the rows a change touches (enrollments rescore
+# their course's rows on the task queue, coalesced per course), and readers get the
+# ranked id list from the cache under a per-member version that is replaced
+# whenever those rows change.
+
+OVERLAP_WEIGHT = 10.0
+POPULARITY_WEIGHT = 2.0
+# per year a course is newer: about what 2.7 times the enrollments are worth, so
+# among courses with the same overlap popularity still reorders ones of similar age
+RECENCY_WEIGHT_PER_YEAR = 2.0
+RECENCY_EPOCH = 1577836800  # 2020-01-01 UTC
+MAX_CACHED = 500
+CACHE_TIMEOUT = 60 * 60
+
+
+def score(overlap, popularity, created_at):
+    # recency grows with created_at instead of decaying with age, so rows scored at different times compare
+    recency_years = (created_at.timestamp() - RECENCY_EPOCH) / (365.25 * 86400)
+    return (OVERLAP_WEIGHT * overlap + POPULARITY_WEIGHT * math.log1p(popularity)
+            + RECENCY_WEIGHT_PER_YEAR * recency_years)
+
+
+def _course_stats(course_ids):
+    rows = Course.objects.filter(id__in=course_ids).values_list('id', 'enrollment_count', 'created_at')
+    return {course_id: (popularity, created_at) for course_id, popularity, created_at in rows}
+
+
+def _save(rows):
+    CourseRecommendation.objects.bulk_create(
+        rows, batch_size=1000, update_conflicts=True,
+        unique_fields=['member', 'course'], update_fields=['overlap', 'score'],
+    )
+
+
+#cache versions
+def _version_key(member_id):
+    return f'freecs:recommendations:version:{member_id}'
+
+
+def _list_key(member_id, version):
+    return f'freecs:recommendations:{member_id}:{version}'
+
+
+def _bump_versions(member_ids):
+    member_ids = list(member_ids)
+    if not member_ids:
+        return
+
+    def bump():
+        cache.set_many({_version_key(member_id): uuid.uuid4().hex for member_id in member_ids}, CACHE_TIMEOUT)
+
+    bump()
+    # bump again once committed so a reader racing the transaction can't keep stale rows cached
+    transaction.on_commit(bump)
+
+
+#incremental updates
+def recompute_member(member_id):
+    category_ids = Preference.category.through.objects.filter(
+        preference__member_id=member_id).values_list('category_id', flat=True)
+    overlaps = dict(Course.category.through.objects.filter(category_id__in=category_ids)
+                    .values('course_id').annotate(overlap=Count('category_id'))
+                    .values_list('course_id', 'overlap'))
+    stats = _course_stats(list(overlaps))
+    with transaction.atomic():
+        CourseRecommendation.objects.filter(member_id=member_id).exclude(course_id__in=list(overlaps)).delete()
+        _save([
+            CourseRecommendation(member_id=member_id, course_id=course_id, overlap=overlap,
+                                 score=score(overlap, *stats[course_id]))
+            for course_id, overlap in overlaps.items() if course_id in stats
+        ])
+    _bump_versions([member_id])
+
+
+def recompute_course(course_id):
+    # a course's categories changed: redo its row for every member that may want it
+    category_ids = Course.category.through.objects.filter(course_id=course_id).values_list('category_id', flat=True)
+    overlaps = dict(Preference.category.through.objects.filter(category_id__in=category_ids)
+                    .values('preference__member_id').annotate(overlap=Count('category_id'))
+                    .values_list('preference__member_id', 'overlap'))
+    stats = _course_stats([course_id])
+    stale = set(CourseRecommendation.objects.filter(course_id=course_id)
+                .exclude(member_id__in=list(overlaps)).values_list('member_id', flat=True))
+    with transaction.atomic():
+        CourseRecommendation.objects.filter(course_id=course_id, member_id__in=stale).delete()
+        if course_id in stats:
+            _save([
+                CourseRecommendation(member_id=member_id, course_id=course_id, overlap=overlap,
+                                     score=score(overlap, *stats[course_id]))
+                for member_id, overlap in overlaps.items()
+            ])
+    _bump_versions(stale | set(overlaps))
+
+
+def refresh_course_scores(course_id):
+    # popularity changed, overlaps didn't
+    stats = _course_stats([course_id])
+    if course_id not in stats:
+        return
+    rows = list(CourseRecommendation.objects.filter(course_id=course_id))
+    for row in rows:
+        row.score = score(row.overlap, *stats[course_id])
+    CourseRecommendation.objects.bulk_update(rows, ['score'], batch_size=1000)
+    _bump_versions(row.member_id for row in rows)
+
+
+def forget_course(member_ids):
+    # rows go with the course through the cascade, only the cached lists need replacing
+    _bump_versions(member_ids)
+
+
+def rebuild_all():
+    member_ids = list(Preference.objects.values_list('member_id', flat=True))
+    CourseRecommendation.objects.exclude(member_id__in=member_ids).delete()
+    for member_id in member_ids:
+        recompute_member(member_id)
+
+
+#reads
+def _ranked(member_id):
+    return (CourseRecommendation.objects.filter(member_id=member_id)
+            .order_by('-score', 'course_id').values_list('course_id', flat=True))
+
+
+def _slice(ranked, offset, limit):
+    # None when the page runs past the cached head and has to come from the table
+    if offset + limit < len(ranked) or len(ranked) < MAX_CACHED:
+        return ranked[offset:offset + limit], offset + limit < len(ranked)
+    return None
+
+
+def recommended_course_ids(member_id, offset=0, limit=20):
+    # returns (course ids ranked by score, has_more)
+    version = cache.get(_version_key(member_id))
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(_version_key(member_id), version, CACHE_TIMEOUT)
+    key = _list_key(member_id, version)
+    ranked = cache.get(key)
+    if ranked is None:
+        ranked = list(_ranked(member_id)[:MAX_CACHED])
+        cache.set(key, ranked, CACHE_TIMEOUT)
+
+    page = _slice(ranked, offset, limit)
+    if page is not None:
+        return page
+    ids = list(_ranked(member_id)[offset:offset + limit + 1])
+    return ids[:limit], len(ids) > limit
+
+
+async def arecommended_course_ids(member_id, offset=0, limit=20):
+    version = await cache.aget(_version_key(member_id))
+    if version is None:
+        version = uuid.uuid4().hex
+        await cache.aset(_version_key(member_id), version, CACHE_TIMEOUT)
+    key = _list_key(member_id, version)
+    ranked = await cache.aget(key)
+    if ranked is None:
+        ranked = [course_id async for course_id in _ranked(member_id)[:MAX_CACHED]]
+        await cache.aset(key, ranked, CACHE_TIMEOUT)
+
+    page = _slice(ranked, offset, limit)
+    if page is not None:
+        return page
+    ids = [course_id async for course_id in _ranked(member_id)[offset:offset + limit + 1]]
+    return ids[:limit], len(ids) > limit
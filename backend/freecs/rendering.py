@@ -0,0 +1,78 @@
+import json
+import time
+
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import instrumentation
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON rendering with a faster encoder when one is installed.
+#
+# dumps() gives the bytes DRF's JSONRenderer does with its default settings
+# (compact, unescaped unicode, U+2028/U+2029 escaped). With orjson installed
+# the encoding runs in C: anything orjson doesn't know natively, datetimes
+# included, goes through DRF's JSONEncoder.default(), so dates, decimals and
+# lazy strings come out as before. orjson spells some floats differently
+# (1e16 rather than 1e+16) and writes NaN as null, and integers too big for
+# 64 bits make it fall back to the stdlib. Without orjson, or with
+# FREECS_RENDERING = {'ENCODER': 'json'}, the stdlib encoder is used.
+#
+# FastJSONRenderer renders with dumps() and falls back to JSONRenderer for
+# indented output (?indent, the browsable API) or non-default JSON settings.
+# Encode time and size are recorded per route and encoder (see
+# instrumentation.py). Views serving the catalogue use it; to use it
+# everywhere:
+#
+#     REST_FRAMEWORK = {'DEFAULT_RENDERER_CLASSES': ['freecs.rendering.FastJSONRenderer', ...]}
+
+ENCODER = getattr(settings, 'FREECS_RENDERING', {}).get('ENCODER', 'orjson' if orjson else 'json')
+if ENCODER == 'orjson' and orjson is None:
+    ENCODER = 'json'
+
+_default = JSONEncoder().default
+_LINE_SEPARATORS = ('\u2028'.encode(), '\u2029'.encode())
+
+
+def _stdlib_dumps(data):
+    text = json.dumps(data, cls=JSONEncoder, ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+    return text.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+
+def _orjson_dumps(data):
+    try:
+        body = orjson.dumps(data, default=_default,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+    except orjson.JSONEncodeError:
+        return _stdlib_dumps(data)
+    if b'\xe2\x80' in body:
+        body = body.replace(_LINE_SEPARATORS[0], b'\\u2028').replace(_LINE_SEPARATORS[1], b'\\u2029')
+    return body
+
+
+def dumps(data, encoder=None):
+    # compact JSON bytes, as DRF's JSONRenderer writes them
+    if (encoder or ENCODER) == 'orjson':
+        return _orjson_dumps(data)
+    return _stdlib_dumps(data)
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if (self.get_indent(accepted_media_type, renderer_context) is not None or not self.compact
+                or self.ensure_ascii or not self.strict):
+            return super().render(data, accepted_media_type, renderer_context)
+        start = time.perf_counter()
+        body = dumps(data)
+        labels = (instrumentation.route_name(renderer_context.get('request')), ENCODER)
+        instrumentation.render_seconds.observe(labels, time.perf_counter() - start)
+        instrumentation.rendered_bytes.inc(labels, len(body))
+        return body
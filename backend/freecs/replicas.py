@@ -0,0 +1,210 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+# Read-replica routing.
+#
+# Every database alias other than 'default' is a replica unless
+# FREECS_REPLICAS['ALIASES'] lists them. ReplicaRouter sends writes to the
+# primary. Reads go wherever the current read scope says:
+# - ReplicaReadMixin opens a scope on a healthy replica for GET/HEAD
+#   requests of the views that use it;
+# - on_replica() does the same for one queryset, e.g. a streamed export
+#   that is read after the view has returned;
+# - code outside any scope keeps Django's default routing.
+#
+# Reads go back to the primary for the rest of the scope as soon as it writes
+# or opens a transaction. StickyPrimaryMiddleware sets a signed cookie on
+# every successful unsafe request, and for STICKY_SECONDS that client's reads
+# skip the replicas too, so users see their own writes. Bearer tokens can't
+# be re-issued on each write, so the cookie is what carries this.
+#
+# A replica is skipped while it is more than MAX_LAG_SECONDS behind. Lag is
+# probed at most every LAG_CHECK_SECONDS per alias: PostgreSQL and MySQL
+# report it, and an unreachable replica counts as infinitely behind.
+# Backends without replication (two SQLite files copied with .backup for a
+# local setup) report nothing and are always used.
+#
+#     DATABASE_ROUTERS = ['freecs.replicas.ReplicaRouter']
+#     MIDDLEWARE += ['freecs.replicas.StickyPrimaryMiddleware']
+#     FREECS_REPLICAS = {'STICKY_SECONDS': 10, 'MAX_LAG_SECONDS': 5, 'LAG_CHECK_SECONDS': 5}
+
+_config = getattr(settings, 'FREECS_REPLICAS', {})
+STICKY_SECONDS = _config.get('STICKY_SECONDS', 10)
+MAX_LAG_SECONDS = _config.get('MAX_LAG_SECONDS', 5)
+LAG_CHECK_SECONDS = _config.get('LAG_CHECK_SECONDS', 5)
+# data changed longer ago than this has reached every replica still in use
+SETTLE_SECONDS = MAX_LAG_SECONDS + LAG_CHECK_SECONDS
+
+STICKY_COOKIE = 'freecs_primary'
+_COOKIE_SALT = 'freecs.replicas.sticky'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def replica_aliases():
+    aliases = getattr(settings, 'FREECS_REPLICAS', {}).get('ALIASES')
+    if aliases is None:
+        aliases = [alias for alias in connections if alias != DEFAULT_DB_ALIAS]
+    return list(aliases)
+
+
+#replica lag
+def _postgresql_lag(cursor):
+    # NULL on a server that isn't replaying WAL, which is as current as it gets
+    cursor.execute("SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                   "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END")
+    lag = cursor.fetchone()[0]
+    return 0.0 if lag is None else float(lag)
+
+
+def _mysql_lag(cursor):
+    cursor.execute('SHOW REPLICA STATUS')
+    row = cursor.fetchone()
+    if row is None:
+        return 0.0
+    lag = row[[column[0] for column in cursor.description].index('Seconds_Behind_Source')]
+    # NULL while replication is stopped
+    return float('inf') if lag is None else float(lag)
+
+
+_LAG_PROBES = {'postgresql': _postgresql_lag, 'mysql': _mysql_lag}
+
+_lags = {}
+_lags_lock = threading.Lock()
+
+
+def replica_lag(alias):
+    # seconds behind the primary; None when the backend can't tell, inf when it can't be reached
+    connection = connections[alias]
+    probe = _LAG_PROBES.get(connection.vendor)
+    if probe is None:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            return probe(cursor)
+    except DatabaseError:
+        return float('inf')
+
+
+def _current_lag(alias):
+    now = time.monotonic()
+    with _lags_lock:
+        checked = _lags.get(alias)
+    if checked is None or now - checked[0] > LAG_CHECK_SECONDS:
+        checked = (now, replica_lag(alias))
+        with _lags_lock:
+            _lags[alias] = checked
+    return checked[1]
+
+
+def healthy_replicas():
+    healthy = []
+    for alias in replica_aliases():
+        lag = _current_lag(alias)
+        if lag is None or lag <= MAX_LAG_SECONDS:
+            healthy.append(alias)
+    return healthy
+
+
+def pick_replica():
+    healthy = healthy_replicas()
+    return random.choice(healthy) if healthy else None
+
+
+def reset():
+    with _lags_lock:
+        _lags.clear()
+
+
+#read scopes
+class _ReadScope:
+    __slots__ = ('alias',)
+
+    def __init__(self, alias):
+        self.alias = alias
+
+
+_scope = ContextVar('freecs_replica_scope', default=None)
+
+
+@contextmanager
+def reading_from(alias):
+    # alias None reads from the primary
+    token = _scope.set(_ReadScope(alias))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def use_primary():
+    return reading_from(None)
+
+
+def current_replica():
+    scope = _scope.get()
+    return None if scope is None else scope.alias
+
+
+def wrote_recently(request):
+    return request.get_signed_cookie(STICKY_COOKIE, default=None, salt=_COOKIE_SALT,
+                                     max_age=STICKY_SECONDS) is not None
+
+
+def on_replica(queryset, request=None):
+    # pins one queryset to a replica, for reads that outlive the view's scope
+    if request is not None and wrote_recently(request):
+        return queryset
+    alias = pick_replica()
+    return queryset.using(alias) if alias else queryset
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        scope = _scope.get()
+        if scope is None:
+            return None
+        if scope.alias is not None and connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            scope.alias = None
+        return scope.alias or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        scope = _scope.get()
+        if scope is not None:
+            # the rest of the scope reads its own writes
+            scope.alias = None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        aliases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+class ReplicaReadMixin:
+    # put first in the bases of read-only views
+    def dispatch(self, request, *args, **kwargs):
+        alias = None
+        if request.method in SAFE_METHODS and not wrote_recently(request):
+            alias = pick_replica()
+        with reading_from(alias):
+            return super().dispatch(request, *args, **kwargs)
+
+
+class StickyPrimaryMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_signed_cookie(STICKY_COOKIE, '1', salt=_COOKIE_SALT, max_age=STICKY_SECONDS,
+                                       httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,225 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache as version_store
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+
+from . import replicas
+
+# Response cache for the read-heavy catalogue endpoints.
+#
+# A cached view lists the data scopes its payload depends on ("courses",
+# "categories", "instructors"). Each scope has a version token in the shared
+# Django cache, and the signal handlers in signals.py replace it when a model
+# in that scope changes. A response is stored under its route, sorted query
+# string and the current scope versions, so writes invalidate exactly the
+# responses built from the old data and nothing expires on a timer. The ETag
+# is derived from that same key, which lets If-None-Match be answered with a
+# 304 before the view runs. Version tokens carry the time they were made: a
+# response read from a replica isn't stored until its versions are older than
+# replicas.SETTLE_SECONDS, or a lagging replica could put pre-write data under
+# the post-write version.
+#
+# Configured with FREECS_RESPONSE_CACHE, e.g.
+#     {'BACKEND': 'lru', 'MAX_ENTRIES': 2048, 'MAX_BYTES': 64 * 1024 * 1024}
+#     {'BACKEND': 'django', 'ALIAS': 'default', 'TIMEOUT': None}
+
+class CacheStats:
+    fields = ('hits', 'misses', 'not_modified', 'stores', 'evictions', 'invalidations')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counts[name] += amount
+
+    def reset(self):
+        with self._lock:
+            self._counts = dict.fromkeys(self.fields, 0)
+
+    def as_dict(self):
+        with self._lock:
+            return dict(self._counts)
+
+
+stats = CacheStats()
+
+
+class LRUCacheBackend:
+    # in-process, bounded by entry count and by total payload bytes
+    def __init__(self, max_entries=1024, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        size = len(entry[0])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[0])
+            self._entries[key] = entry
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted[0])
+                stats.incr('evictions')
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DjangoCacheBackend:
+    # shared between workers; eviction is up to the configured cache
+    def __init__(self, alias='default', timeout=None):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, entry):
+        self.cache.set(key, entry, self.timeout)
+
+    def clear(self):
+        pass
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        config = getattr(settings, 'FREECS_RESPONSE_CACHE', {})
+        if config.get('BACKEND', 'lru') == 'django':
+            _backend = DjangoCacheBackend(config.get('ALIAS', 'default'), config.get('TIMEOUT'))
+        else:
+            _backend = LRUCacheBackend(config.get('MAX_ENTRIES', 1024), config.get('MAX_BYTES', 32 * 1024 * 1024))
+    return _backend
+
+
+#data versions
+def _version_key(scope):
+    return f'freecs:response-cache:version:{scope}'
+
+
+def _new_version():
+    return f'{time.time():.3f}-{uuid.uuid4().hex[:16]}'
+
+
+def version_age(version):
+    # seconds since the version was made, None for tokens that don't say
+    try:
+        return time.time() - float(version.split('-', 1)[0])
+    except (AttributeError, ValueError):
+        return None
+
+
+def _settled(versions):
+    ages = [version_age(version) for version in versions]
+    return all(age is None or age > replicas.SETTLE_SECONDS for age in ages)
+
+
+def get_versions(scopes):
+    keys = [_version_key(scope) for scope in scopes]
+    versions = version_store.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # add() so concurrent first readers agree on one token
+            version_store.add(key, _new_version(), None)
+            versions[key] = version_store.get(key)
+    return [versions[key] for key in keys]
+
+
+def _replace_versions(scopes):
+    version_store.set_many({_version_key(scope): _new_version() for scope in scopes}, None)
+
+
+def invalidate(*scopes):
+    _replace_versions(scopes)
+    # and again on commit: another worker may have rebuilt from the data as it
+    # was before the commit, and must not keep that under the new version
+    transaction.on_commit(lambda: _replace_versions(scopes))
+    stats.incr('invalidations', len(scopes))
+
+
+def _etag_matches(request, etag):
+    # weak comparison, compression.py sends the tag back as W/"..."
+    header = request.META.get('HTTP_IF_NONE_MATCH', '')
+    return etag in [tag.strip().removeprefix('W/') for tag in header.split(',')] or header.strip() == '*'
+
+
+class CachedResponseMixin:
+    # put before APIView in the bases and set cache_scopes. Cache hits skip
+    # DRF's authentication and permission checks, so only use it on public views.
+    cache_scopes = ()
+
+    def cache_versions(self):
+        return get_versions(self.cache_scopes)
+
+    def cache_key(self, request, versions):
+        query = sorted(request.GET.lists())
+        parts = [
+            request.scheme, request.get_host(), request.path, repr(query),
+            request.META.get('HTTP_ACCEPT', ''), *versions,
+        ]
+        return 'freecs:response:' + hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != 'GET' or not self.cache_scopes:
+            return super().dispatch(request, *args, **kwargs)
+
+        versions = self.cache_versions()
+        key = self.cache_key(request, versions)
+        etag = f'"{key.rsplit(":", 1)[1]}"'
+        if _etag_matches(request, etag):
+            stats.incr('not_modified')
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+        backend = get_backend()
+        entry = backend.get(key)
+        if entry is not None:
+            stats.incr('hits')
+            content, content_type = entry
+            response = HttpResponse(content, content_type=content_type)
+        else:
+            stats.incr('misses')
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming:
+                return response
+            response.render()
+            if replicas.current_replica() is None or _settled(versions):
+                backend.set(key, (response.content, response['Content-Type']))
+                stats.incr('stores')
+
+        response['ETag'] = etag
+        patch_vary_headers(response, ['Accept'])
+        return response
@@ -0,0 +1,231 @@
+import re
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Q, Sum, When
+from django.db.models.functions import Abs
+
+from .models import Course, CoursePosting, SearchTerm
+
+# Inverted index over course name, description, category names and
+# instructor skills. Every distinct token is a SearchTerm row and every
+# (term, course) pair a CoursePosting carrying the field-weighted term
+# frequency. The index is kept current by the handlers in signals.py; a full
+# rebuild is `manage.py rebuild_search_index`.
+#
+# A query token matches terms exactly, as a prefix, or within one typo (two
+# from 8 letters on), the first letter included. A search is two queries
+# however many tokens it has: one reads every token's candidate terms, each
+# token's prefix and typo lookups capped in subqueries of their own, and one
+# ranks the courses by their postings.
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+STOP_WORDS = {'a', 'an', 'and', 'the', 'of', 'to', 'in', 'for', 'on', 'with', 'is', 'by', 'at', 'or'}
+MAX_TERM_LENGTH = 64
+MAX_QUERY_TOKENS = 8
+MAX_EXPANSIONS = 50
+MAX_TYPO_CANDIDATES = 2000
+
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'category': 2.0,
+    'skills': 1.5,
+    'description': 1.0,
+}
+
+# how much a query token scores when it matches a term exactly, by prefix or with a typo
+EXACT, PREFIX, FUZZY = 1.0, 0.6, 0.4
+
+
+def tokenize(text):
+    tokens = []
+    for token in TOKEN_RE.findall(str(text).lower()):
+        if len(token) < 2 or token in STOP_WORDS:
+            continue
+        tokens.append(token[:MAX_TERM_LENGTH])
+    return tokens
+
+
+def skill_strings(skills):
+    if isinstance(skills, dict):
+        for value in skills.values():
+            yield from skill_strings(value)
+    elif isinstance(skills, (list, tuple)):
+        for value in skills:
+            yield from skill_strings(value)
+    elif skills is not None:
+        yield str(skills)
+
+
+def course_term_weights(course):
+    # expects category and instructors to be prefetched when indexing in bulk
+    weights = defaultdict(float)
+    fields = [
+        ('name', [course.name]),
+        ('description', [course.description]),
+        ('category', [category.name for category in course.category.all()]),
+        ('skills', [s for instructor in course.instructors.all() for s in skill_strings(instructor.skills)]),
+    ]
+    for field, texts in fields:
+        for text in texts:
+            for token in tokenize(text):
+                weights[token] += FIELD_WEIGHTS[field]
+    return weights
+
+
+def _term_ids(terms):
+    SearchTerm.objects.bulk_create([SearchTerm(term=term, length=len(term), tail=term[1:]) for term in terms],
+                                   ignore_conflicts=True, batch_size=1000)
+    return dict(SearchTerm.objects.filter(term__in=terms).values_list('term', 'id'))
+
+
+def index_courses(courses):
+    courses = list(courses)
+    if not courses:
+        return
+    per_course = {course.pk: course_term_weights(course) for course in courses}
+    all_terms = set()
+    for weights in per_course.values():
+        all_terms.update(weights)
+
+    with transaction.atomic():
+        term_ids = _term_ids(list(all_terms)) if all_terms else {}
+        CoursePosting.objects.filter(course_id__in=per_course.keys()).delete()
+        CoursePosting.objects.bulk_create([
+            CoursePosting(term_id=term_ids[term], course_id=course_id, weight=weight)
+            for course_id, weights in per_course.items()
+            for term, weight in weights.items()
+        ], batch_size=1000)
+
+
+def reindex_course_ids(course_ids, batch_size=500):
+    course_ids = list(course_ids)
+    for start in range(0, len(course_ids), batch_size):
+        batch = course_ids[start:start + batch_size]
+        index_courses(Course.objects.filter(id__in=batch).prefetch_related('category', 'instructors'))
+
+
+def rebuild_index(batch_size=500):
+    CoursePosting.objects.all().delete()
+    reindex_course_ids(Course.objects.order_by('id').values_list('id', flat=True), batch_size=batch_size)
+    SearchTerm.objects.filter(postings__isnull=True).delete()
+
+
+def edit_distance(a, b, limit):
+    # Levenshtein distance, giving up as soon as it exceeds limit
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def _max_typos(token):
+    if len(token) < 4:
+        return 0
+    return 1 if len(token) < 8 else 2
+
+
+def _prefix_candidates(token):
+    # the exact term and its prefix expansions, shortest first
+    return (SearchTerm.objects.filter(term__startswith=token).order_by('length', 'term')
+            .values('id')[:MAX_EXPANSIONS + 1])
+
+
+def _typo_candidates(token, typos):
+    # terms of about the token's length that share its first letter, or that have a typo there: a tail
+    # starting like the token's (a wrong first letter) or like the token (a missing one), or a term
+    # starting like the token's tail (an extra one). Closest length and longest run of the token's
+    # later letters first; capped on its own so it can't crowd out the prefix expansions
+    shared = Case(*[When(tail__startswith=token[1:n], then=len(token) - n) for n in range(len(token), 1, -1)],
+                  default=len(token))
+    return (SearchTerm.objects
+            .filter(Q(term__startswith=token[0]) | Q(tail__startswith=token[1:3]) | Q(tail__startswith=token[:2])
+                    | Q(term__startswith=token[1:3]),
+                    length__range=(len(token) - typos, len(token) + typos))
+            .exclude(term__startswith=token)
+            .order_by(Abs(F('length') - len(token)), shared, 'term')
+            .values('id')[:MAX_TYPO_CANDIDATES])
+
+
+def _query_tokens(text):
+    # {token: typos allowed}
+    return {token: _max_typos(token) for token in tokenize(text)[:MAX_QUERY_TOKENS]}
+
+
+def _candidates(tokens):
+    # every token's candidate terms in one query, each lookup capped in a subquery of its own
+    lookups = Q()
+    for token, typos in tokens.items():
+        lookups |= Q(id__in=_prefix_candidates(token))
+        if typos:
+            lookups |= Q(id__in=_typo_candidates(token, typos))
+    return SearchTerm.objects.filter(lookups).order_by('length', 'term').values_list('id', 'term')
+
+
+def _classify(token, typos, candidates):
+    matches, prefixes = {}, 0
+    for term_id, term in candidates:
+        if term == token:
+            matches[term_id] = EXACT
+        elif term.startswith(token):
+            if prefixes < MAX_EXPANSIONS:
+                matches[term_id] = PREFIX
+                prefixes += 1
+        elif typos and edit_distance(token, term, typos) <= typos:
+            matches[term_id] = FUZZY
+    return matches
+
+
+def _factors(tokens, candidates):
+    # returns {term_id: factor} for the vocabulary terms the query tokens match
+    factors = {}
+    for token, typos in tokens.items():
+        _merge(factors, _classify(token, typos, candidates))
+    return factors
+
+
+def _merge(factors, matches):
+    for term_id, factor in matches.items():
+        factors[term_id] = max(factor, factors.get(term_id, 0))
+
+
+def _ranked(factors, offset, limit):
+    groups = defaultdict(list)
+    for term_id, factor in factors.items():
+        groups[factor].append(term_id)
+    score = Sum(Case(
+        *[When(term_id__in=ids, then=F('weight') * factor) for factor, ids in groups.items()],
+        output_field=FloatField(),
+    ))
+    ranked = (CoursePosting.objects.filter(term_id__in=factors.keys())
+              .values('course_id')
+              .annotate(score=score)
+              .order_by('-score', 'course_id')
+              .values_list('course_id', flat=True))
+    return ranked[offset:offset + limit + 1]
+
+
+def search_course_ids(text, offset=0, limit=20):
+    # returns (course ids ranked by score, has_more)
+    tokens = _query_tokens(text)
+    factors = _factors(tokens, list(_candidates(tokens))) if tokens else {}
+    if not factors:
+        return [], False
+    ids = list(_ranked(factors, offset, limit))
+    return ids[:limit], len(ids) > limit
+
+
+async def asearch_course_ids(text, offset=0, limit=20):
+    tokens = _query_tokens(text)
+    factors = _factors(tokens, [row async for row in _candidates(tokens)]) if tokens else {}
+    if not factors:
+        return [], False
+    ids = [course_id async for course_id in _ranked(factors, offset, limit)]
+    return ids[:limit], len(ids) > limit
@@ -2,12 +2,14 @@ from rest_framework import serializers
 
 from django.contrib.auth.models import User
 from .models import Category, Course, Enrollment, Instructor, Member, Preference
+from .field_cache import CachedFieldsMixin
+from .fragments import FragmentCacheMixin
+from .tasks import send_email_later
 from django.utils.encoding import smart_str,force_bytes,DjangoUnicodeDecodeError
 from django.utils.http import urlsafe_base64_decode,urlsafe_base64_encode
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
-from django.core.mail import send_mail
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['username', 'password','email','first_name', 'last_name']
@@ -22,7 +24,7 @@ class UserSerializer(serializers.ModelSerializer):
         )
         return user
 
-class MemberSerializer(serializers.ModelSerializer):
+class MemberSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     user = UserSerializer()
 
     class Meta:
@@ -38,19 +40,19 @@ class MemberSerializer(serializers.ModelSerializer):
         return member
     
     #instructor list serializer 
-class InstructorSerializer(serializers.ModelSerializer):
+class InstructorSerializer(FragmentCacheMixin, CachedFieldsMixin, serializers.ModelSerializer):
     member=MemberSerializer()
     class Meta:
         model = Instructor
         fields = ['member', 'id','skills', 'bio', 'experience', 'rate_per_hour']
 
 #Updating Values for the Instructor
-class InstructorUpdateSerializer(serializers.ModelSerializer):
+class InstructorUpdateSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Instructor
         fields = ['skills', 'bio', 'experience', 'rate_per_hour']
 #Preference Create 
-class PreferenceCreateSerializer(serializers.ModelSerializer):
+class PreferenceCreateSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     member = serializers.PrimaryKeyRelatedField(queryset=Member.objects.all())
     category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(),many = True)
     class Meta:
@@ -60,59 +62,60 @@ class PreferenceCreateSerializer(serializers.ModelSerializer):
     
         
 #Category Serializer
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(FragmentCacheMixin, CachedFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
-        fields = ['name','id']
+        fields = ['name','id','course_count']
 #courses Serializer
-class CourseSerializer(serializers.ModelSerializer):
+class CourseSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     instructors = InstructorSerializer(many=True, read_only=True)
     category = CategorySerializer(many=True, read_only=True)
 
     class Meta:
         model = Course
-        fields = ['id', 'name', 'description', 'category', 'instructors', 'price', 'duration']
+        fields = ['id', 'name', 'description', 'category', 'instructors', 'price', 'duration', 'enrollment_count']
 
-class CourseCreateUpdateSerializer(serializers.ModelSerializer):
+class CourseCreateUpdateSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), many=True)
     instructors = serializers.PrimaryKeyRelatedField(queryset=Instructor.objects.all(), many=True)
 
     class Meta:
         model = Course
-        fields = ['id', 'name', 'description', 'category', 'instructors', 'price', 'duration']
+        fields = ['id', 'name', 'description', 'category', 'instructors', 'price', 'duration', 'capacity']
 
 
         
         
 #Enrollment Serializer
 
-class EnrollmentSerializer(serializers.ModelSerializer):
+class EnrollmentSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     member=MemberSerializer()
-    course = CourseSerializer(many=True ,read_only=True)
+    course = CourseSerializer(read_only=True)
     class Meta:
         model = Enrollment
         fields=['id','course', 'member','enrollment_date']
 
-#Enrollment Create Serializer
-    
-        
-class EnrollmentCreateSerializer(serializers.ModelSerializer):
-    member=MemberSerializer()
-    course = CourseSerializer(many=True )
-    class Meta:
-        model = Enrollment
-        fields=['id','course', 'member','enrollment_date']
+#Enrollment Create Serializer, ids only; the member comes from the token (see enrollments.py)
+class EnrollmentCreateSerializer(serializers.Serializer):
+    course = serializers.IntegerField(min_value=1, required=False)
+    courses = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, max_length=100)
+
+    def validate(self, attrs):
+        course_ids = ([attrs['course']] if 'course' in attrs else []) + list(attrs.get('courses', []))
+        if not course_ids:
+            raise serializers.ValidationError('Give a course or a list of courses.')
+        return {'courses': list(dict.fromkeys(course_ids))}
         
         
         
-class UserLoginSerializer(serializers.ModelSerializer):
+class UserLoginSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     username = serializers.CharField(max_length=255)
     password = serializers.CharField(write_only=True)
     class  Meta:
         model=User
         fields=['username', 'password']
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model=User
         fields=['id','username', 'email']
@@ -145,25 +148,23 @@ class SendPasswordResetEmailSerialize(serializers.Serializer):
 
     def validate(self, attrs):
         email = attrs.get('email')
-        if User.objects.filter(email=email).exists():
-            user = User.objects.get(email=email)
-            uid = urlsafe_base64_encode(force_bytes(user.id))
-            token = PasswordResetTokenGenerator().make_token(user)
-            link = f'http://127.0.0.1:8000/send-reset/{uid}/{token}/'
-            
-            # Send email
-            send_mail(
-                'Password Reset Request',
-                f'Click the link below to reset your password:\n{link}',
-                'from@example.com',  # Replace with your "from" email
-                [email],
-                fail_silently=False,
-            )
-            
-            return attrs
-        else:
+        user = User.objects.filter(email=email).first()
+        if user is None:
             raise serializers.ValidationError("Email does not exist.")
 
+        uid = urlsafe_base64_encode(force_bytes(user.id))
+        token = PasswordResetTokenGenerator().make_token(user)
+        link = f'http://127.0.0.1:8000/send-reset/{uid}/{token}/'
+
+        # Queue the email, the worker sends it outside the request
+        send_email_later(
+            'Password Reset Request',
+            f'Click the link below to reset your password:\n{link}',
+            [email],
+            from_email='from@example.com',  # Replace with your "from" email
+        )
+        return attrs
+
 class ResetPasswordSerializer(serializers.Serializer):
      password = serializers.CharField(max_length=255, style={'input_type': 'password'}, write_only=True)
      password2 = serializers.CharField(max_length=255, style={'input_type': 'password'}, write_only=True)
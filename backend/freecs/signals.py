@@ -0,0 +1,320 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import counters, recommendations, response_cache, skills, tasks, token_versions
+from .models import Category, Course, CourseRecommendation, Enrollment, Instructor, InstructorSkill, Member, Preference
+from .search import reindex_course_ids
+
+# Model signal handlers, connected from FreecsConfig.ready().
+
+
+def _course_ids_for(instance):
+    return list(Course.objects.filter(**{_course_lookup(instance): instance}).values_list('id', flat=True))
+
+
+def _course_lookup(instance):
+    return 'category' if isinstance(instance, Category) else 'instructors'
+
+
+#denormalized counters, connected first so the handlers below read fresh counts
+@receiver(pre_save, sender=Enrollment)
+def remember_enrolled_course(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        instance._counted_course_id = (Enrollment.objects.filter(pk=instance.pk)
+                                       .values_list('course_id', flat=True).first())
+
+
+@receiver(post_save, sender=Enrollment)
+def count_saved_enrollment(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        counters.add_enrollments(instance.course_id)
+        return
+    previous = getattr(instance, '_counted_course_id', None)
+    if previous != instance.course_id:
+        counters.reconcile_enrollment_counts([previous, instance.course_id])
+
+
+@receiver(post_delete, sender=Enrollment)
+def count_deleted_enrollment(sender, instance, **kwargs):
+    counters.remove_enrollment(instance.course_id)
+
+
+@receiver(m2m_changed, sender=Course.category.through)
+def count_category_courses(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and not reverse:
+        instance._counted_category_ids = list(instance.category.values_list('id', flat=True))
+        return
+    if action == 'post_add':
+        # Django drops already-linked ids from pk_set before post_add
+        if reverse:
+            counters.add_courses([instance.pk], len(pk_set or ()))
+        else:
+            counters.add_courses(pk_set or ())
+    elif action in ('post_remove', 'post_clear'):
+        # post_remove gets the requested ids, linked or not, so recount instead
+        if reverse:
+            counters.reconcile_course_counts([instance.pk])
+        elif action == 'post_clear':
+            counters.reconcile_course_counts(getattr(instance, '_counted_category_ids', []))
+        else:
+            counters.reconcile_course_counts(pk_set or [])
+
+
+@receiver(pre_delete, sender=Course)
+def remember_counted_categories(sender, instance, **kwargs):
+    instance._counted_category_ids = list(instance.category.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Course)
+def count_deleted_course(sender, instance, **kwargs):
+    # the cascade removes the through rows without m2m_changed
+    counters.reconcile_course_counts(getattr(instance, '_counted_category_ids', []))
+
+
+#search index
+@receiver(post_save, sender=Course)
+def index_saved_course(sender, instance, raw=False, **kwargs):
+    if not raw:
+        reindex_course_ids([instance.pk])
+
+
+@receiver(m2m_changed, sender=Course.category.through)
+@receiver(m2m_changed, sender=Course.instructors.through)
+def index_course_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # the cleared course ids are gone by post_clear
+        instance._search_cleared_ids = _course_ids_for(instance)
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        reindex_course_ids([instance.pk])
+    elif action == 'post_clear':
+        reindex_course_ids(getattr(instance, '_search_cleared_ids', []))
+    else:
+        reindex_course_ids(pk_set or [])
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Instructor)
+def index_courses_of_saved_relation(sender, instance, created=False, raw=False, **kwargs):
+    # a new category or instructor has no courses yet
+    if not created and not raw:
+        reindex_course_ids(_course_ids_for(instance))
+
+
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=Instructor)
+def remember_courses_of_deleted_relation(sender, instance, **kwargs):
+    instance._search_deleted_ids = _course_ids_for(instance)
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Instructor)
+def index_courses_of_deleted_relation(sender, instance, **kwargs):
+    reindex_course_ids(getattr(instance, '_search_deleted_ids', []))
+
+
+#instructor skill index
+@receiver(post_save, sender=Instructor)
+def index_instructor_skills(sender, instance, raw=False, **kwargs):
+    if not raw:
+        skills.reindex_instructor_ids([instance.pk])
+
+
+@receiver(pre_delete, sender=Instructor)
+def remember_instructor_skills(sender, instance, **kwargs):
+    instance._indexed_skill_ids = list(InstructorSkill.objects.filter(instructor=instance)
+                                       .values_list('skill_id', flat=True))
+
+
+@receiver(post_delete, sender=Instructor)
+def forget_deleted_instructor_skills(sender, instance, **kwargs):
+    skills.forget_instructor_skills(getattr(instance, '_indexed_skill_ids', []))
+
+
+#preferred-course recommendations
+@receiver(m2m_changed, sender=Preference.category.through)
+def recommend_for_changed_preference(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._recommendation_cleared_members = list(instance.preference_set.values_list('member_id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        recommendations.recompute_member(instance.member_id)
+        return
+    if action == 'post_clear':
+        member_ids = getattr(instance, '_recommendation_cleared_members', [])
+    else:
+        member_ids = Preference.objects.filter(pk__in=pk_set or []).values_list('member_id', flat=True)
+    for member_id in member_ids:
+        recommendations.recompute_member(member_id)
+
+
+@receiver(post_delete, sender=Preference)
+def recommend_for_deleted_preference(sender, instance, **kwargs):
+    recommendations.recompute_member(instance.member_id)
+
+
+@receiver(m2m_changed, sender=Course.category.through)
+def recommend_for_course_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._recommendation_cleared_courses = _course_ids_for(instance)
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        course_ids = [instance.pk]
+    elif action == 'post_clear':
+        course_ids = getattr(instance, '_recommendation_cleared_courses', [])
+    else:
+        course_ids = pk_set or []
+    if course_ids:
+        tasks.enqueue('recompute_course_recommendations', {'course_ids': sorted(course_ids)})
+
+
+@receiver(pre_delete, sender=Category)
+def remember_recommended_courses_of_category(sender, instance, **kwargs):
+    instance._recommendation_courses = _course_ids_for(instance)
+
+
+@receiver(post_delete, sender=Category)
+def recommend_for_deleted_category(sender, instance, **kwargs):
+    # preferences for the category lose it as well, so recompute their members too
+    course_ids = getattr(instance, '_recommendation_courses', [])
+    if course_ids:
+        tasks.enqueue('recompute_course_recommendations', {'course_ids': sorted(course_ids)})
+
+
+@receiver(pre_delete, sender=Course)
+def remember_members_of_deleted_course(sender, instance, **kwargs):
+    instance._recommendation_members = list(
+        CourseRecommendation.objects.filter(course=instance).values_list('member_id', flat=True))
+
+
+@receiver(post_delete, sender=Course)
+def recommend_without_deleted_course(sender, instance, **kwargs):
+    recommendations.forget_course(getattr(instance, '_recommendation_members', []))
+
+
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def recommend_with_new_popularity(sender, instance, raw=False, **kwargs):
+    # a popular course has a row for every member preferring its categories, so the worker rescores them
+    if not raw and instance.course_id:
+        course_ids = [instance.course_id]
+        transaction.on_commit(lambda: tasks.enqueue('refresh_course_scores', {'course_ids': course_ids}))
+
+
+#response cache
+# instructor payloads nest member and user, and course payloads nest both categories and instructors
+RESPONSE_SCOPES = {
+    Course: ('courses',),
+    Category: ('categories', 'courses'),
+    Instructor: ('instructors', 'courses'),
+    Member: ('instructors', 'courses'),
+    User: ('instructors', 'courses'),
+    Enrollment: ('courses',),
+}
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_cached_responses(sender, update_fields=None, raw=False, **kwargs):
+    scopes = RESPONSE_SCOPES.get(sender)
+    if not scopes or raw:
+        return
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        # logins touch the user row but nothing any catalogue payload shows
+        return
+    response_cache.invalidate(*scopes)
+
+
+@receiver(m2m_changed, sender=Course.category.through)
+@receiver(m2m_changed, sender=Course.instructors.through)
+def invalidate_cached_course_links(sender, action, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if sender is Course.category.through:
+        # category course counts moved
+        response_cache.invalidate('categories', 'courses')
+    else:
+        response_cache.invalidate('courses')
+
+
+#row versions: category and instructor versions key cached fragments, course
+# and instructor versions tell the catalogue snapshot which rows to reload
+def _bump_version(queryset):
+    queryset.update(version=F('version') + 1)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Instructor)
+@receiver(post_save, sender=Course)
+def bump_row_version(sender, instance, created=False, raw=False, **kwargs):
+    if created or raw:
+        return
+    _bump_version(sender.objects.filter(pk=instance.pk))
+    instance.version += 1
+
+
+@receiver(m2m_changed, sender=Course.category.through)
+@receiver(m2m_changed, sender=Course.instructors.through)
+def bump_linked_courses(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._version_cleared_ids = _course_ids_for(instance)
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        _bump_version(Course.objects.filter(pk=instance.pk))
+        instance.version += 1
+    elif action == 'post_clear':
+        _bump_version(Course.objects.filter(id__in=getattr(instance, '_version_cleared_ids', [])))
+    else:
+        _bump_version(Course.objects.filter(id__in=list(pk_set or [])))
+
+
+@receiver(pre_delete, sender=Category)
+@receiver(pre_delete, sender=Instructor)
+def remember_versioned_courses(sender, instance, **kwargs):
+    instance._version_deleted_ids = _course_ids_for(instance)
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Instructor)
+def bump_courses_of_deleted_relation(sender, instance, **kwargs):
+    # the cascade drops the links without m2m_changed
+    _bump_version(Course.objects.filter(id__in=getattr(instance, '_version_deleted_ids', [])))
+
+
+@receiver(post_save, sender=Member)
+def bump_instructor_of_member(sender, instance, raw=False, **kwargs):
+    if not raw:
+        _bump_version(Instructor.objects.filter(member=instance))
+
+
+@receiver(post_save, sender=User)
+def bump_instructor_of_user(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    _bump_version(Instructor.objects.filter(member__user=instance))
+
+
+#token versions
+@receiver(post_save, sender=User)
+def refresh_token_version(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields is not None and not {'password', 'is_active'} & set(update_fields)):
+        return
+    token_versions.remember_token_version(instance)
+
+
+@receiver(post_delete, sender=User)
+def drop_token_version(sender, instance, **kwargs):
+    token_versions.forget_token_version(instance.pk)
@@ -0,0 +1,170 @@
+import heapq
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from rest_framework import serializers
+
+from .models import Instructor, InstructorSkill, Skill
+from .search import skill_strings
+
+# Instructor skill index and skill search.
+#
+# Every string in an instructor's skills JSON, lowercased with its whitespace
+# collapsed, is a Skill row, and each (skill, instructor) pair an
+# InstructorSkill carrying the instructor's experience and rate. The links
+# are kept current by the handlers in signals.py, so InstructorUpdateView and
+# admin saves show up in the next search; a full rebuild is
+# `manage.py rebuild_skill_index`.
+#
+# Results are ranked by experience, most first, then instructor id, and read
+# from skill_rank_idx:
+# - one skill, or ?skill_match=all: the rarest skill's links are walked in
+#   rank order and every other skill is a unique-index probe per instructor;
+# - ?skill_match=any: each skill's first offset+limit+1 links are read in
+#   rank order and merged, dropping instructors seen under an earlier skill.
+# A page costs a few index range scans however many instructors there are.
+# Experience and rate ranges filter the walked links; instructors without an
+# experience rank and filter as 0, those without a rate match no rate range.
+
+MAX_SKILL_LENGTH = 64
+MAX_QUERY_SKILLS = 10
+
+
+def normalize_skill(text):
+    return ' '.join(str(text).lower().split())[:MAX_SKILL_LENGTH]
+
+
+def skill_names(skills):
+    # distinct normalized names in an Instructor.skills value, in order
+    names = (normalize_skill(text) for text in skill_strings(skills))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+#index
+def _skill_ids(names):
+    Skill.objects.bulk_create([Skill(name=name) for name in names], ignore_conflicts=True, batch_size=1000)
+    return dict(Skill.objects.filter(name__in=names).values_list('name', 'id'))
+
+
+def _count(deltas):
+    by_delta = defaultdict(list)
+    for skill_id, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(skill_id)
+    for delta, skill_ids in by_delta.items():
+        Skill.objects.filter(id__in=skill_ids).update(instructor_count=F('instructor_count') + delta)
+
+
+def index_instructors(instructors):
+    instructors = list(instructors)
+    if not instructors:
+        return
+    wanted = {instructor.pk: skill_names(instructor.skills) for instructor in instructors}
+    all_names = {name for names in wanted.values() for name in names}
+
+    with transaction.atomic():
+        # concurrent saves of an instructor would both add its new links
+        list(Instructor.objects.select_for_update().filter(pk__in=wanted.keys()).order_by('pk').values_list('pk'))
+        skill_ids = _skill_ids(list(all_names)) if all_names else {}
+        existing = {(link.instructor_id, link.skill_id): link
+                    for link in InstructorSkill.objects.filter(instructor_id__in=wanted.keys())}
+        added, changed = [], []
+        for instructor in instructors:
+            experience = instructor.experience or 0
+            for name in wanted[instructor.pk]:
+                link = existing.pop((instructor.pk, skill_ids[name]), None)
+                if link is None:
+                    added.append(InstructorSkill(instructor_id=instructor.pk, skill_id=skill_ids[name],
+                                                 experience=experience, rate_per_hour=instructor.rate_per_hour))
+                elif (link.experience, link.rate_per_hour) != (experience, instructor.rate_per_hour):
+                    link.experience, link.rate_per_hour = experience, instructor.rate_per_hour
+                    changed.append(link)
+        removed = list(existing.values())
+        if removed:
+            InstructorSkill.objects.filter(id__in=[link.id for link in removed]).delete()
+        InstructorSkill.objects.bulk_create(added, batch_size=1000)
+        InstructorSkill.objects.bulk_update(changed, ['experience', 'rate_per_hour'], batch_size=1000)
+        deltas = Counter(link.skill_id for link in added)
+        deltas.subtract(link.skill_id for link in removed)
+        _count(deltas)
+
+
+def reindex_instructor_ids(instructor_ids, batch_size=2000):
+    instructor_ids = list(instructor_ids)
+    for start in range(0, len(instructor_ids), batch_size):
+        batch = instructor_ids[start:start + batch_size]
+        index_instructors(Instructor.objects.filter(id__in=batch).only('id', 'skills', 'experience', 'rate_per_hour'))
+
+
+def forget_instructor_skills(skill_ids):
+    # the links of a deleted instructor go with its cascade, without signals
+    _count(Counter({skill_id: -1 for skill_id in skill_ids}))
+
+
+def rebuild_index(batch_size=2000):
+    with transaction.atomic():
+        InstructorSkill.objects.all().delete()
+        Skill.objects.update(instructor_count=0)
+    reindex_instructor_ids(Instructor.objects.order_by('id').values_list('id', flat=True), batch_size=batch_size)
+    Skill.objects.filter(instructor_count=0).delete()
+
+
+#search
+class SkillsField(serializers.ListField):
+    # ?skills=python,web design or ?skills=python&skills=rust
+    child = serializers.CharField(max_length=MAX_SKILL_LENGTH)
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = [data]
+        return super().to_internal_value([part for item in data for part in str(item).split(',') if part.strip()])
+
+
+class InstructorSearchSerializer(serializers.Serializer):
+    skills = SkillsField(min_length=1, max_length=MAX_QUERY_SKILLS)
+    skill_match = serializers.ChoiceField(['any', 'all'], default='any')
+    min_experience = serializers.IntegerField(required=False)
+    max_experience = serializers.IntegerField(required=False)
+    min_rate = serializers.DecimalField(max_digits=8, decimal_places=2, required=False)
+    max_rate = serializers.DecimalField(max_digits=8, decimal_places=2, required=False)
+
+
+def _ranked_links(skill_id, ranges):
+    return (InstructorSkill.objects.filter(skill_id=skill_id, **ranges)
+            .order_by('-experience', 'instructor_id').values_list('experience', 'instructor_id'))
+
+
+def search_instructor_ids(skills, skill_match='any', min_experience=None, max_experience=None, min_rate=None,
+                          max_rate=None, offset=0, limit=20):
+    # returns (instructor ids ranked by experience, has_more)
+    names = list(dict.fromkeys(name for name in map(normalize_skill, skills) if name))[:MAX_QUERY_SKILLS]
+    counts = dict(Skill.objects.filter(name__in=names).values_list('id', 'instructor_count'))
+    if not counts or (skill_match == 'all' and len(counts) < len(names)):
+        return [], False
+    ranges = {lookup: value for lookup, value in [
+        ('experience__gte', min_experience), ('experience__lte', max_experience),
+        ('rate_per_hour__gte', min_rate), ('rate_per_hour__lte', max_rate),
+    ] if value is not None}
+
+    if skill_match == 'all' or len(counts) == 1:
+        rarest, *others = sorted(counts, key=counts.get)
+        links = _ranked_links(rarest, ranges)
+        for skill_id in others:
+            links = links.filter(Exists(InstructorSkill.objects.filter(skill_id=skill_id,
+                                                                       instructor_id=OuterRef('instructor_id'))))
+        ids = [instructor_id for _, instructor_id in links[offset:offset + limit + 1]]
+    else:
+        # an instructor's links all have the same rank, so the first offset+limit+1
+        # distinct ones of the merge are among each skill's first offset+limit+1
+        wanted = offset + limit + 1
+        streams = [list(_ranked_links(skill_id, ranges)[:wanted]) for skill_id in counts]
+        ids, seen = [], set()
+        for _, instructor_id in heapq.merge(*streams, key=lambda row: (-row[0], row[1])):
+            if instructor_id not in seen:
+                seen.add(instructor_id)
+                ids.append(instructor_id)
+                if len(ids) == wanted:
+                    break
+        ids = ids[offset:]
+    return ids[:limit], len(ids) > limit
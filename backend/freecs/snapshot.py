@@ -0,0 +1,490 @@
+import re
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from itertools import chain
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from . import replicas, response_cache
+from .compiled import serialize
+from .models import Category, Course, Instructor
+from .query_plan import optimize_queryset
+from .serializers import CategorySerializer, CourseSerializer, InstructorSerializer
+
+# In-memory snapshot of the course catalogue for the read endpoints.
+#
+# Courses are held as parallel columns in id order: arrays of ids, versions,
+# prices in cents, durations, enrollment counts and creation times, plus name
+# and description lists. Each course's category and instructor ids sit in one flat array with
+# an offsets array (course i owns links[offsets[i]:offsets[i + 1]]), and each
+# category also has a bitset over course positions, so "courses in any/all of
+# these categories" is a few big-integer ORs and ANDs. Price and duration
+# also keep bitsets for RANGE_SLICES equal slices of their sort order, which
+# range filters OR together (see facets.py). Category and instructor payloads
+# are serialized once per snapshot and shared by every course that links
+# them; category names are interned. The sort orders of the list endpoints
+# are precomputed position arrays.
+#
+# A snapshot is immutable. It remembers the response-cache versions of the
+# courses, categories and instructors scopes it was built from. When they
+# move, the next reader starts a rebuild, which reloads the category table,
+# instructors whose version changed and courses whose version changed (see
+# the row versions in signals.py), then swaps the new snapshot in with one
+# assignment. Until then readers keep the previous snapshot, so a page can
+# lag a write by one rebuild; views key cached responses by snapshot token,
+# which is made of those versions, so a lagging page is never cached under
+# the newer data's versions. A reader inside a transaction rebuilds inline,
+# since a background thread wouldn't see its writes, and so does a client that
+# wrote within STICKY_SECONDS (replicas.wrote_recently), so it reads its writes.
+# FREECS_SNAPSHOT = {'BACKGROUND': False} always rebuilds inline. Names sort
+# by code point, which can differ from a database collation.
+
+SCOPES = ('courses', 'categories', 'instructors')
+BACKGROUND = getattr(settings, 'FREECS_SNAPSHOT', {}).get('BACKGROUND', True)
+CHUNK_SIZE = 2000
+RANGE_SLICES = 64
+COURSE_COLUMNS = ('id', 'version', 'name', 'description', 'price', 'duration', 'enrollment_count', 'created_at')
+
+_price_field = CourseSerializer().fields['price']
+_nonzero = re.compile(rb'[^\x00]')
+
+
+def to_cents(price):
+    return int(price.scaleb(2))
+
+
+def from_cents(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def _epoch(value):
+    return datetime(1970, 1, 1, tzinfo=dt_timezone.utc if value.tzinfo else None)
+
+
+def _micros(value):
+    return (value - _epoch(value)) // timedelta(microseconds=1)
+
+
+def _datetime(micros):
+    epoch = datetime(1970, 1, 1, tzinfo=dt_timezone.utc if settings.USE_TZ else None)
+    return epoch + timedelta(microseconds=micros)
+
+
+#tables
+class Table:
+    # sort field -> column attribute; 'id' is always sortable
+    fields = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def column(self, field):
+        return self.ids if field == 'id' else getattr(self, self.fields[field])
+
+    def order(self, field):
+        # positions sorted by (field, id); positions are already in id order and sorted() is stable
+        order = self._orders.get(field)
+        if order is None:
+            if field == 'id':
+                order = range(len(self.ids))
+            else:
+                order = array('q', sorted(range(len(self.ids)), key=self.column(field).__getitem__))
+            self._orders[field] = order
+        return order
+
+    def sort_key(self, field):
+        column, ids = self.column(field), self.ids
+        return lambda position: (column[position], ids[position])
+
+    def cursor_key(self, field, value):
+        # a cursor value, as encoded from cursor_row, in the column's terms
+        return value
+
+    def cursor_value(self, field, position):
+        return self.column(field)[position]
+
+    def cursor_row(self, position):
+        # stands in for the model row when KeysetPagination encodes a cursor
+        values = {field: self.cursor_value(field, position) for field in self.fields}
+        return SimpleNamespace(pk=self.ids[position], **values)
+
+    def position(self, row_id):
+        index = bisect_left(self.ids, row_id)
+        if index < len(self.ids) and self.ids[index] == row_id:
+            return index
+        return None
+
+
+class CategoryTable(Table):
+    fields = {'name': 'names', 'course_count': 'course_counts'}
+
+    def __init__(self, categories):
+        self._orders = {}
+        for category in categories:
+            category.name = sys.intern(category.name)
+        self.ids = array('q', (category.id for category in categories))
+        self.names = [category.name for category in categories]
+        self.course_counts = array('q', (category.course_count for category in categories))
+        self.payloads = serialize(CategorySerializer, categories)
+        self.by_id = dict(zip(self.ids, self.payloads))
+        for field in self.fields:
+            self.order(field)
+
+
+class CourseTable(Table):
+    fields = {'name': 'names', 'price': 'prices', 'duration': 'durations', 'enrollment_count': 'enrollments',
+              'created_at': 'created'}
+    range_fields = ('price', 'duration')
+
+    def __init__(self, rows):
+        # rows: (id, version, name, description, cents, duration, enrollments, created micros,
+        # category ids, instructor ids)
+        self._orders = {}
+        self._memo = {}
+        self.ids, self.versions = array('q'), array('q')
+        self.names, self.descriptions = [], []
+        self.prices, self.durations, self.enrollments, self.created = array('q'), array('q'), array('q'), array('q')
+        self.category_offsets, self.category_links = array('q', [0]), array('q')
+        self.instructor_offsets, self.instructor_links = array('q', [0]), array('q')
+        for (course_id, version, name, description, cents, duration, enrollments, created,
+             category_ids, instructor_ids) in rows:
+            self.ids.append(course_id)
+            self.versions.append(version)
+            self.names.append(name)
+            self.descriptions.append(description)
+            self.prices.append(cents)
+            self.durations.append(duration)
+            self.enrollments.append(enrollments)
+            self.created.append(created)
+            self.category_links.extend(category_ids)
+            self.category_offsets.append(len(self.category_links))
+            self.instructor_links.extend(instructor_ids)
+            self.instructor_offsets.append(len(self.instructor_links))
+        self.category_bits = self._category_bits()
+        self.instructor_positions = self._instructor_positions()
+        for field in self.fields:
+            self.order(field)
+        self.range_slices = {field: self._range_slices(field) for field in self.range_fields}
+
+    def _category_bits(self):
+        size = len(self.ids) // 8 + 1
+        masks = {}
+        offsets, links = self.category_offsets, self.category_links
+        for position in range(len(self.ids)):
+            for category_id in links[offsets[position]:offsets[position + 1]]:
+                mask = masks.get(category_id)
+                if mask is None:
+                    mask = masks[category_id] = bytearray(size)
+                mask[position >> 3] |= 1 << (position & 7)
+        return {category_id: int.from_bytes(mask, 'little') for category_id, mask in masks.items()}
+
+    def _instructor_positions(self):
+        # instructors are too many for a bitset each, their courses are few
+        positions = {}
+        offsets, links = self.instructor_offsets, self.instructor_links
+        for position in range(len(self.ids)):
+            for instructor_id in links[offsets[position]:offsets[position + 1]]:
+                positions.setdefault(instructor_id, array('q')).append(position)
+        return positions
+
+    def _range_slices(self, field):
+        order = self.order(field)
+        step = max(-(-len(order) // RANGE_SLICES), 1)
+        return step, [self.mask_of(order[start:start + step]) for start in range(0, len(order), step)]
+
+    def row(self, position):
+        categories = self.category_links[self.category_offsets[position]:self.category_offsets[position + 1]]
+        instructors = self.instructor_links[self.instructor_offsets[position]:self.instructor_offsets[position + 1]]
+        return (self.ids[position], self.versions[position], self.names[position], self.descriptions[position],
+                self.prices[position], self.durations[position], self.enrollments[position], self.created[position],
+                categories, instructors)
+
+    def cursor_key(self, field, value):
+        if field == 'price':
+            return to_cents(Decimal(value))
+        if field == 'created_at':
+            return _micros(datetime.fromisoformat(value))
+        return value
+
+    def cursor_value(self, field, position):
+        value = self.column(field)[position]
+        if field == 'price':
+            return from_cents(value)
+        if field == 'created_at':
+            return _datetime(value)
+        return value
+
+    def memo(self, key, compute):
+        # for values derived from the immutable table, such as facet bucket bitsets
+        value = self._memo.get(key)
+        if value is None:
+            value = self._memo[key] = compute()
+        return value
+
+    def in_categories(self, category_ids, require_all=False):
+        # bitset of the course positions linked to any (or all) of the categories
+        masks = [self.category_bits.get(category_id, 0) for category_id in category_ids]
+        if not masks:
+            return 0
+        result = masks[0]
+        for mask in masks[1:]:
+            result = result & mask if require_all else result | mask
+        return result
+
+    def everything(self):
+        return (1 << len(self.ids)) - 1
+
+    def mask_of(self, positions):
+        data = bytearray(len(self.ids) // 8 + 1)
+        for position in positions:
+            data[position >> 3] |= 1 << (position & 7)
+        return int.from_bytes(data, 'little')
+
+    def positions(self, mask):
+        # the set bits of mask, ascending; zero bytes are skipped at C speed
+        data = mask.to_bytes(len(self.ids) // 8 + 1, 'little')
+        positions = array('q')
+        for match in _nonzero.finditer(data):
+            base, byte = match.start() * 8, data[match.start()]
+            positions.extend(base + bit for bit in range(8) if byte >> bit & 1)
+        return positions
+
+    def range_bounds(self, field, low=None, high=None):
+        # [start, stop) of the field's sort order holding low <= value <= high
+        order, column = self.order(field), self.column(field)
+        start = 0 if low is None else bisect_left(order, low, key=column.__getitem__)
+        stop = len(order) if high is None else bisect_right(order, high, key=column.__getitem__)
+        return start, max(start, stop)
+
+    def range_mask(self, field, low=None, high=None):
+        order = self.order(field)
+        start, stop = self.range_bounds(field, low, high)
+        step, slices = self.range_slices[field]
+        first, last = -(-start // step), stop // step
+        if first >= last:
+            return self.mask_of(order[start:stop])
+        mask = self.mask_of(chain(order[start:first * step], order[last * step:stop]))
+        for whole in slices[first:last]:
+            mask |= whole
+        return mask
+
+    def member_test(self, mask):
+        # keep() for KeysetPagination.paginate_sorted, one byte lookup per position
+        data = mask.to_bytes(len(self.ids) // 8 + 1, 'little')
+        return lambda position: data[position >> 3] >> (position & 7) & 1
+
+
+class Snapshot:
+    def __init__(self, versions, categories, instructors, instructor_versions, courses):
+        # the same for every worker's snapshot of these versions, so they share cached responses and ETags
+        self.token = 'snapshot:' + ','.join(versions)
+        self.versions = versions
+        self.built_at = time.time()
+        self.categories = categories
+        self.instructors = instructors
+        self.instructor_versions = instructor_versions
+        self.courses = courses
+
+    def course_payload(self, position):
+        # the CourseSerializer representation of one course
+        courses, categories, instructors = self.courses, self.categories.by_id, self.instructors
+        category_ids = courses.category_links[courses.category_offsets[position]:courses.category_offsets[position + 1]]
+        instructor_ids = courses.instructor_links[
+            courses.instructor_offsets[position]:courses.instructor_offsets[position + 1]]
+        return {
+            'id': courses.ids[position],
+            'name': courses.names[position],
+            'description': courses.descriptions[position],
+            'category': [categories[i] for i in category_ids if i in categories],
+            'instructors': [instructors[i] for i in instructor_ids if i in instructors],
+            'price': _price_field.to_representation(from_cents(courses.prices[position])),
+            'duration': courses.durations[position],
+            'enrollment_count': courses.enrollments[position],
+        }
+
+    def course_payloads(self, positions):
+        return [self.course_payload(position) for position in positions]
+
+    def course_payloads_by_id(self, course_ids):
+        payloads = {}
+        for course_id in course_ids:
+            position = self.courses.position(course_id)
+            if position is not None:
+                payloads[course_id] = self.course_payload(position)
+        return payloads
+
+    def category_payloads(self, positions):
+        return [self.categories.payloads[position] for position in positions]
+
+
+#building
+def _chunks(ids):
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def _load_instructors(previous):
+    # payloads of instructors whose version hasn't moved are reused
+    payloads, versions = {}, {}
+    changed = []
+    for instructor_id, version in Instructor.objects.values_list('id', 'version'):
+        if previous is not None and previous.instructor_versions.get(instructor_id) == version:
+            payloads[instructor_id] = previous.instructors[instructor_id]
+            versions[instructor_id] = version
+        else:
+            changed.append(instructor_id)
+    for chunk in _chunks(changed):
+        instructors = list(optimize_queryset(Instructor.objects.filter(id__in=chunk), InstructorSerializer))
+        for instructor, payload in zip(instructors, serialize(InstructorSerializer, instructors)):
+            payloads[instructor.id] = payload
+            versions[instructor.id] = instructor.version
+    return payloads, versions
+
+
+def _course_row(row, category_ids, instructor_ids):
+    course_id, version, name, description, price, duration, enrollments, created_at = row
+    return (course_id, version, name, description, to_cents(price), duration, enrollments, _micros(created_at),
+            category_ids, instructor_ids)
+
+
+class _LinkStream:
+    # (course_id, related id) rows in course order, consumed alongside the course rows
+    def __init__(self, queryset, column):
+        self._rows = (queryset.order_by('course_id', column).values_list('course_id', column)
+                      .iterator(chunk_size=CHUNK_SIZE))
+        self._head = next(self._rows, None)
+
+    def take(self, course_id):
+        related = []
+        while self._head is not None and self._head[0] <= course_id:
+            if self._head[0] == course_id:
+                related.append(self._head[1])
+            self._head = next(self._rows, None)
+        return related
+
+
+def _all_course_rows():
+    categories = _LinkStream(Course.category.through.objects.all(), 'category_id')
+    instructors = _LinkStream(Course.instructors.through.objects.all(), 'instructor_id')
+    for row in Course.objects.order_by('id').values_list(*COURSE_COLUMNS).iterator(chunk_size=CHUNK_SIZE):
+        yield _course_row(row, categories.take(row[0]), instructors.take(row[0]))
+
+
+def _changed_course_ids(previous, current):
+    old_ids, old_versions = previous.ids, previous.versions
+    changed = []
+    j = 0
+    for course_id, version in current:
+        while j < len(old_ids) and old_ids[j] < course_id:
+            j += 1
+        if j == len(old_ids) or old_ids[j] != course_id or old_versions[j] != version:
+            changed.append(course_id)
+    return changed
+
+
+def _patched_course_rows(previous, current, changed):
+    fresh, categories, instructors = {}, {}, {}
+    for chunk in _chunks(changed):
+        for row in Course.objects.filter(id__in=chunk).values_list(*COURSE_COLUMNS):
+            fresh[row[0]] = row
+        for course_id, category_id in (Course.category.through.objects.filter(course_id__in=chunk)
+                                       .order_by('course_id', 'category_id').values_list('course_id', 'category_id')):
+            categories.setdefault(course_id, []).append(category_id)
+        for course_id, instructor_id in (Course.instructors.through.objects.filter(course_id__in=chunk)
+                                         .order_by('course_id', 'instructor_id')
+                                         .values_list('course_id', 'instructor_id')):
+            instructors.setdefault(course_id, []).append(instructor_id)
+
+    j = 0
+    for course_id, _ in current:
+        while j < len(previous.ids) and previous.ids[j] < course_id:
+            j += 1
+        if course_id in fresh:
+            yield _course_row(fresh[course_id], categories.get(course_id, ()), instructors.get(course_id, ()))
+        elif j < len(previous.ids) and previous.ids[j] == course_id:
+            yield previous.row(j)
+
+
+def _load_courses(previous):
+    if previous is None:
+        return CourseTable(_all_course_rows())
+    current = list(Course.objects.order_by('id').values_list('id', 'version').iterator(chunk_size=CHUNK_SIZE))
+    changed = _changed_course_ids(previous, current)
+    if len(changed) * 4 > len(current):
+        return CourseTable(_all_course_rows())
+    return CourseTable(_patched_course_rows(previous, current, changed))
+
+
+def build(previous=None):
+    # versions are read first, so a write that lands during the build leaves the result stale rather than lost
+    versions = response_cache.get_versions(SCOPES)
+    categories = CategoryTable(list(Category.objects.order_by('id')))
+    instructors, instructor_versions = _load_instructors(previous)
+    courses = _load_courses(previous.courses if previous is not None else None)
+    return Snapshot(versions, categories, instructors, instructor_versions, courses)
+
+
+#current snapshot
+_snapshot = None
+_lock = threading.Lock()
+_scheduled = threading.Event()
+
+
+def _is_current(snapshot):
+    return snapshot is not None and snapshot.versions == response_cache.get_versions(SCOPES)
+
+
+def rebuild():
+    global _snapshot
+    # the snapshot is tagged with the primary's versions, so it is read from the primary
+    with _lock, replicas.use_primary():
+        if not _is_current(_snapshot):
+            _snapshot = build(_snapshot)
+        return _snapshot
+
+
+def _rebuild_in_background():
+    try:
+        rebuild()
+    finally:
+        _scheduled.clear()
+        connections.close_all()
+
+
+def get_snapshot(fresh=False):
+    snapshot = _snapshot
+    if _is_current(snapshot):
+        return snapshot
+    if snapshot is None or fresh or not BACKGROUND or transaction.get_connection().in_atomic_block:
+        return rebuild()
+    if not _scheduled.is_set():
+        _scheduled.set()
+        threading.Thread(target=_rebuild_in_background, name='freecs-snapshot', daemon=True).start()
+    return snapshot
+
+
+def reset():
+    global _snapshot
+    with _lock:
+        _snapshot = None
+
+
+class SnapshotMixin:
+    # before CachedResponseMixin in the bases; responses are cached per snapshot
+    snapshot = None
+
+    def get_snapshot(self):
+        if self.snapshot is None:
+            self.snapshot = get_snapshot(fresh=replicas.wrote_recently(self.request))
+        return self.snapshot
+
+    def cache_versions(self):
+        return [*super().cache_versions(), self.get_snapshot().token]
@@ -0,0 +1,69 @@
+import csv
+
+from django.http import StreamingHttpResponse
+
+from .compiled import serialize_values
+from .rendering import dumps
+
+# Streaming bodies for large lists and exports. Rows come from
+# queryset.iterator(chunk_size=...), so the database hands them over in chunks
+# (server-side cursors on Postgres) and prefetches run per chunk. Only one
+# chunk is in memory at a time, and the first bytes go out as soon as the
+# first chunk is serialized. Serializers that compiled.py can run on
+# .values() rows skip building model instances altogether.
+
+CHUNK_SIZE = 2000
+STREAM_FORMATS = ('json', 'ndjson')
+
+
+def serialized_rows(queryset, serializer_class, chunk_size=CHUNK_SIZE):
+    return serialize_values(serializer_class, queryset, chunk_size)
+
+
+def _batched(parts, batch_size):
+    batch = []
+    for part in parts:
+        batch.append(part)
+        if len(batch) >= batch_size:
+            yield b''.join(batch)
+            batch = []
+    if batch:
+        yield b''.join(batch)
+
+
+def json_array(rows, batch_size=200):
+    def parts():
+        yield b'['
+        for i, row in enumerate(rows):
+            yield (b',' if i else b'') + dumps(row)
+        yield b']'
+    return _batched(parts(), batch_size)
+
+
+def ndjson(rows, batch_size=200):
+    return _batched((dumps(row) + b'\n' for row in rows), batch_size)
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def csv_rows(header, rows, batch_size=200):
+    writer = csv.writer(_Echo())
+
+    def parts():
+        yield writer.writerow(header).encode('utf-8')
+        for row in rows:
+            yield writer.writerow(row).encode('utf-8')
+    return _batched(parts(), batch_size)
+
+
+def streaming_response(rows, stream_format, filename=None):
+    if stream_format == 'ndjson':
+        response = StreamingHttpResponse(ndjson(rows), content_type='application/x-ndjson')
+    else:
+        response = StreamingHttpResponse(json_array(rows), content_type='application/json')
+    if filename:
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
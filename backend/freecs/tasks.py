@@ -0,0 +1,178 @@
+import logging
+import random
+import traceback
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from . import recommendations
+from .models import Task
+from .search import reindex_course_ids
+
+# A small database-backed job queue for side effects that shouldn't hold up a
+# request, such as sending email. Views call enqueue(); `manage.py run_tasks`
+# claims due rows, runs the registered handler and retries failures with
+# exponential backoff. Batched handlers get every claimed task of their kind
+# at once, which lets email go out over a single SMTP connection.
+#
+# A worker only records the outcome of tasks it still holds the lease on; a
+# task it overran has been handed to another worker, whose result counts.
+# Finished tasks drop their payload, which can hold secrets such as password
+# reset links, and are deleted KEEP_DONE_SECONDS after they last ran.
+#
+# Tuned with FREECS_TASKS = {'BATCH_SIZE': 100, 'BACKOFF_SECONDS': 30, 'LEASE_SECONDS': 300,
+# 'KEEP_DONE_SECONDS': 86400}
+
+logger = logging.getLogger(__name__)
+
+_config = getattr(settings, 'FREECS_TASKS', {})
+BATCH_SIZE = _config.get('BATCH_SIZE', 100)
+BACKOFF_SECONDS = _config.get('BACKOFF_SECONDS', 30)
+LEASE_SECONDS = _config.get('LEASE_SECONDS', 300)
+KEEP_DONE_SECONDS = _config.get('KEEP_DONE_SECONDS', 86400)
+
+_handlers = {}
+
+
+def task(name, batched=False):
+    # batched handlers take a list of tasks and return {task_id: exception or None}
+    def register(fn):
+        _handlers[name] = (fn, batched)
+        return fn
+    return register
+
+
+def enqueue(name, payload=None, delay=0, max_attempts=5):
+    if name not in _handlers:
+        raise KeyError(f'No task handler registered for {name!r}')
+    return Task.objects.create(name=name, payload=payload or {}, max_attempts=max_attempts,
+                               run_at=timezone.now() + timedelta(seconds=delay))
+
+
+def backoff(attempts):
+    # 30s, 60s, 120s... with jitter so retries of one burst spread out
+    delay = BACKOFF_SECONDS * 2 ** (attempts - 1)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def claim(limit=BATCH_SIZE, worker=None):
+    # a conditional UPDATE claims the rows, so two workers never run the same task
+    worker = worker or uuid.uuid4().hex
+    now = timezone.now()
+    stale = now - timedelta(seconds=LEASE_SECONDS)
+    # tasks whose worker died mid-run go back in the queue
+    Task.objects.filter(status=Task.RUNNING, locked_at__lt=stale).update(status=Task.PENDING, locked_by='')
+    Task.objects.filter(status=Task.DONE, run_at__lt=now - timedelta(seconds=KEEP_DONE_SECONDS)).delete()
+
+    due = list(Task.objects.filter(status=Task.PENDING, run_at__lte=now)
+               .order_by('run_at', 'id').values_list('id', flat=True)[:limit])
+    Task.objects.filter(id__in=due, status=Task.PENDING).update(status=Task.RUNNING, locked_by=worker, locked_at=now)
+    return list(Task.objects.filter(id__in=due, locked_by=worker, status=Task.RUNNING).order_by('run_at', 'id'))
+
+
+def _finish(task_row, error=None):
+    fields = {'attempts': task_row.attempts + 1, 'locked_by': '', 'locked_at': None}
+    if error is None:
+        fields.update(status=Task.DONE, last_error='', payload={})
+    else:
+        fields['last_error'] = ''.join(traceback.format_exception(error))[-4000:]
+        if fields['attempts'] >= task_row.max_attempts:
+            fields['status'] = Task.FAILED
+            logger.error('Task %s %s failed permanently: %s', task_row.id, task_row.name, error)
+        else:
+            fields['status'] = Task.PENDING
+            fields['run_at'] = timezone.now() + backoff(fields['attempts'])
+    # conditional on the lease, so a worker that overran it can't overwrite the next run's outcome
+    if not Task.objects.filter(pk=task_row.pk, status=Task.RUNNING, locked_by=task_row.locked_by).update(**fields):
+        logger.warning('Task %s %s outlived its lease, its result was dropped', task_row.id, task_row.name)
+        return
+    for field, value in fields.items():
+        setattr(task_row, field, value)
+
+
+def run_pending(limit=BATCH_SIZE, worker=None):
+    claimed = claim(limit, worker)
+    by_name = defaultdict(list)
+    for task_row in claimed:
+        by_name[task_row.name].append(task_row)
+
+    for name, rows in by_name.items():
+        if name not in _handlers:
+            for task_row in rows:
+                _finish(task_row, KeyError(f'No task handler registered for {name!r}'))
+            continue
+        handler, batched = _handlers[name]
+        if batched:
+            try:
+                errors = handler(rows)
+            except Exception as exc:
+                errors = {task_row.id: exc for task_row in rows}
+            for task_row in rows:
+                _finish(task_row, errors.get(task_row.id))
+        else:
+            for task_row in rows:
+                try:
+                    handler(**task_row.payload)
+                except Exception as exc:
+                    _finish(task_row, exc)
+                else:
+                    _finish(task_row)
+    return len(claimed)
+
+
+#email
+@task('send_email', batched=True)
+def send_emails(rows):
+    errors = {}
+    connection = get_connection()
+    connection.open()
+    try:
+        for task_row in rows:
+            payload = task_row.payload
+            message = EmailMessage(payload['subject'], payload['body'], payload.get('from_email'),
+                                   payload['to'], connection=connection)
+            try:
+                message.send()
+            except Exception as exc:
+                errors[task_row.id] = exc
+    finally:
+        connection.close()
+    return errors
+
+
+def send_email_later(subject, body, to, from_email=None):
+    return enqueue('send_email', {'subject': subject, 'body': body, 'to': list(to), 'from_email': from_email})
+
+
+#catalogue upkeep after bulk writes, which skip model signals, and fan-outs too big for a request
+@task('index_imported_courses')
+def index_imported_courses(course_ids):
+    reindex_course_ids(course_ids)
+    for course_id in course_ids:
+        recommendations.recompute_course(course_id)
+
+
+@task('recompute_course_recommendations')
+def recompute_course_recommendations(course_ids):
+    # category changes fan out to every member preferring the course's categories
+    for course_id in dict.fromkeys(course_ids):
+        recommendations.recompute_course(course_id)
+
+
+@task('refresh_course_scores', batched=True)
+def refresh_course_scores(rows):
+    # every enrollment queues one, so a course is rescored once per batch however many of them name it
+    errors, task_ids = {}, defaultdict(list)
+    for task_row in rows:
+        for course_id in task_row.payload['course_ids']:
+            task_ids[course_id].append(task_row.id)
+    for course_id, ids in task_ids.items():
+        try:
+            recommendations.refresh_course_scores(course_id)
+        except Exception as exc:
+            errors.update(dict.fromkeys(ids, exc))
+    return errors
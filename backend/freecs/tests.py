@@ -1,3 +1,1726 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import call_command
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.db.utils import load_backend
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+from rest_framework.test import APITestCase, APITransactionTestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import (admin_tools, authentication, compiled, compression, counters, enrollments, facets, instrumentation,
+               lazy_views, login, pooling, recommendations, replicas, snapshot, tasks)
+from .models import (Category, Course, CourseRecommendation, Enrollment, Instructor, InstructorSkill, Member,
+                     Preference, SearchTerm, Skill, Task)
+from . import rendering, response_cache
+from .benchmarks import importtime, report
+from .benchmarks.seed import seed_catalogue
+from .fragments import fragments
+from .recommendations import recommended_course_ids
+from .query_plan import optimize_queryset
+from .search import search_course_ids
+from .skills import rebuild_index as rebuild_skill_index, search_instructor_ids
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+
+from .serializers import (CategorySerializer, CourseSerializer, EnrollmentSerializer, InstructorSerializer,
+                          MemberSerializer, UserProfileSerializer)
+from .views import get_tokens_for_user
+
+fast_hashing = override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+
+
+def reset_caches():
+    # sqlite hands out rolled-back primary keys again, so cached payloads must not outlive a test
+    cache.clear()
+    fragments.clear()
+    login._backend.reset()
+    snapshot.reset()
+
+
+def make_member(username, is_instructor=False):
+    user = User.objects.create_user(username=username, password='pass12345', email=f'{username}@example.com',
+                                    first_name=username, last_name='Test')
+    member = Member.objects.create(user=user, is_instructor=is_instructor)
+    if is_instructor:
+        Instructor.objects.create(member=member, skills={'main': 'python'})
+    return member
+
+
+class CatalogueFixtureMixin:
+    # every call adds one more of each row so query counts can be compared across sizes
+    def add_catalogue_rows(self, n):
+        for i in range(n):
+            suffix = f'{self._rows}'
+            self._rows += 1
+            category = Category.objects.create(name=f'category {suffix}')
+            instructor = make_member(f'teacher{suffix}', is_instructor=True).instructor
+            course = Course.objects.create(name=f'python course {suffix}', description='learn things',
+                                           price='10.00', duration=10)
+            course.category.add(category, self.category)
+            course.instructors.add(instructor)
+            Enrollment.objects.create(member=self.member, course=course)
+        # recommendations for the new category links
+        tasks.run_pending()
+
+    def setUp(self):
+        reset_caches()
+        self._rows = 0
+        self.category = Category.objects.create(name='shared')
+        self.member = make_member('student')
+        preference = Preference.objects.create(member=self.member)
+        preference.category.add(self.category)
+
+
+@fast_hashing
+class ListQueryCountTests(CatalogueFixtureMixin, APITestCase):
+    def count_queries(self, request):
+        # the catalogue snapshot is rebuilt outside the count, it isn't per request
+        snapshot.rebuild()
+        with CaptureQueriesContext(connection) as ctx:
+            response = request()
+        self.assertEqual(response.status_code, 200, response.content)
+        return len(ctx.captured_queries)
+
+    def assert_constant_queries(self, request, bound):
+        self.add_catalogue_rows(2)
+        small = self.count_queries(request)
+        self.add_catalogue_rows(10)
+        large = self.count_queries(request)
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, bound)
+
+    def test_courses(self):
+        # answered from the catalogue snapshot
+        self.assert_constant_queries(lambda: self.client.get(reverse('courses'), {'limit': 50}), 0)
+
+    def test_preferred_courses(self):
+        url = reverse('preferred_courses', args=[self.member.id])
+        self.assert_constant_queries(lambda: self.client.get(url), 4)
+
+    def test_search(self):
+        # the benchmark's queries, see endpoints.search in benchmarks/thresholds.json
+        for text in ['python data', 'machin lerning']:
+            self.assert_constant_queries(lambda: self.client.get(reverse('search'), {'q': text}), 2)
+
+    def test_enrollments(self):
+        self.assert_constant_queries(lambda: self.client.get(reverse('enrollment')), 3)
+
+    def test_instructors(self):
+        self.assert_constant_queries(lambda: self.client.get(reverse('instructor-list')), 1)
+
+    def test_categories(self):
+        self.assert_constant_queries(lambda: self.client.get(reverse('category')), 0)
+
+
+@fast_hashing
+class KeysetPaginationTests(CatalogueFixtureMixin, APITestCase):
+    def walk(self, url, params):
+        ids, response = [], self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids.extend(row['id'] for row in response.data['results'])
+            if not response.data['next']:
+                return ids, response
+            response = self.client.get(response.data['next'])
+
+    def test_walks_every_row_once(self):
+        self.add_catalogue_rows(7)
+        Course.objects.filter(name__endswith='3').update(price='5.00')
+        ids, last = self.walk(reverse('courses'), {'page_size': 3, 'ordering': '-price'})
+        expected = list(Course.objects.order_by('-price', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+        previous = self.client.get(last.data['previous'])
+        self.assertEqual([row['id'] for row in previous.data['results']], expected[3:6])
+
+    def test_rejects_tampered_cursor(self):
+        self.add_catalogue_rows(3)
+        response = self.client.get(reverse('courses'), {'page_size': 1})
+        cursor = response.data['next'].split('cursor=')[1]
+        response = self.client.get(reverse('courses'), {'cursor': cursor[:-2] + 'xx'})
+        self.assertEqual(response.status_code, 404)
+
+
+@fast_hashing
+class SearchTests(APITestCase):
+    def setUp(self):
+        reset_caches()
+        self.web = Category.objects.create(name='Web Development')
+        self.teacher = make_member('teacher', is_instructor=True).instructor
+        self.django = Course.objects.create(name='Django for beginners', description='Build web apps',
+                                            price='20.00', duration=5)
+        self.django.category.add(self.web)
+        self.cooking = Course.objects.create(name='Cooking basics', description='Pasta and django reinhardt music',
+                                             price='5.00', duration=2)
+
+    def search(self, text):
+        return search_course_ids(text)[0]
+
+    def test_ranks_name_matches_first(self):
+        self.assertEqual(self.search('django'), [self.django.id, self.cooking.id])
+
+    def test_prefix_and_typo_matching(self):
+        self.assertEqual(self.search('begin'), [self.django.id])
+        self.assertEqual(self.search('cookng'), [self.cooking.id])
+
+    def test_typo_in_the_first_letter(self):
+        self.assertEqual(self.search('kooking'), [self.cooking.id])  # wrong
+        self.assertEqual(self.search('ooking'), [self.cooking.id])  # missing
+        self.assertEqual(self.search('xcooking'), [self.cooking.id])  # extra
+
+    def test_query_count_doesnt_grow_with_tokens(self):
+        for text in ['django', 'django beginers', 'pasta cookng music reinhardt web apps buld basics']:
+            with self.assertNumQueries(2):
+                self.assertTrue(self.search(text))
+
+    def test_typo_candidates_dont_crowd_out_matches(self):
+        # many shorter terms with the same first letter used to fill the candidate cap ahead of 'cooking'
+        SearchTerm.objects.bulk_create([SearchTerm(term=f'c{i:04d}', length=5, tail=f'{i:04d}') for i in range(2500)])
+        self.assertEqual(self.search('cookng'), [self.cooking.id])
+        self.assertEqual(self.search('cook'), [self.cooking.id])
+
+    def test_index_follows_model_changes(self):
+        self.assertEqual(self.search('development'), [self.django.id])
+        self.web.name = 'Backend'
+        self.web.save()
+        self.assertEqual(self.search('development'), [])
+
+        self.assertEqual(self.search('rust'), [])
+        self.teacher.skills = {'main': 'rust'}
+        self.teacher.save()
+        self.cooking.instructors.add(self.teacher)
+        self.assertEqual(self.search('rust'), [self.cooking.id])
+
+        self.teacher.delete()
+        self.assertEqual(self.search('rust'), [])
+
+    def test_query_string_api(self):
+        response = self.client.get(reverse('search'), {'q': 'django', 'page_size': 1})
+        self.assertEqual([row['id'] for row in response.data['results']], [self.django.id])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([row['id'] for row in response.data['results']], [self.cooking.id])
+        self.assertIsNone(response.data['next'])
+
+        self.assertEqual(self.client.get(reverse('search')).status_code, 400)
+
+
+@fast_hashing
+class RecommendationTests(APITestCase):
+    def setUp(self):
+        reset_caches()
+        self.web, self.data = Category.objects.create(name='web'), Category.objects.create(name='data')
+        self.member = make_member('student')
+        self.preference = Preference.objects.create(member=self.member)
+        self.preference.category.add(self.web)
+        self.created = timezone.now()
+        self.web_only = self.course('web only', 0, self.web)
+        self.data_only = self.course('data only', 1, self.data)
+        self.both = self.course('both', 2, self.web, self.data)
+        tasks.run_pending()
+
+    def course(self, name, days, *categories):
+        course = Course.objects.create(name=name, description='', price='1.00', duration=1)
+        Course.objects.filter(pk=course.pk).update(created_at=self.created + timedelta(days=days))
+        course.category.add(*categories)
+        return course
+
+    def ranked(self):
+        return recommended_course_ids(self.member.id)[0]
+
+    def test_ranks_by_overlap_popularity_and_recency(self):
+        self.assertEqual(self.ranked(), [self.both.id, self.web_only.id])
+        self.preference.category.add(self.data)
+        # equal overlap, so the newer course wins
+        self.assertEqual(self.ranked(), [self.both.id, self.data_only.id, self.web_only.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Enrollment.objects.create(member=make_member('other'), course=self.web_only)
+        # rescored by the task queue rather than in the enrolling request
+        self.assertEqual(self.ranked(), [self.both.id, self.data_only.id, self.web_only.id])
+        tasks.run_pending()
+        self.assertEqual(self.ranked(), [self.both.id, self.web_only.id, self.data_only.id])
+
+    def test_popularity_outweighs_months_of_recency(self):
+        self.preference.category.add(self.data)
+        newer = self.course('newer', 180, self.web)
+        with self.captureOnCommitCallbacks(execute=True):
+            for name in ['a', 'b', 'c']:
+                Enrollment.objects.create(member=make_member(name), course=self.web_only)
+        tasks.run_pending()
+        self.assertEqual(self.ranked(), [self.both.id, self.web_only.id, newer.id, self.data_only.id])
+
+    def test_enrollments_rescore_a_course_once_per_batch(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for name in ['a', 'b', 'c']:
+                Enrollment.objects.create(member=make_member(name), course=self.web_only)
+        with mock.patch.object(recommendations, 'refresh_course_scores',
+                               wraps=recommendations.refresh_course_scores) as refresh:
+            self.assertEqual(tasks.run_pending(), 3)
+        refresh.assert_called_once_with(self.web_only.id)
+
+    def test_cached_list_follows_changes(self):
+        self.preference.category.add(self.data)
+        self.assertEqual(self.ranked(), [self.both.id, self.data_only.id, self.web_only.id])
+        with self.assertNumQueries(0):
+            self.ranked()
+
+        self.data_only.category.remove(self.data)
+        # the course's members are recomputed by the task queue
+        self.assertEqual(self.ranked(), [self.both.id, self.data_only.id, self.web_only.id])
+        tasks.run_pending()
+        self.assertEqual(self.ranked(), [self.both.id, self.web_only.id])
+        self.both.delete()
+        self.assertEqual(self.ranked(), [self.web_only.id])
+        self.preference.delete()
+        self.assertFalse(self.member.recommendations.exists())
+
+    def test_preferred_courses_endpoint(self):
+        self.preference.category.add(self.data)
+        url = reverse('preferred_courses', args=[self.member.id])
+        response = self.client.get(url, {'page_size': 2})
+        self.assertEqual([row['id'] for row in response.data['results']], [self.both.id, self.data_only.id])
+        response = self.client.get(response.data['next'])
+        self.assertEqual([row['id'] for row in response.data['results']], [self.web_only.id])
+        self.assertIsNone(response.data['next'])
+
+
+@fast_hashing
+class ResponseCacheTests(CatalogueFixtureMixin, APITestCase):
+    def test_hits_until_catalogue_changes(self):
+        self.add_catalogue_rows(2)
+        url = reverse('courses')
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+        not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        Category.objects.filter(name='shared').get().save()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+
+    def test_query_params_are_part_of_the_key(self):
+        self.add_catalogue_rows(3)
+        url = reverse('courses')
+        one = self.client.get(url, {'page_size': 1, 'ordering': 'name'})
+        same = self.client.get(url, {'ordering': 'name', 'page_size': 1})
+        other = self.client.get(url, {'page_size': 2})
+        self.assertEqual(one['ETag'], same['ETag'])
+        self.assertEqual(len(other.data['results']), 2)
+
+    def test_lru_backend_evicts_by_size(self):
+        backend = response_cache.LRUCacheBackend(max_entries=10, max_bytes=10)
+        before = response_cache.stats.as_dict()['evictions']
+        backend.set('a', (b'12345', 'application/json'))
+        backend.set('b', (b'12345', 'application/json'))
+        backend.get('a')
+        backend.set('c', (b'12345', 'application/json'))
+        self.assertIsNone(backend.get('b'))
+        self.assertIsNotNone(backend.get('a'))
+        self.assertEqual(response_cache.stats.as_dict()['evictions'], before + 1)
+
+
+@fast_hashing
+class FragmentCacheTests(CatalogueFixtureMixin, APITestCase):
+    def test_shared_instructor_serialized_once(self):
+        teacher = make_member('popular', is_instructor=True).instructor
+        self.add_catalogue_rows(5)
+        for course in Course.objects.all():
+            course.instructors.add(teacher)
+
+        for name, serialize in [('stock', lambda courses: CourseSerializer(courses, many=True).data),
+                                ('compiled', lambda courses: compiled.serialize(CourseSerializer, courses))]:
+            with self.subTest(name):
+                fragments.clear()
+                serialize(optimize_queryset(Course.objects.all(), CourseSerializer))
+                # each course has its own instructor and category plus the shared ones,
+                # which are serialized for the first course and reused for the other four
+                self.assertEqual(fragments.misses, 12)
+                self.assertEqual(fragments.hits, 8)
+
+    def test_category_changes_refresh_fragment(self):
+        self.add_catalogue_rows(1)
+
+        def shared_category():
+            course = optimize_queryset(Course.objects.all(), CourseSerializer).get()
+            payloads = compiled.serialize(CourseSerializer, [course])[0]['category']
+            return next(payload for payload in payloads if payload['id'] == self.category.id)
+
+        self.assertEqual(shared_category()['course_count'], 1)
+        self.category.refresh_from_db()
+        self.category.name = 'renamed'
+        self.category.save()
+        self.assertEqual(shared_category()['name'], 'renamed')
+        self.add_catalogue_rows(1)
+        Course.objects.exclude(id=Course.objects.order_by('id').first().id).delete()
+        self.assertEqual(shared_category()['course_count'], 1)
+
+
+@fast_hashing
+class StreamingTests(CatalogueFixtureMixin, APITestCase):
+    def body(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_streamed_list_matches_paged_rows(self):
+        self.add_catalogue_rows(3)
+        paged = self.client.get(reverse('enrollment')).data['results']
+        streamed = json.loads(self.body(self.client.get(reverse('enrollment'), {'stream': 'json'})))
+        self.assertEqual(streamed, json.loads(json.dumps(paged, default=str)))
+
+        lines = self.body(self.client.get(reverse('instructor-list'), {'stream': 'ndjson'})).splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines],
+                         list(Instructor.objects.order_by('id').values_list('id', flat=True)))
+
+    def test_empty_and_invalid_stream(self):
+        self.assertEqual(json.loads(self.body(self.client.get(reverse('enrollment'), {'stream': 'json'}))), [])
+        self.assertEqual(self.client.get(reverse('enrollment'), {'stream': 'xml'}).status_code, 400)
+
+    def test_csv_export_is_admin_only(self):
+        self.add_catalogue_rows(2)
+        url = reverse('enrollment-export', args=['csv'])
+        self.assertEqual(self.client.get(url).status_code, 401)
+
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass12345')
+        self.client.force_authenticate(admin)
+        rows = self.body(self.client.get(url)).splitlines()
+        self.assertEqual(rows[0].split(',')[:3], ['id', 'enrollment_date', 'member_id'])
+        self.assertEqual(len(rows), 3)
+
+
+@fast_hashing
+class AsyncViewTests(CatalogueFixtureMixin, APITestCase):
+    def test_catalogue_matches_sync_views(self):
+        self.add_catalogue_rows(3)
+        for sync_url, async_url, params in [
+            (reverse('courses'), reverse('async-courses'), {'page_size': 2, 'ordering': '-price'}),
+            (reverse('category'), reverse('async-category'), {}),
+            (reverse('search'), reverse('async-search'), {'q': 'python'}),
+            (reverse('preferred_courses', args=[self.member.id]),
+             reverse('async-preferred-courses', args=[self.member.id]), {}),
+        ]:
+            sync = json.loads(self.client.get(sync_url, params).content)
+            async_ = json.loads(self.client.get(async_url, params).content)
+            self.assertEqual(sync['results'], async_['results'])
+
+    def test_course_filters_match_sync_view(self):
+        self.add_catalogue_rows(4)
+        other = Category.objects.create(name='other')
+        first, _, third, _ = Course.objects.order_by('id')
+        first.category.add(other)
+        third.category.add(other)
+        Course.objects.filter(pk=third.pk).update(price='30.00')
+        for params in [
+            {'category': f'{other.id}', 'ordering': '-price'},
+            {'category': f'{other.id},{self.category.id}', 'category_match': 'all', 'page_size': 1},
+            {'min_price': '20', 'ordering': 'name'},
+            {'instructor': Instructor.objects.order_by('id').first().id},
+        ]:
+            sync = json.loads(self.client.get(reverse('courses'), params).content)
+            async_ = json.loads(self.client.get(reverse('async-courses'), params).content)
+            # the same cursor, on the async path
+            next_page = sync['next'] and sync['next'].replace('/courses/', '/async/courses/')
+            self.assertEqual((async_['results'], async_['facets'], async_['next']),
+                             (sync['results'], sync['facets'], next_page), params)
+            self.assertTrue(async_['results'], params)
+
+        response = self.client.get(reverse('async-courses'), {'min_price': 'cheap'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('min_price', json.loads(response.content)['detail'])
+
+    def test_profile_and_preference_need_a_token(self):
+        self.assertEqual(self.client.get(reverse('async-profile')).status_code, 401)
+
+        category = Category.objects.create(name='new')
+        member = make_member('fresh')
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {get_tokens_for_user(member.user)["access"]}'}
+        response = self.client.get(reverse('async-profile'), **auth)
+        self.assertEqual(json.loads(response.content)['username'], 'fresh')
+
+        response = self.client.post(reverse('async-preferences-create'), {'category': [category.id]},
+                                    format='json', **auth)
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(list(member.preference.category.all()), [category])
+
+
+@tasks.task('test_flaky')
+def flaky_task(fail):
+    if fail:
+        raise RuntimeError('boom')
+
+
+@fast_hashing
+class TaskQueueTests(APITestCase):
+    def test_reset_email_is_sent_by_the_worker(self):
+        make_member('forgetful')
+        response = self.client.post(reverse('sendpassword'), {'email': 'forgetful@example.com'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mail.outbox, [])
+
+        self.assertEqual(tasks.run_pending(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('/send-reset/', mail.outbox[0].body)
+        done = Task.objects.get()
+        # the reset link doesn't outlive the send
+        self.assertEqual((done.status, done.payload), (Task.DONE, {}))
+
+        Task.objects.update(run_at=timezone.now() - timedelta(seconds=tasks.KEEP_DONE_SECONDS + 1))
+        tasks.run_pending()
+        self.assertFalse(Task.objects.exists())
+
+    def test_unknown_email_is_rejected_without_queueing(self):
+        response = self.client.post(reverse('sendpassword'), {'email': 'nobody@example.com'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Task.objects.exists())
+
+    def test_batch_shares_one_connection(self):
+        for i in range(3):
+            tasks.send_email_later('hi', 'body', [f'user{i}@example.com'])
+        with mock.patch('freecs.tasks.get_connection', wraps=tasks.get_connection) as get_connection:
+            self.assertEqual(tasks.run_pending(), 3)
+        get_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_overrun_lease_doesnt_overwrite_the_new_owner(self):
+        queued = tasks.send_email_later('hi', 'body', ['late@example.com'])
+        [claimed] = tasks.claim(worker='slow')
+        # the lease ran out and another worker took the task over
+        Task.objects.filter(pk=queued.pk).update(locked_by='fast')
+        with self.assertLogs('freecs.tasks', 'WARNING'):
+            tasks._finish(claimed)
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.locked_by, queued.attempts), (Task.RUNNING, 'fast', 0))
+
+    def test_failures_back_off_then_give_up(self):
+        queued = tasks.enqueue('test_flaky', {'fail': True}, max_attempts=2)
+        tasks.run_pending()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.PENDING, 1))
+        self.assertIn('boom', queued.last_error)
+        self.assertEqual(tasks.run_pending(), 0)  # not due until the backoff passes
+
+        Task.objects.update(run_at=queued.created_at)
+        tasks.run_pending()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.FAILED, 2))
+
+
+@fast_hashing
+class BulkImportTests(CatalogueFixtureMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass12345')
+        self.client.force_authenticate(admin)
+        self.instructor = make_member('teacher', is_instructor=True).instructor
+
+    def test_courses_import_with_per_row_errors(self):
+        rows = [
+            {'name': 'rust basics', 'description': 'systems', 'price': '5.00', 'duration': 3,
+             'category': [self.category.id], 'instructors': [self.instructor.id]},
+            {'name': 'no price', 'description': '', 'duration': 3},
+            {'name': 'ghost category', 'description': '', 'price': '1.00', 'duration': 1, 'category': [9999]},
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('courses-bulk'), rows, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([error['row'] for error in response.data['errors']], [1, 2])
+        self.assertIn('price', response.data['errors'][0]['errors'])
+        self.assertLess(len(ctx.captured_queries), 20)
+
+        course = Course.objects.get(name='rust basics')
+        self.assertEqual(list(course.category.all()), [self.category])
+        self.assertEqual(search_course_ids('rust')[0], [])  # indexed by the worker
+        tasks.run_pending()
+        self.assertEqual(search_course_ids('rust')[0], [course.id])
+
+    def test_csv_upload(self):
+        body = ('name,description,price,duration,category,instructors\n'
+                f'go one,,2.00,4,{self.category.id},{self.instructor.id}\n'
+                f'go two,,3.00,5,{self.category.id};{self.category.id},\n')
+        response = self.client.post(reverse('courses-bulk'), body, content_type='text/csv')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data, {'created': 2, 'skipped': 0, 'errors': []})
+        self.assertEqual(Course.objects.get(name='go two').category.count(), 1)
+
+    def test_enrollments_import(self):
+        self.add_catalogue_rows(1)
+        fresh = Course.objects.create(name='fresh', description='', price='1.00', duration=1)
+        taken = Enrollment.objects.get().course_id
+        rows = [{'member': self.member.id, 'course': fresh.id},
+                {'member': self.member.id, 'course': taken},
+                {'member': 9999, 'course': fresh.id}]
+        response = self.client.post(reverse('enrollment-bulk'), rows, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual((response.data['created'], response.data['skipped']), (1, 1))
+        self.assertEqual([error['row'] for error in response.data['errors']], [2])
+        self.assertTrue(Enrollment.objects.filter(course=fresh).exists())
+
+    def test_admin_only(self):
+        self.client.force_authenticate(self.member.user)
+        response = self.client.post(reverse('courses-bulk'), [], format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+@fast_hashing
+class CounterTests(CatalogueFixtureMixin, APITestCase):
+    def counts(self):
+        course = Course.objects.get(name='python course 0')
+        self.category.refresh_from_db()
+        return course.enrollment_count, self.category.course_count
+
+    def test_signals_keep_counters_in_step(self):
+        self.add_catalogue_rows(2)
+        self.assertEqual(self.counts(), (1, 2))
+
+        course = Course.objects.get(name='python course 0')
+        course.category.remove(self.category, self.category)
+        self.assertEqual(self.counts(), (1, 1))
+        self.category.course_set.add(course)
+        self.assertEqual(self.counts(), (1, 2))
+        Enrollment.objects.filter(course=course).delete()
+        self.assertEqual(self.counts(), (0, 2))
+        Course.objects.filter(name='python course 1').delete()
+        self.assertEqual(self.counts(), (0, 1))
+
+    def test_reconcile_fixes_only_drifted_rows(self):
+        self.add_catalogue_rows(3)
+        Course.objects.filter(name='python course 0').update(enrollment_count=7)
+        Category.objects.filter(pk=self.category.pk).update(course_count=0)
+        call_command('reconcile_counters', stdout=io.StringIO())
+        self.assertEqual(self.counts(), (1, 3))
+        self.assertEqual(counters.reconcile_enrollment_counts(), 0)
+        self.assertEqual(counters.reconcile_course_counts(), 0)
+
+    def test_popularity_ordering_and_category_badge(self):
+        self.add_catalogue_rows(2)
+        response = self.client.get(reverse('courses'), {'ordering': '-enrollment_count'})
+        self.assertEqual(response.data['results'][0]['enrollment_count'], 1)
+        response = self.client.get(reverse('category'), {'ordering': '-course_count'})
+        self.assertEqual(response.data['results'][0], {'name': 'shared', 'id': self.category.id, 'course_count': 2})
+
+    def test_one_member_per_user(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Member.objects.create(user=self.member.user, is_instructor=False)
+
+
+
+@fast_hashing
+class EnrollmentTests(APITestCase):
+    def setUp(self):
+        reset_caches()
+        self.member = make_member('student')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {get_tokens_for_user(self.member.user)["access"]}'}
+        self.course = Course.objects.create(name='open', description='', price='1.00', duration=1)
+        self.small = Course.objects.create(name='small', description='', price='1.00', duration=1, capacity=1)
+
+    def post(self, data):
+        return self.client.post(reverse('enrollment-create'), data, format='json', **self.auth)
+
+    def test_enrolling_twice_is_idempotent(self):
+        response = self.post({'course': self.course.id})
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data['results'], [{'course': self.course.id, 'status': 'created'}])
+        response = self.post({'course': self.course.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['status'], 'existing')
+        self.course.refresh_from_db()
+        self.assertEqual((Enrollment.objects.count(), self.course.enrollment_count), (1, 1))
+
+    def test_full_and_unknown_courses(self):
+        Enrollment.objects.create(member=make_member('early'), course=self.small)
+        self.assertEqual(self.post({'course': self.small.id}).status_code, 409)
+        self.assertEqual(self.post({'course': 9999}).status_code, 404)
+        response = self.post({'courses': [self.course.id, self.small.id, 9999]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([result['status'] for result in response.data['results']], ['created', 'full', 'invalid'])
+        self.assertEqual(self.post({}).status_code, 400)
+
+    def test_batches_share_out_the_last_seats(self):
+        self.small.capacity = 3
+        self.small.save()
+        members = [make_member(f'batch{i}').id for i in range(5)]
+        pairs = [(member_id, self.small.id) for member_id in members] + [(members[0], self.course.id)]
+        statuses = enrollments.enroll(pairs + pairs[:2], batch_size=2)
+        self.assertEqual([statuses[pair] for pair in pairs], ['created'] * 3 + ['full'] * 2 + ['created'])
+        self.small.refresh_from_db()
+        self.assertEqual(self.small.enrollment_count, 3)
+
+    def test_one_enrollment_per_member_and_course(self):
+        Enrollment.objects.create(member=self.member, course=self.course)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Enrollment.objects.create(member=self.member, course=self.course)
+
+
+@fast_hashing
+class EnrollmentConcurrencyTests(TransactionTestCase):
+    def test_concurrent_enrollments_respect_capacity(self):
+        reset_caches()
+        members = [make_member(f'rush{i}').id for i in range(12)]
+        limited = Course.objects.create(name='limited', description='', price='1.00', duration=1, capacity=5)
+        other = Course.objects.create(name='other', description='', price='1.00', duration=1)
+        failures = []
+
+        def rush(offset):
+            try:
+                # every thread overlaps with its neighbours, so the same pairs race each other
+                chosen = [members[(offset + i) % len(members)] for i in range(4)]
+                enrollments.enroll([(member_id, course_id) for member_id in chosen
+                                    for course_id in (limited.id, other.id)], batch_size=3)
+            except Exception as exc:
+                failures.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=rush, args=(i,)) for i in range(len(members))]
+        # sqlite's shared cache fails locked writes at once instead of waiting
+        with mock.patch.object(enrollments, 'RETRIES', 30):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(failures, [])
+        limited.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(limited.enrollment_count, 5)
+        self.assertEqual(Enrollment.objects.filter(course=limited).count(), 5)
+        self.assertEqual(other.enrollment_count, Enrollment.objects.filter(course=other).count())
+        self.assertEqual(other.enrollment_count, len(members))
+
+@fast_hashing
+@override_settings(MIDDLEWARE=settings.MIDDLEWARE + ['freecs.instrumentation.InstrumentationMiddleware'])
+class InstrumentationTests(CatalogueFixtureMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        instrumentation.reset()
+
+    def test_routes_are_measured_and_exposed(self):
+        self.add_catalogue_rows(3)
+        self.client.get(reverse('courses'))
+        self.client.get(reverse('courses'))
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pass12345'))
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('freecs_requests_total{route="courses",method="GET",status="200"} 2', body)
+        self.assertIn('freecs_request_sql_queries_count{route="courses",method="GET"} 2', body)
+        self.assertIn('freecs_request_serializer_seconds_bucket{route="courses",method="GET",le="+Inf"} 2', body)
+        # the second response came from the response cache without touching the database
+        self.assertIn('freecs_request_sql_queries_bucket{route="courses",method="GET",le="0"} 1', body)
+
+    def test_metrics_need_staff_or_the_token(self):
+        url = reverse('metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.member.user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.logout()
+        with mock.patch.object(instrumentation, 'TOKEN', 'scrape-me'):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer scrape-me').status_code, 200)
+
+    def test_repeated_queries_are_flagged(self):
+        self.add_catalogue_rows(12)
+
+        def n_plus_one(request):
+            for course in Course.objects.all():
+                list(course.category.all())
+            return HttpResponse()
+
+        middleware = instrumentation.InstrumentationMiddleware(n_plus_one)
+        with self.assertLogs('freecs.instrumentation', 'WARNING') as logs:
+            middleware(RequestFactory().get('/loop/'))
+        self.assertIn('Possible N+1', logs.output[0])
+        self.assertIn('freecs_n_plus_one_total{route="unmatched"} 1', instrumentation.render())
+
+    def test_compiled_serializers_count_as_serializer_time(self):
+        self.add_catalogue_rows(2)
+        stats = instrumentation.RequestStats()
+        token = instrumentation._current.set(stats)
+        try:
+            compiled.serialize(CourseSerializer, optimize_queryset(Course.objects.all(), CourseSerializer))
+        finally:
+            instrumentation._current.reset(token)
+        self.assertGreater(stats.serializer_time, 0)
+        self.assertEqual(stats.serializer_depth, 0)
+
+    def test_unsampled_requests_skip_sql_details(self):
+        with mock.patch.object(instrumentation, 'SAMPLE_RATE', 0):
+            self.client.get(reverse('courses'))
+        body = instrumentation.render()
+        self.assertIn('freecs_request_duration_seconds_count{route="courses",method="GET"} 1', body)
+        self.assertNotIn('freecs_request_sql_queries_count{route="courses"', body)
+
+
+class BenchmarkTests(APITestCase):
+    def test_seeded_catalogue_is_deterministic_and_counted(self):
+        sizes = seed_catalogue(50, seed=3)
+        self.assertEqual(sizes, {'courses': 50, 'categories': 20, 'instructors': 10, 'members': 10,
+                                 'enrollments': 25, 'preferences': 10})
+        self.assertEqual(seed_catalogue(50, seed=3), sizes)  # tops up, adds nothing
+        self.assertEqual(counters.reconcile_enrollment_counts(), 0)
+        self.assertEqual(counters.reconcile_course_counts(), 0)
+
+    def test_compare_and_thresholds(self):
+        before = {'endpoints': {'courses': {'median_ms': 10.0, 'queries': 3, 'load': {'rps': 100.0}}}}
+        after = {'endpoints': {'courses': {'median_ms': 11.0, 'queries': 4, 'load': {'rps': 70.0}}}}
+        self.assertEqual(report.compare(before, after, tolerance=0.2), [
+            ('endpoints.courses.load.rps', 100.0, 70.0),
+            ('endpoints.courses.queries', 3, 4),
+        ])
+        limits = {'endpoints.courses.queries': 3, 'endpoints.courses.load.rps': 50}
+        self.assertEqual(report.check_thresholds(after, limits), [('endpoints.courses.queries', 3, 4)])
+
+
+@fast_hashing
+class ClaimsAuthenticationTests(CatalogueFixtureMixin, APITestCase):
+    def bearer(self, user):
+        return {'HTTP_AUTHORIZATION': f'Bearer {get_tokens_for_user(user)["access"]}'}
+
+    def test_member_views_skip_user_and_member_queries(self):
+        auth = self.bearer(make_member('fresh').user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse('preferences-create'), {'category': [self.category.id]},
+                                        format='json', **auth)
+        self.assertEqual(response.status_code, 201, response.content)
+        sql = ' '.join(query['sql'] for query in ctx.captured_queries)
+        self.assertNotIn('"auth_user"', sql)
+        self.assertNotIn('WHERE "freecs_member"."user_id"', sql)  # the serializer still checks the member pk
+
+        teacher = make_member('teacher', is_instructor=True)
+        response = self.client.post(reverse('courses-create'), {
+            'name': 'claims course', 'description': 'd', 'price': '1.00', 'duration': 1,
+            'category': [self.category.id]}, format='json', **self.bearer(teacher.user))
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.data['instructors'], [teacher.instructor.id])
+        response = self.client.post(reverse('courses-create'), {}, format='json', **auth)
+        self.assertEqual(response.status_code, 400)
+
+    def test_profile_loads_the_user_lazily(self):
+        response = self.client.get(reverse('profile'), **self.bearer(self.member.user))
+        self.assertEqual(response.data['username'], 'student')
+
+    def test_password_change_revokes_earlier_tokens(self):
+        auth = self.bearer(self.member.user)
+        response = self.client.post(reverse('changepassword'), {'password': 'new-pass-1', 'password2': 'new-pass-1'},
+                                    **auth)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.client.get(reverse('profile'), **auth).status_code, 401)
+        fresh = {'HTTP_AUTHORIZATION': f'Bearer {response.data["token"]["access"]}'}
+        self.assertEqual(self.client.get(reverse('profile'), **fresh).status_code, 200)
+
+        reset_caches()  # a cold version cache is filled from the database
+        self.assertEqual(self.client.get(reverse('profile'), **auth).status_code, 401)
+        self.assertEqual(self.client.get(reverse('profile'), **fresh).status_code, 200)
+
+    def test_tokens_without_a_version_are_rejected(self):
+        token = RefreshToken.for_user(self.member.user).access_token
+        response = self.client.get(reverse('profile'), HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 401)
+
+    def test_tokens_from_before_versions_last_their_lifetime(self):
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.member.user).access_token}'}
+        with mock.patch.object(authentication, '_versions_since', time.time() + 60):
+            self.assertEqual(self.client.get(reverse('profile'), **auth).data['username'], 'student')
+            User.objects.filter(pk=self.member.user.pk).update(is_active=False)
+            self.assertEqual(self.client.get(reverse('profile'), **auth).status_code, 401)
+
+
+@fast_hashing
+class LoginPipelineTests(APITestCase):
+    def setUp(self):
+        reset_caches()
+        instrumentation.reset()
+        self.member = make_member('walker')
+
+    def attempt(self, password='pass12345', username='walker', **extra):
+        return self.client.post(reverse('login'), {'username': username, 'password': password}, **extra)
+
+    def test_login_issues_claims_tokens(self):
+        with mock.patch.object(login, 'HASH_WORKERS', 0):
+            response = self.attempt()
+        self.assertEqual(response.status_code, 200, response.content)
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {response.data["token"]["access"]}'}
+        self.assertEqual(self.client.get(reverse('profile'), **auth).data['username'], 'walker')
+
+    def test_hashing_runs_in_the_process_pool(self):
+        self.addCleanup(login.shutdown_pool)
+        with mock.patch.object(login, 'HASH_WORKERS', 1):
+            self.assertEqual(self.attempt().status_code, 200)
+            self.assertEqual(self.attempt('wrong').status_code, 400)
+        self.assertIsNotNone(login._pool)
+        self.assertIn('freecs_login_attempts_total{result="failed"} 1', instrumentation.render())
+
+    @mock.patch.object(login, 'HASH_WORKERS', 1)
+    @mock.patch.object(login, 'HASH_TIMEOUT', 0.01)
+    @mock.patch.object(login, '_pending', threading.BoundedSemaphore(1))
+    def test_slow_hashing_keeps_its_slot(self):
+        slow = Future()
+        with mock.patch.object(login, '_pool', mock.Mock(**{'submit.return_value': slow})):
+            self.assertEqual(self.attempt().status_code, 503)
+            # the worker is still hashing, so the only slot is taken
+            self.assertEqual(self.attempt().status_code, 503)
+            slow.set_result((True, None, 0.0))
+            self.assertTrue(login._pending.acquire(blocking=False))
+        body = instrumentation.render()
+        self.assertIn('freecs_login_attempts_total{result="timeout"} 1', body)
+        self.assertIn('freecs_login_attempts_total{result="busy"} 1', body)
+
+    @mock.patch.object(login, 'HASH_WORKERS', 1)
+    def test_broken_pool_is_replaced(self):
+        broken = Future()
+        broken.set_exception(BrokenProcessPool())
+        pool = mock.Mock(**{'submit.return_value': broken})
+        self.addCleanup(login.shutdown_pool)
+        with mock.patch.object(login, '_pool', pool):
+            self.assertEqual(self.attempt().status_code, 503)
+            self.assertIsNone(login._pool)
+        pool.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+        self.assertEqual(self.attempt().status_code, 200)
+
+    @mock.patch.object(login, 'HASH_WORKERS', 0)
+    def test_username_failures_then_ip_attempts_are_throttled(self):
+        for _ in range(login.USERNAME_LIMIT[0]):
+            self.assertEqual(self.attempt('wrong').status_code, 400)
+        response = self.attempt()  # right password, but the username is locked out
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+        with mock.patch.object(login.ip_limiter, 'limit', 2):
+            self.assertEqual(self.attempt(username='nobody', REMOTE_ADDR='10.0.0.9').status_code, 400)
+            self.assertEqual(self.attempt(username='nobody', REMOTE_ADDR='10.0.0.9').status_code, 400)
+            self.assertEqual(self.attempt(username='nobody', REMOTE_ADDR='10.0.0.9').status_code, 429)
+        body = instrumentation.render()
+        self.assertIn('freecs_login_attempts_total{result="throttled_ip"} 1', body)
+        self.assertIn('freecs_login_attempts_total{result="throttled_username"} 1', body)
+
+    @mock.patch.object(login, 'HASH_WORKERS', 0)
+    @override_settings(PASSWORD_HASHERS=['freecs.login.TunedPBKDF2PasswordHasher',
+                                         'django.contrib.auth.hashers.MD5PasswordHasher'])
+    def test_outdated_hash_is_replaced_on_login(self):
+        def stored_hash():
+            return User.objects.get(username='walker').password
+
+        self.assertTrue(stored_hash().startswith('md5$'))
+        with mock.patch.object(login.TunedPBKDF2PasswordHasher, 'iterations', 1000):
+            self.assertEqual(self.attempt().status_code, 200)
+            self.assertTrue(stored_hash().startswith('pbkdf2_sha256$1000$'))
+        # a new work factor is picked up at the next login
+        with mock.patch.object(login.TunedPBKDF2PasswordHasher, 'iterations', 1200):
+            self.assertEqual(self.attempt().status_code, 200)
+            self.assertTrue(stored_hash().startswith('pbkdf2_sha256$1200$'))
+
+    def test_sliding_window(self):
+        limiter = login.SlidingWindowLimiter('test', 2, 10, login.MemoryWindowBackend())
+        limiter.hit('k', now=100)
+        limiter.hit('k', now=105)
+        self.assertEqual(limiter.retry_after('k', now=106), 4)
+        self.assertEqual(limiter.retry_after('k', now=110), 0)  # the first hit slid out
+
+    def test_memory_limiter_forgets_expired_usernames(self):
+        backend = login.MemoryWindowBackend(max_keys=2000)
+        limiter = login.SlidingWindowLimiter('test', 5, 10, backend)
+        for i in range(5000):
+            limiter.hit(f'random{i}', now=100 + i / 1000)
+        self.assertLessEqual(len(backend._hits), 2000)
+        # the most recent ones are still limited
+        for _ in range(4):
+            limiter.hit('random4999', now=105)
+        self.assertGreater(limiter.retry_after('random4999', now=105), 0)
+
+        # once their windows have passed, the next sweep drops them all
+        for i in range(backend.MIN_SWEEP):
+            limiter.hit(f'later{i}', now=200)
+        self.assertLessEqual(len(backend._hits), backend.MIN_SWEEP)
+
+
+@fast_hashing
+class SnapshotTests(CatalogueFixtureMixin, APITestCase):
+    def serialized(self):
+        courses = optimize_queryset(Course.objects.order_by('id'), CourseSerializer)
+        data = json.loads(json.dumps(CourseSerializer(courses, many=True).data))
+        for course in data:
+            course['category'].sort(key=lambda category: category['id'])
+        return data
+
+    def from_snapshot(self):
+        current = snapshot.get_snapshot()
+        return json.loads(json.dumps(current.course_payloads(current.courses.order('id'))))
+
+    def instructor_payloads(self):
+        response = self.client.get(reverse('courses'))
+        return [instructor for course in response.data['results'] for instructor in course['instructors']]
+
+    def test_payloads_match_serializer(self):
+        self.add_catalogue_rows(4)
+        self.assertEqual(self.from_snapshot(), self.serialized())
+
+    def test_changes_are_patched_in(self):
+        self.add_catalogue_rows(8)
+        first = snapshot.get_snapshot()
+        course = Course.objects.order_by('id').first()
+        course.name = 'renamed'
+        course.save()
+        course.category.remove(self.category)
+        Enrollment.objects.filter(course=course).delete()
+        Category.objects.filter(name='category 7').delete()
+
+        # only the changed courses are reloaded, the rest is copied from the previous snapshot
+        with mock.patch.object(snapshot, '_all_course_rows', side_effect=AssertionError('full reload')):
+            current = snapshot.get_snapshot()
+        self.assertIsNot(current, first)
+        self.assertIs(snapshot.get_snapshot(), current)
+        self.assertEqual(self.from_snapshot(), self.serialized())
+
+        first_payload = self.from_snapshot()[0]
+        self.assertEqual((first_payload['name'], first_payload['enrollment_count']), ('renamed', 0))
+        Course.objects.filter(pk=course.pk).delete()
+        self.assertNotIn(course.pk, snapshot.get_snapshot().courses.ids)
+
+    def test_category_bitsets(self):
+        self.add_catalogue_rows(3)
+        other = Category.objects.create(name='other')
+        first, second, third = Course.objects.order_by('id')
+        first.category.add(other)
+        third.category.add(other)
+
+        courses = snapshot.get_snapshot().courses
+        def ids(mask):
+            return [course_id for position, course_id in enumerate(courses.ids) if courses.member_test(mask)(position)]
+        own = Category.objects.get(name='category 1').id
+        self.assertEqual(ids(courses.in_categories([own, other.id])), [first.id, second.id, third.id])
+        self.assertEqual(ids(courses.in_categories([self.category.id, other.id], require_all=True)),
+                         [first.id, third.id])
+        self.assertEqual(ids(courses.in_categories([])), [])
+
+    def test_member_and_user_changes_reach_course_payloads(self):
+        self.add_catalogue_rows(1)
+        instructor = Instructor.objects.get()
+        self.instructor_payloads()
+
+        user = instructor.member.user
+        user.first_name = 'Renamed'
+        user.save()
+        self.assertEqual(self.instructor_payloads()[0]['member']['user']['first_name'], 'Renamed')
+
+        instructor.refresh_from_db()
+        instructor.bio = 'New bio'
+        instructor.save()
+        self.assertEqual(self.instructor_payloads()[0]['bio'], 'New bio')
+
+    def test_workers_share_cached_pages(self):
+        self.add_catalogue_rows(2)
+        url = reverse('category')
+        first = self.client.get(url)
+        # another worker builds its own snapshot of the same versions
+        snapshot.reset()
+        not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_cached_pages_follow_the_snapshot(self):
+        self.add_catalogue_rows(2)
+        url = reverse('category')
+
+        def counts(**params):
+            return [(row['name'], row['course_count']) for row in self.client.get(url, params).data['results']]
+
+        self.assertEqual(counts(), [('shared', 2), ('category 0', 1), ('category 1', 1)])
+        Course.objects.order_by('id').first().category.add(Category.objects.get(name='category 1'))
+        self.assertEqual(counts(ordering='-course_count'), [('category 1', 2), ('shared', 2), ('category 0', 1)])
+        self.assertEqual(counts(), [('shared', 2), ('category 0', 1), ('category 1', 2)])
+
+
+@fast_hashing
+class CourseFacetTests(APITestCase):
+    def setUp(self):
+        reset_caches()
+        self.web = Category.objects.create(name='web')
+        self.data = Category.objects.create(name='data')
+        self.teacher = make_member('teacher', is_instructor=True).instructor
+        self.courses = []
+        for i in range(12):
+            course = Course.objects.create(name=f'course {i}', description='', price=f'{i * 7}.50', duration=i % 4 + 1)
+            course.category.add(*[category for category, on in ((self.web, i % 2), (self.data, i % 3 == 0)) if on])
+            if i < 4:
+                course.instructors.add(self.teacher)
+            self.courses.append(course)
+
+    def walk(self, **params):
+        ids, response = [], self.client.get(reverse('courses'), {'page_size': 2, **params})
+        while True:
+            self.assertEqual(response.status_code, 200, response.content)
+            ids.extend(row['id'] for row in response.data['results'])
+            if not response.data['next']:
+                return ids, response.data['facets']
+            response = self.client.get(response.data['next'])
+
+    def expected(self, queryset, *ordering):
+        return list(queryset.distinct().order_by(*ordering, 'id' if not ordering or ordering[0][0] != '-' else '-id')
+                    .values_list('id', flat=True))
+
+    def test_filters_match_the_database(self):
+        cases = [
+            ({'category': f'{self.web.id},{self.data.id}'}, Course.objects.filter(category__in=[self.web, self.data])),
+            ({'category': [self.web.id, self.data.id], 'category_match': 'all'},
+             Course.objects.filter(category=self.web).filter(category=self.data)),
+            ({'min_price': '20', 'max_price': '50.50'}, Course.objects.filter(price__gte=20, price__lte='50.50')),
+            ({'min_duration': 2, 'max_duration': 3}, Course.objects.filter(duration__range=(2, 3))),
+            ({'instructor': self.teacher.id, 'max_price': '10'},
+             Course.objects.filter(instructors=self.teacher, price__lte=10)),
+        ]
+        # both the extract-and-sort path and the walk-the-order path
+        for ratio in (0, 10 ** 6):
+            response_cache.get_backend().clear()
+            with mock.patch.object(facets, 'SPARSE_RATIO', ratio):
+                for params, queryset in cases:
+                    with self.subTest(params=params, ratio=ratio):
+                        self.assertEqual(self.walk(**params)[0], self.expected(queryset))
+                        self.assertEqual(self.walk(ordering='-price', **params)[0], self.expected(queryset, '-price'))
+                        self.assertEqual(self.walk(ordering='price', **{**params, 'min_price': '30'})[0],
+                                         self.expected(queryset.filter(price__gte=30), 'price'))
+
+    def test_named_orderings(self):
+        Enrollment.objects.create(member=make_member('student'), course=self.courses[5])
+        Course.objects.filter(pk=self.courses[2].pk).update(created_at=timezone.now() + timedelta(days=1))
+        self.assertEqual(self.walk(ordering='popularity')[0][0], self.courses[5].id)
+        self.assertEqual(self.walk(ordering='newest')[0], self.expected(Course.objects.all(), '-created_at'))
+
+    def test_facet_counts(self):
+        _, facets = self.walk(category=self.web.id, min_price='20')
+        in_range = Course.objects.filter(price__gte=20)
+        # each facet ignores its own filter
+        self.assertEqual({(facet['name'], facet['count']) for facet in facets['category']},
+                         {('web', in_range.filter(category=self.web).count()),
+                          ('data', in_range.filter(category=self.data).count())})
+        web = Course.objects.filter(category=self.web)
+        self.assertEqual([bucket['count'] for bucket in facets['price']],
+                         [web.filter(price__lt=10).count(), web.filter(price__gte=10, price__lt=25).count(),
+                          web.filter(price__gte=25, price__lt=50).count(), web.filter(price__gte=50, price__lt=100).count(),
+                          0, 0])
+        self.assertEqual((facets['price'][0]['min'], facets['price'][-1]['max']), ('0.00', None))
+
+    def test_invalid_filters(self):
+        for params in ({'category': 'web'}, {'min_price': 'cheap'}, {'category_match': 'some'}):
+            self.assertEqual(self.client.get(reverse('courses'), params).status_code, 400)
+
+
+@fast_hashing
+class AdminChangelistTests(CatalogueFixtureMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser('root', 'root@example.com', 'pass12345'))
+
+    def add_rows(self, n):
+        self.add_catalogue_rows(n)
+        for member in Member.objects.filter(preference__isnull=True):
+            Preference.objects.create(member=member).category.add(self.category, Category.objects.last())
+
+    def changelist(self, model, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(f'admin:freecs_{model}_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['cl'], ctx.captured_queries
+
+    def test_changelists_run_constant_queries(self):
+        models = ['member', 'instructor', 'category', 'course', 'enrollment', 'preference']
+        self.add_rows(2)
+        small = {model: len(self.changelist(model)[1]) for model in models}
+        self.add_rows(10)
+        self.assertEqual({model: len(self.changelist(model)[1]) for model in models}, small)
+
+    def test_annotated_columns_sort_and_filter(self):
+        self.add_rows(3)
+        cl, _ = self.changelist('instructor', o='-1')
+        self.assertEqual([obj.teacher_name for obj in cl.result_list],
+                         sorted((f'teacher{i} Test' for i in range(3)), reverse=True))
+        cl, _ = self.changelist('preference', category=self.category.id, o='3')
+        self.assertEqual(cl.result_count, Preference.objects.count())
+        self.assertEqual(len({obj.pk for obj in cl.result_list}), len(cl.result_list))
+        self.assertEqual([obj.category_total for obj in cl.result_list][0], 1)
+
+    def test_big_tables_are_counted_from_estimates(self):
+        self.add_rows(3)
+        with mock.patch.object(admin_tools, 'estimated_row_count', return_value=5000000):
+            cl, queries = self.changelist('enrollment')
+        self.assertEqual(cl.result_count, 5000000)
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])
+        with mock.patch.object(admin_tools, 'COUNT_LIMIT', 2):
+            self.assertEqual(self.changelist('course', q='python')[0].result_count, 2)
+
+    def test_estimate_from_table_statistics(self):
+        self.add_rows(3)
+        if connection.vendor == 'sqlite':
+            self.assertIsNone(admin_tools.estimated_row_count(Enrollment))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.assertEqual(admin_tools.estimated_row_count(Enrollment), 3)
+
+
+class StartupTests(SimpleTestCase):
+    def test_boot_imports_no_views(self):
+        boot, first_dispatch = importtime.boot_once()['imports']
+        modules = ['freecs.views', 'freecs.async_views']
+        # an installed token_blacklist app loads SimpleJWT while the app registry is populated
+        if not any(app.startswith('rest_framework_simplejwt') for app in settings.INSTALLED_APPS):
+            modules.append('rest_framework_simplejwt')
+        for module in modules:
+            self.assertNotIn(module, boot)
+            self.assertIn(module, first_dispatch)
+
+    def test_lazy_views_dispatch_like_eager_ones(self):
+        match = resolve(reverse('async-courses'))
+        self.assertIsInstance(match.func, lazy_views.LazyView)
+        self.assertTrue(asyncio.iscoroutinefunction(match.func))
+        self.assertFalse(asyncio.iscoroutinefunction(resolve(reverse('courses')).func))
+        self.assertTrue(resolve(reverse('login')).func.csrf_exempt)
+        self.assertEqual(match.view_name, 'async-courses')
+        self.assertEqual(lazy_views.preload(), len(lazy_views.loaded_views()))
+
+    def test_serializer_fields_built_once_per_class(self):
+        first, second = CourseSerializer(), CourseSerializer()
+        with mock.patch('rest_framework.serializers.ModelSerializer.get_fields') as build:
+            self.assertEqual(list(first.fields), list(second.fields))
+        build.assert_not_called()
+        self.assertIsNot(first.fields['category'], second.fields['category'])
+        self.assertIs(second.fields['category'].parent, second)
+
+
+@fast_hashing
+@override_settings(DATABASE_ROUTERS=['freecs.replicas.ReplicaRouter'],
+                   MIDDLEWARE=settings.MIDDLEWARE + ['freecs.replicas.StickyPrimaryMiddleware'])
+class ReplicaRoutingTests(APITransactionTestCase):
+    # a second SQLite file stands in for the replica, "replicated" with the backup API; the
+    # alias only exists once the class is set up, so it can't be named in `databases`
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        handle, cls.replica_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        connections.settings['replica'] = {**connections.settings['default'], 'NAME': cls.replica_path}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        os.remove(cls.replica_path)
+
+    def setUp(self):
+        reset_caches()
+        replicas.reset()
+        response_cache.get_backend().clear()
+        response_cache.stats.reset()
+        self.member = make_member('student')
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {get_tokens_for_user(self.member.user)["access"]}'}
+        self.old = Course.objects.create(name='python basics', description='', price='1.00', duration=1)
+        self.replicate()
+        self.new = Course.objects.create(name='python advanced', description='', price='1.00', duration=1)
+
+    def replicate(self):
+        connection.ensure_connection()
+        connections['replica'].close()
+        target = sqlite3.connect(self.replica_path)
+        connection.connection.backup(target)
+        target.close()
+
+    def search(self):
+        response = self.client.get(reverse('search'), {'q': 'python'})
+        self.assertEqual(response.status_code, 200)
+        return {course['id'] for course in json.loads(response.content)['results']}
+
+    def read_scope(self, url):
+        # CourseView and CategoryView answer from a snapshot built on the primary, so
+        # their payloads can't show where the view's read scope was opened
+        with mock.patch.object(replicas, 'reading_from', wraps=replicas.reading_from) as scope:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return scope.call_args_list[0].args[0]
+
+    def preferred(self):
+        cache.clear()  # ranked lists are cached per member
+        response = self.client.get(reverse('preferred_courses', args=[self.member.id]))
+        self.assertEqual(response.status_code, 200)
+        return [course['id'] for course in json.loads(response.content)['results']]
+
+    def add_recommendations(self):
+        CourseRecommendation.objects.create(member=self.member, course=self.old, overlap=1, score=1)
+        self.replicate()
+        CourseRecommendation.objects.create(member=self.member, course=self.new, overlap=1, score=2)
+
+    def test_reads_follow_the_scope(self):
+        with replicas.reading_from('replica'):
+            self.assertEqual(Course.objects.count(), 1)
+            with transaction.atomic():
+                self.assertEqual(Course.objects.count(), 2)
+            self.assertEqual(Course.objects.count(), 2)  # pinned once it opened a transaction
+        with replicas.reading_from('replica'):
+            Category.objects.create(name='written')
+            self.assertTrue(Category.objects.filter(name='written').exists())
+        self.assertEqual(Course.objects.count(), 2)
+        self.assertEqual(replicas.on_replica(Course.objects.all()).count(), 1)
+
+    def test_views_read_from_the_replica_until_the_client_writes(self):
+        self.assertEqual(self.search(), {self.old.id})
+        # fresh versions aren't cached from a replica
+        self.assertEqual(response_cache.stats.as_dict()['stores'], 0)
+
+        response = self.client.post(reverse('enrollment-create'), {'course': self.old.id}, format='json', **self.auth)
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(replicas.STICKY_COOKIE, response.cookies)
+        self.assertEqual(self.search(), {self.old.id, self.new.id})
+        self.assertEqual(response_cache.stats.as_dict()['stores'], 1)
+
+        self.client.cookies.clear()
+        response_cache.get_backend().clear()
+        self.assertEqual(self.search(), {self.old.id})
+
+    def test_snapshot_is_rebuilt_for_a_client_that_just_wrote(self):
+        # outside atomic a stale snapshot is normally rebuilt in the background
+        self.assertEqual(len(json.loads(self.client.get(reverse('courses')).content)['results']), 2)
+        instructor = make_member('teacher', is_instructor=True)
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {get_tokens_for_user(instructor.user)["access"]}'}
+        category = Category.objects.create(name='testing')
+        response = self.client.post(reverse('courses-create'), {'name': 'python testing', 'description': 'tests',
+                                    'category': [category.id], 'price': '1.00', 'duration': 1},
+                                    format='json', **auth)
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(replicas.STICKY_COOKIE, response.cookies)
+        with mock.patch.object(snapshot.threading, 'Thread') as thread:
+            response = self.client.get(reverse('courses'))
+        thread.assert_not_called()
+        self.assertIn('python testing', {course['name'] for course in json.loads(response.content)['results']})
+
+    def test_lagging_replica_is_skipped(self):
+        with mock.patch.object(replicas, 'replica_lag', return_value=replicas.MAX_LAG_SECONDS + 1):
+            self.assertEqual(self.search(), {self.old.id, self.new.id})
+        replicas.reset()
+        response_cache.get_backend().clear()
+        self.assertEqual(self.search(), {self.old.id})
+
+    def test_snapshot_views_read_from_the_replica_until_the_client_writes(self):
+        urls = [reverse('courses'), reverse('category')]
+        for url in urls:
+            self.assertEqual(self.read_scope(url), 'replica')
+        response = self.client.post(reverse('enrollment-create'), {'course': self.old.id}, format='json', **self.auth)
+        self.assertIn(replicas.STICKY_COOKIE, response.cookies)
+        for url in urls:
+            self.assertIsNone(self.read_scope(url))
+        self.client.cookies.clear()
+        for url in urls:
+            self.assertEqual(self.read_scope(url), 'replica')
+
+    def test_snapshot_views_skip_a_lagging_replica(self):
+        urls = [reverse('courses'), reverse('category')]
+        with mock.patch.object(replicas, 'replica_lag', return_value=replicas.MAX_LAG_SECONDS + 1):
+            for url in urls:
+                self.assertIsNone(self.read_scope(url))
+        replicas.reset()
+        for url in urls:
+            self.assertEqual(self.read_scope(url), 'replica')
+
+    def test_preferred_courses_read_from_the_replica_until_the_client_writes(self):
+        self.add_recommendations()
+        self.assertEqual(self.preferred(), [self.old.id])
+        response = self.client.post(reverse('category-add'), {'name': 'written'}, format='json', **self.auth)
+        self.assertIn(replicas.STICKY_COOKIE, response.cookies)
+        self.assertEqual(self.preferred(), [self.new.id, self.old.id])
+        self.client.cookies.clear()
+        self.assertEqual(self.preferred(), [self.old.id])
+
+    def test_preferred_courses_skip_a_lagging_replica(self):
+        self.add_recommendations()
+        with mock.patch.object(replicas, 'replica_lag', return_value=replicas.MAX_LAG_SECONDS + 1):
+            self.assertEqual(self.preferred(), [self.new.id, self.old.id])
+        replicas.reset()
+        self.assertEqual(self.preferred(), [self.old.id])
+
+
+class MemberDetailSerializer(serializers.ModelSerializer):
+    # a reverse one-to-one and a method field, which the compiled code leaves to DRF
+    instructor = InstructorSerializer(read_only=True)
+    username = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Member
+        fields = ['id', 'username', 'instructor', 'is_instructor']
+
+    def get_username(self, obj):
+        return obj.user.username.upper()
+
+
+@fast_hashing
+class CompiledSerializerTests(CatalogueFixtureMixin, APITestCase):
+    READ_SERIALIZERS = [CategorySerializer, InstructorSerializer, CourseSerializer, EnrollmentSerializer,
+                        MemberSerializer, UserProfileSerializer]
+
+    def setUp(self):
+        super().setUp()
+        self.add_catalogue_rows(3)
+        # nulls, an empty relation and a course without links
+        Instructor.objects.filter(id=Instructor.objects.order_by('id').first().id).update(
+            bio=None, experience=None, rate_per_hour=None, skills={'langs': ['py', 'sql'], 'n': 1.5})
+        Instructor.objects.exclude(bio=None).update(bio='teaches', experience=3, rate_per_hour='12.50')
+        Course.objects.create(name='solo', description='', price='0.00', duration=0)
+        # the compiled functions would read back the fragments the stock serializers cached
+        patcher = mock.patch.object(fragments, 'enabled', False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def stock(self, serializer_class):
+        model = serializer_class.Meta.model
+        instances = list(optimize_queryset(model.objects.order_by('id'), serializer_class))
+        return instances, self.render(serializer_class(instances, many=True).data)
+
+    def test_instances_match_stock_serializers(self):
+        for serializer_class in self.READ_SERIALIZERS:
+            with self.subTest(serializer_class.__name__):
+                instances, expected = self.stock(serializer_class)
+                self.assertEqual(self.render(compiled.compile_serializer(serializer_class).serialize(instances)),
+                                 expected)
+
+    def test_values_rows_match_stock_serializers(self):
+        for serializer_class in self.READ_SERIALIZERS:
+            with self.subTest(serializer_class.__name__):
+                _, expected = self.stock(serializer_class)
+                rows = compiled.compile_serializer(serializer_class).values(
+                    serializer_class.Meta.model.objects.order_by('id'), chunk_size=2)
+                self.assertEqual(self.render(list(rows)), expected)
+
+    def test_values_rows_load_relations_per_chunk(self):
+        serializer = compiled.compile_serializer(EnrollmentSerializer)
+        # the enrollments, then the categories and instructors of their courses
+        with self.assertNumQueries(3):
+            self.assertEqual(len(list(serializer.values(Enrollment.objects.all()))), 3)
+        # one enrollment query, the relations once for each chunk of two
+        with self.assertNumQueries(5):
+            list(serializer.values(Enrollment.objects.all(), chunk_size=2))
+
+    def test_unsupported_fields_fall_back_to_drf(self):
+        serializer = compiled.compile_serializer(MemberDetailSerializer)
+        instances, expected = self.stock(MemberDetailSerializer)
+        self.assertEqual(self.render(serializer.serialize(instances)), expected)
+        self.assertFalse(serializer.supports_values)
+        streamed = compiled.serialize_values(MemberDetailSerializer, Member.objects.order_by('id'))
+        self.assertEqual(self.render(list(streamed)), expected)
+        with mock.patch.object(compiled, 'COMPILED', False):
+            self.assertEqual(self.render(compiled.serialize(MemberDetailSerializer, instances)), expected)
+
+
+@fast_hashing
+@override_settings(MIDDLEWARE=['freecs.compression.CompressionMiddleware', *settings.MIDDLEWARE])
+class RenderingCompressionTests(CatalogueFixtureMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        compression.bodies.clear()
+        instrumentation.reset()
+        self.add_catalogue_rows(12)
+
+    def test_fast_renderer_matches_drf(self):
+        payload = self.client.get(reverse('courses')).data
+        payload['extra'] = {'when': timezone.now(), 'price': Decimal('1.50'), 'text': 'a\u2028b \u00e9', 1: None}
+        expected = JSONRenderer().render(payload)
+        for encoder in ('json', 'orjson'):
+            with self.subTest(encoder):
+                if encoder == 'orjson' and rendering.orjson is None:
+                    continue
+                self.assertEqual(rendering.dumps(payload, encoder), expected)
+        self.assertEqual(rendering.FastJSONRenderer().render(payload), expected)
+        # pretty printing is left to DRF
+        self.assertIn(b'\n', rendering.FastJSONRenderer().render(payload, 'application/json; indent=2'))
+
+    def test_negotiation(self):
+        levels = {'zstd': 3, 'br': 4, 'gzip': 6}
+        self.assertEqual(compression.negotiate('gzip, deflate, br, zstd', levels), 'zstd')
+        self.assertEqual(compression.negotiate('zstd;q=0.5, gzip', levels), 'gzip')
+        self.assertEqual(compression.negotiate('*;q=0.1, zstd;q=0', {'zstd': 3, 'gzip': 6}), 'gzip')
+        self.assertIsNone(compression.negotiate('gzip;q=0, identity', levels))
+        self.assertIsNone(compression.negotiate('', levels))
+
+    def test_large_responses_are_compressed(self):
+        plain = self.client.get(reverse('courses'))
+        response = self.client.get(reverse('courses'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertLess(len(response.content), len(plain.content) // 3)
+
+        # the ETag is weak now and still revalidates
+        self.assertTrue(response['ETag'].startswith('W/'))
+        revalidated = self.client.get(reverse('courses'), HTTP_ACCEPT_ENCODING='gzip',
+                                      HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+
+        metrics = instrumentation.render()
+        self.assertIn('freecs_compression_saved_bytes_total{route="courses",encoding="gzip"}', metrics)
+        self.assertIn('freecs_render_seconds_count{route="courses",encoder="', metrics)
+
+    def test_small_refused_and_disabled_routes_stay_plain(self):
+        small = self.client.get(reverse('category'), {'page_size': 1}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertLess(len(small.content), compression.MIN_SIZE)
+        self.assertFalse(small.has_header('Content-Encoding'))
+        refused = self.client.get(reverse('courses'), HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(refused.has_header('Content-Encoding'))
+        with mock.patch.object(compression, 'ROUTES', {'courses': None}):
+            disabled = self.client.get(reverse('courses'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(disabled.has_header('Content-Encoding'))
+        with mock.patch.object(compression, 'ROUTES', {'courses': {'gzip': 1}}):
+            fast = self.client.get(reverse('courses'), {'ordering': 'name'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(fast['Content-Encoding'], 'gzip')
+
+    def test_streams_are_compressed_chunk_by_chunk(self):
+        plain = b''.join(self.client.get(reverse('enrollment'), {'stream': 'ndjson'}).streaming_content)
+        response = self.client.get(reverse('enrollment'), {'stream': 'ndjson'}, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+        self.assertIn('freecs_compression_input_bytes_total{route="enrollment",encoding="gzip"} '
+                      f'{len(plain)}', instrumentation.render())
+
+
+@fast_hashing
+class InstructorSkillSearchTests(APITestCase):
+    def setUp(self):
+        reset_caches()
+        response_cache.get_backend().clear()
+        self.instructors = []
+        skill_sets = [['Python', 'SQL'], ['python'], ['Rust', 'python'], ['sql'], ['Web  Design'], ['rust', 'sql']]
+        for i, names in enumerate(skill_sets):
+            instructor = make_member(f'teacher{i}', is_instructor=True).instructor
+            instructor.skills = {'langs': names}
+            instructor.experience = [5, None, 12, 3, 8, 5][i]
+            instructor.rate_per_hour = [Decimal('40.00'), Decimal('25.00'), None, Decimal('60.00'),
+                                        Decimal('30.00'), Decimal('45.00')][i]
+            instructor.save()
+            self.instructors.append(instructor)
+
+    def counts(self):
+        return dict(Skill.objects.values_list('name', 'instructor_count'))
+
+    def expected(self, names, match='any', **ranges):
+        names = set(names)
+        rows = []
+        for instructor in Instructor.objects.all():
+            have = {' '.join(name.lower().split()) for name in instructor.skills['langs']}
+            matched = have >= names if match == 'all' else bool(have & names)
+            experience = instructor.experience or 0
+            rate = instructor.rate_per_hour
+            if (not matched or experience < ranges.get('min_experience', experience)
+                    or experience > ranges.get('max_experience', experience)
+                    or ('min_rate' in ranges and (rate is None or rate < ranges['min_rate']))
+                    or ('max_rate' in ranges and (rate is None or rate > ranges['max_rate']))):
+                continue
+            rows.append((-experience, instructor.id))
+        return [instructor_id for _, instructor_id in sorted(rows)]
+
+    def walk(self, **params):
+        ids, response = [], self.client.get(reverse('instructor-search'), {'page_size': 2, **params})
+        while True:
+            self.assertEqual(response.status_code, 200, response.content)
+            ids.extend(row['id'] for row in response.data['results'])
+            if not response.data['next']:
+                return ids
+            response = self.client.get(response.data['next'])
+
+    def test_skills_are_normalized(self):
+        self.assertEqual(self.counts(), {'python': 3, 'sql': 3, 'rust': 2, 'web design': 1})
+        link = InstructorSkill.objects.get(instructor=self.instructors[1])
+        self.assertEqual((link.skill.name, link.experience, link.rate_per_hour), ('python', 0, Decimal('25.00')))
+
+    def test_search_matches_the_instructors(self):
+        cases = [
+            ({'skills': 'python'}, (['python'],)),
+            ({'skills': ' PYTHON ,Rust'}, (['python', 'rust'],)),
+            ({'skills': ['python', 'sql'], 'skill_match': 'all'}, (['python', 'sql'], 'all')),
+            ({'skills': 'python,sql,rust', 'min_experience': 4, 'max_experience': 10},
+             (['python', 'sql', 'rust'], 'any'), {'min_experience': 4, 'max_experience': 10}),
+            ({'skills': 'sql,rust', 'min_rate': '41', 'max_rate': '60'}, (['sql', 'rust'],),
+             {'min_rate': Decimal('41'), 'max_rate': Decimal('60')}),
+            ({'skills': 'web design'}, (['web design'],)),
+            ({'skills': 'python,cobol', 'skill_match': 'all'}, (['python', 'cobol'], 'all')),
+            ({'skills': 'cobol'}, (['cobol'],)),
+        ]
+        for params, args, *ranges in cases:
+            with self.subTest(params=params):
+                expected = self.expected(*args, **(ranges[0] if ranges else {}))
+                self.assertEqual(self.walk(**params), expected)
+        # experience, then id among equals
+        self.assertEqual(self.walk(skills='python,sql')[:3], [self.instructors[2].id, self.instructors[0].id,
+                                                             self.instructors[5].id])
+
+    def test_index_follows_instructor_changes(self):
+        teacher = self.instructors[3]
+        teacher.skills = {'langs': ['go', 'python']}
+        teacher.experience = 20
+        teacher.save()
+        self.assertEqual(self.counts(), {'python': 4, 'sql': 2, 'rust': 2, 'web design': 1, 'go': 1})
+        self.assertEqual(search_instructor_ids(['python'], limit=1), ([teacher.id], True))
+
+        self.instructors[2].member.user.delete()
+        self.assertEqual(self.counts()['rust'], 1)
+        self.assertEqual(self.walk(skills='rust'), [self.instructors[5].id])
+
+        counts = self.counts()
+        InstructorSkill.objects.all().delete()
+        rebuild_skill_index()
+        self.assertEqual(self.counts(), counts)
+
+    def test_update_view_keeps_the_index(self):
+        teacher = self.instructors[4]
+        response = self.client.put(reverse('instructor-update', args=[teacher.id]),
+                                   {'skills': {'langs': ['Rust']}, 'bio': '', 'experience': 30, 'rate_per_hour': '50.00'},
+                                   format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.walk(skills='rust')[0], teacher.id)
+        self.assertEqual(self.walk(skills='web design'), [])
+
+    def test_invalid_parameters(self):
+        for params in ({}, {'skills': ''}, {'skills': 'python', 'skill_match': 'some'},
+                       {'skills': 'python', 'min_rate': 'cheap'}):
+            self.assertEqual(self.client.get(reverse('instructor-search'), params).status_code, 400)
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def setUp(self):
+        pooling.close_pools()
+        instrumentation.reset()
+        handle, self.path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+        self.addCleanup(pooling.close_pools)
+
+    def wrapper(self, **settings_dict):
+        settings_dict = connections.configure_settings({'default': {
+            'ENGINE': 'freecs.backends.sqlite3', 'NAME': self.path, **settings_dict}})['default']
+        return load_backend(settings_dict['ENGINE']).DatabaseWrapper(settings_dict, 'pooled')
+
+    def configure(self, **config):
+        patcher = mock.patch.dict(pooling._config, config)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_connections_are_reused(self):
+        first = self.wrapper()
+        first.ensure_connection()
+        raw = first.connection
+        first.close()
+        self.assertEqual(pooling.pool_stats()['pooled'], {'size': 1, 'idle': 1, 'in_use': 0, 'waiting': 0,
+                                                          'max_size': 10})
+        second = self.wrapper()
+        with second.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            self.assertEqual(cursor.fetchone(), (1,))
+        self.assertIs(second.connection, raw)
+        second.close()
+        self.assertIn('freecs_db_pool_idle{alias="pooled"} 1', instrumentation.render())
+        self.assertIn('freecs_db_pool_connections_opened_total{alias="pooled"} 1', instrumentation.render())
+
+    def test_pool_is_bounded(self):
+        self.configure(MAX_SIZE=1, TIMEOUT=0.05)
+        holder = self.wrapper()
+        holder.ensure_connection()
+        with self.assertRaises(OperationalError):
+            self.wrapper().ensure_connection()
+        self.assertIn('freecs_db_pool_timeouts_total{alias="pooled"} 1', instrumentation.render())
+        holder.close()
+
+        pooling.close_pools()
+        self.configure(MAX_SIZE=2, TIMEOUT=5)
+        seen, errors = set(), []
+
+        def work():
+            try:
+                for _ in range(20):
+                    wrapper = self.wrapper()
+                    with wrapper.cursor() as cursor:
+                        cursor.execute('SELECT 1')
+                    seen.add(id(wrapper.connection))
+                    wrapper.close()
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(seen), 2)
+        self.assertEqual(pooling.pool_stats()['pooled']['size'], len(seen))
+
+    def test_old_and_broken_connections_are_replaced(self):
+        wrapper = self.wrapper()
+        wrapper.ensure_connection()
+        wrapper._pooled.created -= pooling.pool_settings('pooled')['MAX_AGE'] + 1
+        wrapper.close()
+        self.assertEqual(pooling.pool_stats()['pooled']['size'], 0)
+
+        wrapper.ensure_connection()
+        broken = wrapper.connection
+        pooled = wrapper._pooled
+        wrapper.close()
+        broken.close()
+        pooled.released -= pooling.pool_settings('pooled')['CHECK_AFTER'] + 1
+        wrapper.ensure_connection()
+        self.assertIsNot(wrapper.connection, broken)
+        wrapper.close()
+        rendered = instrumentation.render()
+        self.assertIn('freecs_db_pool_connections_closed_total{alias="pooled",reason="age"} 1', rendered)
+        self.assertIn('freecs_db_pool_connections_closed_total{alias="pooled",reason="unusable"} 1', rendered)
+
+    def test_open_transaction_is_rolled_back(self):
+        wrapper = self.wrapper()
+        with wrapper.cursor() as cursor:
+            cursor.execute('CREATE TABLE t (n integer)')
+        wrapper.set_autocommit(False)
+        with wrapper.cursor() as cursor:
+            cursor.execute('INSERT INTO t VALUES (1)')
+        wrapper.close()
+
+        other = self.wrapper()
+        with other.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM t')
+            self.assertEqual(cursor.fetchone(), (0,))
+        self.assertTrue(other.get_autocommit())
+        other.close()
+
+    def test_persistent_connections_are_refused(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.wrapper(CONN_MAX_AGE=60)
+
+    def test_postgresql_uses_the_native_pool(self):
+        self.configure(MAX_SIZE=4, MAX_IDLE=None, DATABASES={'pooled': {'TIMEOUT': 2}})
+        self.assertEqual(pooling.psycopg_pool_options('pooled'), {
+            'name': 'pooled', 'min_size': 1, 'max_size': 4, 'timeout': 2, 'max_lifetime': 600})
+
+        native = mock.Mock(max_size=4, **{'get_stats.return_value': {'pool_size': 3, 'pool_available': 1}})
+        with mock.patch.dict(pooling._native_pools, {'primary': native}):
+            self.assertEqual(pooling.pool_stats()['primary'], {'size': 3, 'idle': 1, 'in_use': 2, 'waiting': 0,
+                                                               'max_size': 4})
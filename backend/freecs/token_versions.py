@@ -0,0 +1,40 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.utils.crypto import salted_hmac
+
+# Token versions for ClaimsJWTAuthentication (see authentication.py): a short
+# HMAC of the password hash, cached per user. The cached copy expires after
+# FREECS_AUTH = {'VERSION_CACHE_SECONDS': 300}, which bounds how long a
+# worker with a process-local cache can accept a revoked token. Kept apart
+# from authentication.py so signals.py doesn't pull SimpleJWT in at startup.
+
+VERSION_CLAIM = 'tv'
+VERSION_CACHE_SECONDS = getattr(settings, 'FREECS_AUTH', {}).get('VERSION_CACHE_SECONDS', 300)
+
+
+def token_version(password_hash):
+    return salted_hmac('freecs.authentication.token-version', password_hash).hexdigest()[:16]
+
+
+def _version_key(user_id):
+    return f'freecs:auth:token-version:{user_id}'
+
+
+def remember_token_version(user):
+    # inactive users get a version no token carries
+    version = token_version(user.password) if user.is_active else ''
+    cache.set(_version_key(user.pk), version, VERSION_CACHE_SECONDS)
+
+
+def forget_token_version(user_id):
+    cache.delete(_version_key(user_id))
+
+
+def current_token_version(user_id):
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        row = User.objects.filter(pk=user_id).values_list('password', 'is_active').first()
+        version = token_version(row[0]) if row and row[1] else ''
+        cache.set(_version_key(user_id), version, VERSION_CACHE_SECONDS)
+    return version
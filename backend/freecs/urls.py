@@ -1,23 +1,38 @@
-from django.urls import path
-from .views import CategoryCreateView, CategoryView, CourseCreateView, CourseView, EnrollmentCreateView, EnrollmentListView, InstructorListView, InstructorUpdateView, LoginView, PreferredCoursesView, PreferenceCreateView, SignUpView, UserProfileView,UserChangePasswordView,SendPasswordRestEmailView,UserRestPasswordEmailView,SearchView
+from .lazy_views import lazy_path
+
+# views are imported on first dispatch, see lazy_views.py
 
 urlpatterns = [
-    path('signup/', SignUpView.as_view(), name='signup'),
-    path('login/', LoginView.as_view(), name='login'),
-    path('profile/',UserProfileView.as_view(),name='profile'),
-    path('changepassword/', UserChangePasswordView.as_view(),name='changepassword'),
-    path('send-reset/',SendPasswordRestEmailView.as_view(),name='sendpassword'),
-    path('send-reset/<uid>/<token>/',UserRestPasswordEmailView.as_view(),name='sendpassword'),
-    path('instructors/', InstructorListView.as_view(), name='instructor-list'),
-    path('instructors/<int:instructor_id>/update/', InstructorUpdateView.as_view(), name='instructor-update'),
-    path('category/',CategoryView.as_view(),name='category'),
-    path('category/add',CategoryCreateView.as_view(),name='category-add'),
-    path('courses/',CourseView.as_view(),name='courses'),
-    path('courses/add',CourseCreateView.as_view(),name='courses-create'),
-    path('enrollment/',EnrollmentListView.as_view(),name='enrollment'),
-    path('enrollment/add',EnrollmentCreateView.as_view(),name='enrollment-create'),
-    path('preferences/add',PreferenceCreateView.as_view(),name='preferences-create'),
-    path('preferred-courses/<int:member_id>/', PreferredCoursesView.as_view(), name='preferred_courses'),
-    path('search/',SearchView.as_view(),name='search'),
+    lazy_path('signup/', 'freecs.views.SignUpView', name='signup'),
+    lazy_path('login/', 'freecs.views.LoginView', name='login'),
+    lazy_path('profile/', 'freecs.views.UserProfileView',name='profile'),
+    lazy_path('changepassword/', 'freecs.views.UserChangePasswordView',name='changepassword'),
+    lazy_path('send-reset/', 'freecs.views.SendPasswordRestEmailView',name='sendpassword'),
+    lazy_path('send-reset/<uid>/<token>/', 'freecs.views.UserRestPasswordEmailView',name='sendpassword'),
+    lazy_path('instructors/', 'freecs.views.InstructorListView', name='instructor-list'),
+    lazy_path('instructors/search/', 'freecs.views.InstructorSearchView', name='instructor-search'),
+    lazy_path('instructors/<int:instructor_id>/update/', 'freecs.views.InstructorUpdateView', name='instructor-update'),
+    lazy_path('category/', 'freecs.views.CategoryView',name='category'),
+    lazy_path('category/add', 'freecs.views.CategoryCreateView',name='category-add'),
+    lazy_path('courses/', 'freecs.views.CourseView',name='courses'),
+    lazy_path('courses/add', 'freecs.views.CourseCreateView',name='courses-create'),
+    lazy_path('courses/bulk', 'freecs.views.CourseBulkImportView',name='courses-bulk'),
+    lazy_path('enrollment/', 'freecs.views.EnrollmentListView',name='enrollment'),
+    lazy_path('enrollment/add', 'freecs.views.EnrollmentCreateView',name='enrollment-create'),
+    lazy_path('enrollment/bulk', 'freecs.views.EnrollmentBulkImportView',name='enrollment-bulk'),
+    lazy_path('enrollment/export/<str:export_format>/', 'freecs.views.EnrollmentExportView',name='enrollment-export'),
+    lazy_path('preferences/add', 'freecs.views.PreferenceCreateView',name='preferences-create'),
+    lazy_path('preferred-courses/<int:member_id>/', 'freecs.views.PreferredCoursesView', name='preferred_courses'),
+    lazy_path('search/', 'freecs.views.SearchView',name='search'),
+    lazy_path('cache-stats/', 'freecs.views.ResponseCacheStatsView',name='cache-stats'),
+    lazy_path('metrics/', 'freecs.instrumentation.metrics_view',name='metrics'),
+
+    # async versions for ASGI deployments
+    lazy_path('async/profile/', 'freecs.async_views.AsyncUserProfileView',name='async-profile'),
+    lazy_path('async/category/', 'freecs.async_views.AsyncCategoryView',name='async-category'),
+    lazy_path('async/courses/', 'freecs.async_views.AsyncCourseView',name='async-courses'),
+    lazy_path('async/preferences/add', 'freecs.async_views.AsyncPreferenceCreateView',name='async-preferences-create'),
+    lazy_path('async/preferred-courses/<int:member_id>/', 'freecs.async_views.AsyncPreferredCoursesView',name='async-preferred-courses'),
+    lazy_path('async/search/', 'freecs.async_views.AsyncSearchView',name='async-search'),
     
 ]
@@ -2,20 +2,48 @@ from django import forms
 from rest_framework import status,generics
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.exceptions import ValidationError
 from django.db import IntegrityError, DatabaseError
+from django.http import StreamingHttpResponse
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Q
-from .models import Course, Enrollment, Instructor,Category, Member,Preference
+from .models import Course, Enrollment, Instructor
 from .serializers import CategorySerializer, CourseCreateUpdateSerializer, CourseSerializer, EnrollmentCreateSerializer, EnrollmentSerializer, InstructorSerializer, InstructorUpdateSerializer, MemberSerializer, PreferenceCreateSerializer, ResetPasswordSerializer, SendPasswordResetEmailSerialize, UserLoginSerializer, UserProfileSerializer,UserChangePasswordSerializer
-from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework.permissions import IsAuthenticated
-from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from .pagination import KeysetPagination, RankedPagination
+from .recommendations import recommended_course_ids
+from .replicas import ReplicaReadMixin, on_replica
+from .response_cache import CachedResponseMixin
+from .snapshot import SnapshotMixin, get_snapshot
+from .facets import COURSE_SORT_KEYS, ORDERING_ALIASES, CourseFilter
+from . import response_cache
+from .search import search_course_ids
+from .skills import InstructorSearchSerializer, search_instructor_ids
+from .importer import IMPORTERS, CSVParser, parse_csv
+from .streaming import CHUNK_SIZE, STREAM_FORMATS, csv_rows, serialized_rows, streaming_response
+from .query_plan import optimize_queryset
+from .compiled import serialize
+from .authentication import ClaimsJWTAuthentication, member_claims, token_claims
+from .login import authenticate_login
+from .rendering import FastJSONRenderer
+from . import enrollments
+from rest_framework.settings import api_settings
+
+
+# bearer tokens resolve to a claims-only principal, other schemes still work
+CLAIMS_AUTHENTICATION = [ClaimsJWTAuthentication, *api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+# the default renderers with JSON encoded by rendering.py, for views serving large payloads
+FAST_RENDERERS = [FastJSONRenderer if renderer is JSONRenderer else renderer
+                  for renderer in api_settings.DEFAULT_RENDERER_CLASSES]
 
 
 def get_tokens_for_user(user):
     refresh = RefreshToken.for_user(user)
+    # copied into the access token, see authentication.py
+    for claim, value in token_claims(user).items():
+        refresh[claim] = value
 
     return {
         'refresh': str(refresh),
@@ -23,6 +51,24 @@ def get_tokens_for_user(user):
     }
 
 
+def stream_list(queryset, serializer_class, stream_format):
+    # ?stream=json|ndjson returns the whole list as a streamed body instead of a page
+    if stream_format not in STREAM_FORMATS:
+        return Response({"error": "stream must be json or ndjson."}, status=status.HTTP_400_BAD_REQUEST)
+    return streaming_response(serialized_rows(queryset, serializer_class), stream_format)
+
+
+def ranked_courses(course_ids, snapshot=None):
+    # course payloads for a ranked id list, in ranking order. They come from the
+    # catalogue snapshot, courses newer than the snapshot from the database.
+    payloads = (snapshot or get_snapshot()).course_payloads_by_id(course_ids)
+    missing = [course_id for course_id in course_ids if course_id not in payloads]
+    if missing:
+        courses = list(optimize_queryset(Course.objects.filter(id__in=missing), CourseSerializer))
+        payloads.update(zip([course.id for course in courses], serialize(CourseSerializer, courses)))
+    return [payloads[course_id] for course_id in course_ids if course_id in payloads]
+
+
 class SignUpView(generics.CreateAPIView):
     def post(self, request):
         try:
@@ -47,14 +93,37 @@ class SignUpView(generics.CreateAPIView):
 
 
 #instructor list view 
-class InstructorListView(APIView):
+class InstructorListView(CachedResponseMixin, APIView):
+    renderer_classes = FAST_RENDERERS
+    cache_scopes = ['instructors']
+
     def get(self ,request):
-        instructors = Instructor.objects.all()
-        serializer = InstructorSerializer(instructors, many=True)
-     
-        return Response({"data":serializer.data}, status=status.HTTP_200_OK)
+        instructors = optimize_queryset(Instructor.objects.all(), InstructorSerializer)
+        stream_format = request.query_params.get('stream')
+        if stream_format:
+            return stream_list(instructors.order_by('id'), InstructorSerializer, stream_format)
+        paginator = KeysetPagination()
+        result_page = paginator.paginate_queryset(instructors, request)
+        return paginator.get_paginated_response(serialize(InstructorSerializer, result_page))
     
     
+class InstructorSearchView(ReplicaReadMixin, CachedResponseMixin, APIView):
+    renderer_classes = FAST_RENDERERS
+    cache_scopes = ['instructors']
+
+    def get(self, request):
+        filters = InstructorSearchSerializer(data=request.query_params)
+        filters.is_valid(raise_exception=True)
+        paginator = RankedPagination()
+        instructor_ids = paginator.paginate_ranked(
+            lambda offset, limit: search_instructor_ids(offset=offset, limit=limit, **filters.validated_data),
+            request)
+        instructors = optimize_queryset(Instructor.objects.filter(id__in=instructor_ids), InstructorSerializer)
+        by_id = {instructor.id: instructor for instructor in instructors}
+        ranked = [by_id[instructor_id] for instructor_id in instructor_ids if instructor_id in by_id]
+        return paginator.get_paginated_response(serialize(InstructorSerializer, ranked))
+
+
 #updating Instructor view
 class InstructorUpdateView(APIView):
     
@@ -70,81 +139,76 @@ class InstructorUpdateView(APIView):
  
 
 #show categories
-class CategoryView(APIView):
+class CategoryView(ReplicaReadMixin, SnapshotMixin, CachedResponseMixin, APIView):
+    renderer_classes = FAST_RENDERERS
+    cache_scopes = ['categories']
+
     def get(self, request, *args, **kwargs):
-        categories = Category.objects.all()
-        serializer = CategorySerializer(categories, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        snapshot = self.get_snapshot()
+        paginator = KeysetPagination(sort_keys=['name', 'course_count'])
+        result_page = paginator.paginate_sorted(snapshot.categories, request)
+        return paginator.get_paginated_response(snapshot.category_payloads(result_page))
 #create category view
 class CategoryCreateView(generics.CreateAPIView):
     
     serializer_class = CategorySerializer
     
 class PreferenceCreateView(APIView):
+    authentication_classes = CLAIMS_AUTHENTICATION
     permission_classes = [IsAuthenticated]
 
     def post(self, request, format=None):
-        user = request.user
-
         # Validate that the user is a member
-        try:
-            member = Member.objects.get(user=user)
-            print(member.id)
-            
-        except Member.DoesNotExist:
+        member_id, _, _ = member_claims(request.user)
+        if member_id is None:
             return Response({"error": "User must be a member to create preferences."}, status=status.HTTP_400_BAD_REQUEST)
 
         # Include member in the request data
         data = request.data.copy()
-        data['member'] = member.id
-        print(data)
+        data['member'] = member_id
 
         serializer = PreferenceCreateSerializer(data=data)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-class PreferredCoursesView(APIView):
+class PreferredCoursesView(ReplicaReadMixin, SnapshotMixin, APIView):
+    renderer_classes = FAST_RENDERERS
     def get(self, request, member_id, format=None):
+        paginator = RankedPagination()
+        course_ids = paginator.paginate_ranked(
+            lambda offset, limit: recommended_course_ids(member_id, offset=offset, limit=limit), request)
+        return paginator.get_paginated_response(ranked_courses(course_ids, self.get_snapshot()))
 
-        preferences_categories = Preference.objects.filter(member__id=member_id).values('category')
-        courses=Course.objects.filter(category__in = preferences_categories).distinct()
-
-        serializer= CourseSerializer(courses, many=True)
-        return Response(serializer.data, 200)
+class SearchView(ReplicaReadMixin, SnapshotMixin, CachedResponseMixin, APIView):
+    renderer_classes = FAST_RENDERERS
+    cache_scopes = ['courses']
 
-class SearchView(APIView):
     def get(self, request,format=None):
-        if (request.data.get('search_text')==''):
-            return Response(404)
-        else:
-             courses = Course.objects.filter(Q(name__iregex=request.data.get('search_text'))| Q(category__name__iregex=request.data.get('search_text')))
-             instructors = Instructor.objects.filter(skills__iregex=request.data.get('search_text'))
-             
-             course_serializer = CourseSerializer(courses, many=True)
-             
-            
-             return Response({"Courses":course_serializer.data,}, 200)
+        search_text = request.query_params.get('q', '').strip()
+        if not search_text:
+            return Response({"error": "Query parameter 'q' is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = RankedPagination()
+        course_ids = paginator.paginate_ranked(
+            lambda offset, limit: search_course_ids(search_text, offset=offset, limit=limit), request)
+        return paginator.get_paginated_response(ranked_courses(course_ids, self.get_snapshot()))
     
 
 #course create         
 
 class CourseCreateView(APIView):
+    authentication_classes = CLAIMS_AUTHENTICATION
     permission_classes = [IsAuthenticated]
     def post(self, request, format=None):
-        user = request.user
-        
-        try:
-            member = Member.objects.get(user=user)
-            instructor = Instructor.objects.get(member=member)
-            if not member.is_instructor:
-                return ValidationError("Only instructors can create courses.")
-        except Member.DoesNotExist:
-            return ValidationError("User must be a member to create courses.")
+        member_id, instructor_id, is_instructor = member_claims(request.user)
+        if member_id is None:
+            raise ValidationError("User must be a member to create courses.")
+        if not is_instructor or instructor_id is None:
+            raise ValidationError("Only instructors can create courses.")
         data = request.data.copy()
 
-        data['instructors'] = [instructor.id]
-        print(data)
+        data['instructors'] = [instructor_id]
         serializer = CourseCreateUpdateSerializer(data=data)
         if serializer.is_valid():
             serializer.save()
@@ -153,26 +217,81 @@ class CourseCreateView(APIView):
 
 
 
-class CourseView(APIView):
+class CourseView(ReplicaReadMixin, SnapshotMixin, CachedResponseMixin, APIView):
+    renderer_classes = FAST_RENDERERS
+    cache_scopes = ['courses']
+
     def get(self, request, *args, **kwargs):
-        courses = Course.objects.all()
-        paginator = LimitOffsetPagination()
-        result_page = paginator.paginate_queryset(courses, request)
-        serializer = CourseSerializer(result_page, many=True)
-        return paginator.get_paginated_response(serializer.data)
+        # ?category=1,2&category_match=all&instructor=3&min_price=&max_price=&min_duration=&max_duration=
+        course_filter = CourseFilter.from_request(request)
+        snapshot = self.get_snapshot()
+        masks = course_filter.masks(snapshot.courses)
+        paginator = KeysetPagination(sort_keys=COURSE_SORT_KEYS, aliases=ORDERING_ALIASES)
+        result_page = paginator.paginate_sorted(course_filter.select(snapshot.courses, masks), request)
+        response = paginator.get_paginated_response(snapshot.course_payloads(result_page))
+        response.data['facets'] = course_filter.facets(snapshot, masks)
+        return response
 
 
 
 class EnrollmentListView(APIView):
+    renderer_classes = FAST_RENDERERS
     def get(self, request, *args, **kwargs):
-        enrollments = Enrollment.objects.all()
-        serializer = EnrollmentSerializer(enrollments, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        enrollments = optimize_queryset(Enrollment.objects.all(), EnrollmentSerializer)
+        stream_format = request.query_params.get('stream')
+        if stream_format:
+            return stream_list(enrollments.order_by('id'), EnrollmentSerializer, stream_format)
+        paginator = KeysetPagination(sort_keys=['enrollment_date'])
+        result_page = paginator.paginate_queryset(enrollments, request)
+        return paginator.get_paginated_response(serialize(EnrollmentSerializer, result_page))
+
+
+#full enrollment report for admins, one flat row per enrollment
+class EnrollmentExportView(APIView):
+    permission_classes = [IsAdminUser]
+    columns = ['id', 'enrollment_date', 'member_id', 'member__user__username', 'member__user__email',
+               'course_id', 'course__name', 'course__price']
+
+    def get(self, request, export_format, format=None):
+        # streamed after the view returns, so the replica is picked here rather than by a read scope
+        rows = (on_replica(Enrollment.objects.order_by('id'), request).values_list(*self.columns)
+                .iterator(chunk_size=CHUNK_SIZE))
+        if export_format == 'csv':
+            response = StreamingHttpResponse(csv_rows(self.columns, rows), content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="enrollments.csv"'
+            return response
+        if export_format == 'ndjson':
+            return streaming_response((dict(zip(self.columns, row)) for row in rows), 'ndjson',
+                                      filename='enrollments.ndjson')
+        return Response({"error": "Export format must be csv or ndjson."}, status=status.HTTP_400_BAD_REQUEST)
+
 #enrollment create 
 
-class EnrollmentCreateView(generics.CreateAPIView):
+class EnrollmentCreateView(APIView):
+    authentication_classes = CLAIMS_AUTHENTICATION
+    permission_classes = [IsAuthenticated]
 
-    serializer_class = EnrollmentCreateSerializer
+    def post(self, request, format=None):
+        member_id, _, _ = member_claims(request.user)
+        if member_id is None:
+            return Response({"error": "User must be a member to enroll."}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = EnrollmentCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        course_ids = serializer.validated_data['courses']
+
+        statuses = enrollments.enroll([(member_id, course_id) for course_id in course_ids])
+        results = [{'course': course_id, 'status': statuses[(member_id, course_id)]} for course_id in course_ids]
+        outcomes = {result['status'] for result in results}
+        # repeating an enrollment is fine, it just doesn't create anything
+        if enrollments.CREATED in outcomes:
+            response_status = status.HTTP_201_CREATED
+        elif enrollments.EXISTING in outcomes:
+            response_status = status.HTTP_200_OK
+        elif enrollments.FULL in outcomes:
+            response_status = status.HTTP_409_CONFLICT
+        else:
+            response_status = status.HTTP_404_NOT_FOUND
+        return Response({'results': results}, status=response_status)
 
 
 
@@ -182,20 +301,18 @@ class LoginView(APIView):
         if serializer.is_valid():
             username = serializer.validated_data.get('username')
             password = serializer.validated_data.get('password')
-            print(f"Attempting to authenticate user: {username}")  # Debug print
-            
-            user = authenticate(username=username, password=password)
+            # rate limited, hashed in the login pool, may raise Throttled or LoginBusy
+            user = authenticate_login(request, username, password)
             
             if user is not None:
                 token =  get_tokens_for_user(user)
-                print("Authentication successful")  # Debug print
                 return Response({'msg': 'Login successful',"token":token}, status=status.HTTP_200_OK)
             else:
-                print("Authentication failed")  # Debug print
                 return Response({'errors': {'non_field_errors': ['Username or password not valid']}}, status=status.HTTP_400_BAD_REQUEST)
         return Response({'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
 class UserProfileView(APIView):
+    authentication_classes = CLAIMS_AUTHENTICATION
     permission_classes=[IsAuthenticated]
     def get(self, request, format=None):
         serializer = UserProfileSerializer(request.user)
@@ -203,12 +320,16 @@ class UserProfileView(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
         
 class UserChangePasswordView(APIView):
+    authentication_classes = CLAIMS_AUTHENTICATION
     permission_classes = [IsAuthenticated]
 
     def post(self, request, format=None):
         serializer = UserChangePasswordSerializer(data=request.data, context={'user': request.user})
         if serializer.is_valid(raise_exception=True):
-            return Response({'msg': 'Password changed successfully', "data": serializer.data}, status=status.HTTP_200_OK)
+            # the new password revokes every earlier token, including this one
+            token = get_tokens_for_user(request.user)
+            return Response({'msg': 'Password changed successfully', "data": serializer.data, "token": token},
+                            status=status.HTTP_200_OK)
         
         return Response({'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
     
@@ -229,5 +350,41 @@ class UserRestPasswordEmailView(APIView):
             if serializers.is_valid(raise_exception=True):
                 return Response({'msg': 'Password reset successful'}, status=status.HTTP_200_OK)
             
-            return Response({'errors': serializers.errors}, status=status.HTTP_400_BAD_REQUEST) 
-        
\ No newline at end of file
+            return Response({'errors': serializers.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+
+#cache counters for monitoring
+class ResponseCacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, format=None):
+        return Response(response_cache.stats.as_dict(), status=status.HTTP_200_OK)
+
+
+#bulk imports, per-row errors are reported without rejecting the batch
+class BulkImportView(APIView):
+    permission_classes = [IsAdminUser]
+    parser_classes = [JSONParser, CSVParser, MultiPartParser]
+    kind = None
+
+    def post(self, request, format=None):
+        rows = request.data
+        if 'file' in request.FILES:
+            rows = parse_csv(request.FILES['file'].read().decode('utf-8-sig'))
+        result = IMPORTERS[self.kind](rows)
+        if result.created:
+            response_status = status.HTTP_201_CREATED
+        elif result.errors:
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            # every row was already there
+            response_status = status.HTTP_200_OK
+        return Response(result.as_dict(), status=response_status)
+
+
+class CourseBulkImportView(BulkImportView):
+    kind = 'courses'
+
+
+class EnrollmentBulkImportView(BulkImportView):
+    kind = 'enrollments'